@@ -0,0 +1,221 @@
+"""CPU stand-ins for the ``LLM`` and ``Embeddings`` engines, for load testing the API gateway without GPUs.
+
+Both services expose the same BentoML endpoints and OpenAI-compatible routes as the real engines, so the gateway
+talks to them unchanged with ``DEVELOPMENT=1``. Output is deterministic, and timings are set through the env:
+
+| environment variables   | defaults | notes                                         |
+| ----------------------- | -------- | --------------------------------------------- |
+| `FAKE_TTFT_MS`          | 200      | Time to first token for every completion      |
+| `FAKE_TOKENS_PER_S`     | 50       | Decode speed after the first token            |
+| `FAKE_OUTPUT_TOKENS`    | 64       | Completion tokens for free-form generations   |
+| `FAKE_EMBED_LATENCY_MS` | 20       | Latency of every embeddings request           |
+| `FAKE_EMBED_DIM`        | 1536     | Embedding dimensions                          |
+| `FAKE_INVALID_RATE`     | 0        | Share of suggestions that break their schema  |
+"""
+
+from __future__ import annotations
+
+import asyncio, hashlib, json, os, re, time, typing as t
+import bentoml, fastapi, numpy as np, annotated_types as at
+
+from openai.types import CreateEmbeddingResponse
+from openai.types.completion_usage import CompletionUsage
+from starlette.responses import PlainTextResponse, StreamingResponse
+
+from libs.codec import suggestion_frame
+
+TTFT_S = float(os.getenv('FAKE_TTFT_MS', '200')) / 1000
+TOKENS_PER_S = float(os.getenv('FAKE_TOKENS_PER_S', '50'))
+OUTPUT_TOKENS = int(os.getenv('FAKE_OUTPUT_TOKENS', '64'))
+EMBED_LATENCY_S = float(os.getenv('FAKE_EMBED_LATENCY_MS', '20')) / 1000
+EMBED_DIM = int(os.getenv('FAKE_EMBED_DIM', '1536'))
+INVALID_RATE = float(os.getenv('FAKE_INVALID_RATE', '0'))
+
+WORDS = 'one must imagine sisyphus happy the struggle itself toward the heights is enough to fill a heart'.split()
+AUTHORS = ['Raymond Carver', 'Franz Kafka', 'Albert Camus', 'Iain McGilchrist', 'Ian McEwan']
+_CHUNK_INDEX = re.compile(r'<chunk index="(\d+)">')
+
+SERVICE_CONFIG = {'traffic': {'timeout': 1000, 'concurrency': 1024}}
+
+llm_app = fastapi.FastAPI(title='Fake OpenAI Compatible Endpoint for the LLM', docs=False, redoc=False)
+embed_app = fastapi.FastAPI(title='Fake OpenAI Compatible Endpoint for Embeddings', docs=False, redoc=False)
+
+
+class EngineLoad:
+  """Mirrors vLLM's running/waiting gauges, so the gateway's load shedding sees a realistic signal."""
+
+  running = 0
+
+  @classmethod
+  def metrics(cls) -> str:
+    return f'vllm:num_requests_running{{model_name="fake"}} {cls.running}.0\nvllm:num_requests_waiting{{model_name="fake"}} 0.0\n'
+
+
+def count_tokens(messages: t.Iterable[t.Mapping[str, t.Any]]) -> int:
+  return sum(len(str(m.get('content') or '').split()) for m in messages)
+
+
+def fake_tokens(n: int) -> list[str]:
+  return [f'{WORDS[i % len(WORDS)]} ' for i in range(n)]
+
+
+def guided_content(schema: t.Mapping[str, t.Any], messages: t.Sequence[t.Mapping[str, t.Any]]) -> str:
+  """A valid response for the guided_json schemas used by the gateway."""
+  properties = schema.get('properties', {})
+  if 'titles' in properties:
+    prompt = ''.join(str(m.get('content') or '') for m in messages)
+    indices = [int(i) for i in _CHUNK_INDEX.findall(prompt)]
+    return json.dumps({'titles': [{'index': i, 'title': f'Section {i}'} for i in indices]})
+  if 'authors' in properties:
+    return json.dumps({'authors': AUTHORS})
+  if 'suggestions' in properties:
+    return json.dumps({'suggestions': [{'suggestion': ''.join(fake_tokens(16)).strip()}]})
+  return '{}'
+
+
+def invalid(messages: t.Sequence[t.Mapping[str, t.Any]]) -> bool:
+  """Whether this prompt gets a truncated, schema-breaking response, deterministically at ``FAKE_INVALID_RATE``."""
+  digest = hashlib.sha256(json.dumps(messages, sort_keys=True, default=str).encode()).digest()
+  return int.from_bytes(digest[:4]) / 2**32 < INVALID_RATE
+
+
+async def decode(tokens: t.Sequence[str]) -> t.AsyncGenerator[str, None]:
+  EngineLoad.running += 1
+  try:
+    await asyncio.sleep(TTFT_S)
+    for i, token in enumerate(tokens):
+      if i:
+        await asyncio.sleep(1 / TOKENS_PER_S)
+      yield token
+  finally:
+    EngineLoad.running -= 1
+
+
+def embed(text: str) -> list[float]:
+  seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+  vector = np.random.default_rng(seed).standard_normal(EMBED_DIM, dtype=np.float32)
+  return (vector / np.linalg.norm(vector)).tolist()
+
+
+def embedding_response(inputs: t.Sequence[str], model: str) -> CreateEmbeddingResponse:
+  tokens = sum(len(text.split()) for text in inputs)
+  return CreateEmbeddingResponse.model_validate({
+    'object': 'list',
+    'model': model,
+    'data': [{'object': 'embedding', 'index': i, 'embedding': embed(text)} for i, text in enumerate(inputs)],
+    'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+  })
+
+
+@llm_app.post('/chat/completions')
+async def chat_completions(request: fastapi.Request):
+  body = await request.json()
+  messages, model = body.get('messages', []), body.get('model', 'fake')
+  if schema := body.get('guided_json'):
+    # the gateway sends the serialized schema, see libs.schemas
+    schema = json.loads(schema) if isinstance(schema, str) else schema
+    tokens = re.findall(r'\S+\s*', guided_content(schema, messages))
+  else:
+    tokens = fake_tokens(min(OUTPUT_TOKENS, body.get('max_tokens') or OUTPUT_TOKENS))
+  prompt_tokens, created = count_tokens(messages), int(time.time())
+
+  if body.get('stream'):
+
+    async def stream() -> t.AsyncGenerator[str, None]:
+      async for token in decode(tokens):
+        chunk = {
+          'id': 'chatcmpl-fake',
+          'object': 'chat.completion.chunk',
+          'created': created,
+          'model': model,
+          'choices': [
+            {
+              'index': 0,
+              'delta': {'role': 'assistant', 'content': token, 'reasoning_content': None},
+              'finish_reason': None,
+            }
+          ],
+        }
+        yield f'data: {json.dumps(chunk)}\n\n'
+      yield 'data: [DONE]\n\n'
+
+    return StreamingResponse(stream(), media_type='text/event-stream')
+
+  content = ''.join([token async for token in decode(tokens)])
+  return {
+    'id': 'chatcmpl-fake',
+    'object': 'chat.completion',
+    'created': created,
+    'model': model,
+    'choices': [
+      {
+        'index': 0,
+        'message': {'role': 'assistant', 'content': content, 'reasoning_content': None, 'tool_calls': []},
+        'finish_reason': 'stop',
+      }
+    ],
+    'usage': {
+      'prompt_tokens': prompt_tokens,
+      'completion_tokens': len(tokens),
+      'total_tokens': prompt_tokens + len(tokens),
+    },
+  }
+
+
+@llm_app.get('/models')
+@embed_app.get('/models')
+async def models():
+  return {'object': 'list', 'data': [{'id': 'fake', 'object': 'model', 'created': 0, 'owned_by': 'morph'}]}
+
+
+@llm_app.get('/metrics/')
+async def metrics():
+  return PlainTextResponse(EngineLoad.metrics())
+
+
+@embed_app.post('/embeddings')
+async def embeddings(request: fastapi.Request):
+  body = await request.json()
+  inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+  await asyncio.sleep(EMBED_LATENCY_S)
+  return embedding_response(inputs, body.get('model', 'fake')).model_dump()
+
+
+@bentoml.asgi_app(llm_app, path='/v1')
+@bentoml.service(name='fake-inference-engine', **SERVICE_CONFIG)
+class FakeLLM:
+  @bentoml.api
+  async def generate(
+    self,
+    messages: list[dict[str, t.Any]],
+    *,
+    temperature: t.Annotated[float, at.Ge(0), at.Le(1)] = 0.6,
+    top_p: t.Annotated[float, at.Ge(0), at.Le(1)] = 0.95,
+    max_tokens: t.Annotated[int, at.Ge(256)] = 8192,
+    usage: bool = False,
+    steering: dict[str, float] | None = None,
+  ) -> t.AsyncGenerator[str, None]:
+    prompt_tokens, completion_tokens = count_tokens(messages), 0
+    # guided like LLM.generate, so that the gateway can validate the output when cascading across tiers
+    content = json.dumps({'suggestions': [{'suggestion': ''.join(fake_tokens(OUTPUT_TOKENS)).strip()}]})
+    tokens = re.findall(r'\S+\s*', content)
+    if invalid(messages):
+      tokens = tokens[: len(tokens) // 2]
+    yield ''  # same prefill marker as LLM.generate
+    async for token in decode(tokens):
+      completion_tokens += 1
+      stats = CompletionUsage(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+      )
+      yield suggestion_frame(token, usage=stats if usage else None)
+
+
+@bentoml.asgi_app(embed_app, path='/v1')
+@bentoml.service(name='fake-embedding-engine', **SERVICE_CONFIG)
+class FakeEmbeddings:
+  @bentoml.api
+  async def generate(self, content: list[str]) -> CreateEmbeddingResponse:
+    await asyncio.sleep(EMBED_LATENCY_S)
+    return embedding_response(content, 'fake')
@@ -0,0 +1,328 @@
+"""Closed-loop load test of the API gateway, against the fake engines or a live stack.
+
+With ``--spawn`` the fake engines from ``benchmarks/fake_engine.py`` and the gateway (``DEVELOPMENT=1``) are started
+on 3001, 3002 and 3000. Every scenario is driven at ``--concurrency`` for ``--requests`` requests, and the report
+is written as JSON so that runs can be compared with ``--baseline``:
+
+  python -m benchmarks.loadtest --spawn --concurrency 16 --requests 200 --output results.json
+
+``--tier-max-chars`` also starts a second fake LLM on 3003, routed to as a smaller tier (``LLM_TIERS``) for
+excerpts up to that many characters.
+"""
+
+from __future__ import annotations
+
+import abc, argparse, asyncio, contextlib, dataclasses, datetime, json, os, pathlib, platform, subprocess, sys, time, typing as t
+import httpx, psutil
+
+WORKING_DIR = pathlib.Path(__file__).parent.parent
+SCENARIOS = ('suggests', 'essays', 'notes', 'authors', 'chat')
+PARAGRAPH = (
+  'One must imagine Sisyphus happy. The struggle itself toward the heights is enough to fill a heart. '
+  'There is no fate that cannot be surmounted by scorn, and the absurd man says yes to his effort. '
+)
+
+
+def synthetic_essay(size: int) -> str:
+  """Markdown essay of roughly ``size`` characters, with headings, paragraphs and lists."""
+  parts, section = [], 0
+  while sum(map(len, parts)) < size:
+    section += 1
+    parts.append(f'## Section {section}\n\n{PARAGRAPH * 3}\n\n- first thought\n- second thought\n\n')
+  return ''.join(parts)[:size]
+
+
+@dataclasses.dataclass
+class Sample:
+  latency_s: float
+  ttft_s: float | None = None
+  error: str | None = None
+
+
+class Scenario(abc.ABC):
+  """One request against the gateway; returns its latency, and TTFT for streaming endpoints."""
+
+  name: str
+
+  def __init__(self, client: httpx.AsyncClient, essay: str):
+    self.client = client
+    self.essay = essay
+
+  @abc.abstractmethod
+  async def __call__(self, i: int) -> Sample: ...
+
+  async def stream(self, path: str, body: dict[str, t.Any]) -> Sample:
+    start, ttft = time.perf_counter(), None
+    async with self.client.stream('POST', path, json=body) as resp:
+      if resp.status_code != 200:
+        await resp.aread()
+        return Sample(time.perf_counter() - start, error=f'{resp.status_code}: {resp.text[:200]}')
+      async for chunk in resp.aiter_text():
+        if ttft is None and chunk.strip():
+          ttft = time.perf_counter() - start
+    return Sample(time.perf_counter() - start, ttft)
+
+  async def task(self, name: str, body: dict[str, t.Any], poll_s: float = 0.02) -> Sample:
+    start = time.perf_counter()
+    resp = await self.client.post(f'/{name}/submit', json=body)
+    if resp.status_code != 200:
+      return Sample(time.perf_counter() - start, error=f'{resp.status_code}: {resp.text[:200]}')
+    task_id = resp.json()['task_id']
+    while True:
+      status = (await self.client.get(f'/{name}/status', params={'task_id': task_id})).json()['status']
+      if status not in ('in_progress', 'pending'):
+        break
+      await asyncio.sleep(poll_s)
+    result = await self.client.get(f'/{name}/get', params={'task_id': task_id})
+    error = None if status == 'success' else f'task {status}: {result.text[:200]}'
+    if error is None and (message := result.json().get('error')):
+      error = message
+    return Sample(time.perf_counter() - start, error=error)
+
+
+class Suggests(Scenario):
+  name = 'suggests'
+
+  async def __call__(self, i: int) -> Sample:
+    return await self.stream('/suggests', {'essay': self.essay[:4096], 'num_suggestions': 3, 'max_tokens': 512})
+
+
+class Chat(Scenario):
+  name = 'chat'
+
+  async def __call__(self, i: int) -> Sample:
+    body = {'model': 'fake', 'stream': True, 'messages': [{'role': 'user', 'content': self.essay[:2048]}]}
+    return await self.stream('/v1/chat/completions', body)
+
+
+class Essays(Scenario):
+  name = 'essays'
+
+  async def __call__(self, i: int) -> Sample:
+    return await self.task(
+      'essays', {'vault_id': f'vault-{i % 4}', 'file_id': f'file-{i}', 'content': self.essay, 'format': 'compact'}
+    )
+
+
+class Notes(Scenario):
+  name = 'notes'
+
+  async def __call__(self, i: int) -> Sample:
+    body = {'vault_id': 'vault', 'file_id': f'file-{i}', 'note_id': f'note-{i}', 'content': self.essay[:1024]}
+    return await self.task('notes', body)
+
+
+class Authors(Scenario):
+  name = 'authors'
+
+  async def __call__(self, i: int) -> Sample:
+    return await self.task('authors', {'essay': self.essay[:4096], 'num_authors': 5, 'use_tool': False})
+
+
+SCENARIO_TYPES: dict[str, type[Scenario]] = {cls.name: cls for cls in (Suggests, Essays, Notes, Authors, Chat)}
+
+
+def percentiles(values: t.Sequence[float]) -> dict[str, float] | None:
+  if not values:
+    return None
+  ordered = sorted(values)
+
+  def pick(q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+  return {
+    'p50_ms': round(pick(0.50) * 1000, 2),
+    'p95_ms': round(pick(0.95) * 1000, 2),
+    'p99_ms': round(pick(0.99) * 1000, 2),
+    'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+  }
+
+
+def process_tree_cpu_s(pid: int | None) -> float | None:
+  if pid is None:
+    return None
+  with contextlib.suppress(psutil.NoSuchProcess):
+    root = psutil.Process(pid)
+    total = 0.0
+    for proc in [root, *root.children(recursive=True)]:
+      with contextlib.suppress(psutil.NoSuchProcess):
+        cpu = proc.cpu_times()
+        total += cpu.user + cpu.system
+    return total
+  return None
+
+
+async def run_scenario(
+  scenario: Scenario, *, concurrency: int, requests: int, gateway_pid: int | None
+) -> dict[str, t.Any]:
+  counter = iter(range(requests))
+  samples: list[Sample] = []
+
+  async def worker() -> None:
+    for i in counter:
+      try:
+        samples.append(await scenario(i))
+      except Exception as e:
+        samples.append(Sample(0.0, error=f'{type(e).__name__}: {e}'))
+
+  cpu_before = process_tree_cpu_s(gateway_pid)
+  start = time.perf_counter()
+  await asyncio.gather(*[worker() for _ in range(concurrency)])
+  elapsed = time.perf_counter() - start
+  cpu_after = process_tree_cpu_s(gateway_pid)
+
+  ok = [s for s in samples if s.error is None]
+  errors = [s.error for s in samples if s.error is not None]
+  return {
+    'requests': len(samples),
+    'errors': len(errors),
+    'error_samples': errors[:5],
+    'elapsed_s': round(elapsed, 3),
+    'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+    'latency': percentiles([s.latency_s for s in ok]),
+    'ttft': percentiles([s.ttft_s for s in ok if s.ttft_s is not None]),
+    'gateway_cpu_ms_per_request': (
+      round((cpu_after - cpu_before) / len(samples) * 1000, 3)
+      if cpu_before is not None and cpu_after is not None and samples
+      else None
+    ),
+  }
+
+
+def compare(results: dict[str, t.Any], baseline: dict[str, t.Any]) -> list[str]:
+  """Relative change of the headline numbers per scenario, positive is slower (or less throughput)."""
+  lines = []
+  for name, current in results['scenarios'].items():
+    if (previous := baseline.get('scenarios', {}).get(name)) is None:
+      continue
+    changes = []
+    for section, key in (('latency', 'p50_ms'), ('latency', 'p99_ms'), ('ttft', 'p95_ms')):
+      if (current.get(section) or {}).get(key) and (previous.get(section) or {}).get(key):
+        changes.append(f'{section}.{key} {current[section][key] / previous[section][key] - 1:+.1%}')
+    if current['throughput_rps'] and previous['throughput_rps']:
+      changes.append(f'throughput {1 - current["throughput_rps"] / previous["throughput_rps"]:+.1%}')
+    lines.append(f'{name}: {", ".join(changes)}')
+  return lines
+
+
+@contextlib.contextmanager
+def spawn_stack(port: int, *, log_dir: pathlib.Path, tier_max_chars: int | None = None) -> t.Iterator[int]:
+  """Start the fake engines and the gateway, yield the gateway pid once it reports ready."""
+  log_dir.mkdir(parents=True, exist_ok=True)
+  # the fake engines never call out to exa, /authors is driven with use_tool=False
+  env = {
+    'EXA_API_KEY': 'fake',
+    **os.environ,
+    'DEVELOPMENT': '1',
+    'LLM_PORT': str(port + 1),
+    'EMBED_PORT': str(port + 2),
+  }
+  commands = [
+    ('llm', ['bentoml', 'serve', 'benchmarks.fake_engine:FakeLLM', '--port', str(port + 1)]),
+    ('embed', ['bentoml', 'serve', 'benchmarks.fake_engine:FakeEmbeddings', '--port', str(port + 2)]),
+    ('api', ['bentoml', 'serve', 'service:API', '--port', str(port)]),
+  ]
+  ports = [port + 1, port + 2, port]
+  if tier_max_chars is not None:
+    tier = {'model': 'r1-qwen-tiny', 'url': f'http://127.0.0.1:{port + 3}', 'max_chars': tier_max_chars}
+    env['LLM_TIERS'] = json.dumps([tier])
+    commands.insert(2, ('tier', ['bentoml', 'serve', 'benchmarks.fake_engine:FakeLLM', '--port', str(port + 3)]))
+    ports.insert(2, port + 3)
+  procs = []
+  try:
+    for name, command in commands:
+      log = (log_dir / f'{name}.log').open('w')
+      procs.append(subprocess.Popen(command, cwd=WORKING_DIR, env=env, stdout=log, stderr=subprocess.STDOUT))
+    deadline = time.monotonic() + 120
+    for it in ports:
+      while not _ready(it):
+        if time.monotonic() > deadline or any(proc.poll() is not None for proc in procs):
+          raise TimeoutError(f'stack did not become ready, check the logs in {log_dir}')
+        time.sleep(0.5)
+    yield procs[-1].pid
+  finally:
+    for proc in procs:
+      proc.terminate()
+    for proc in procs:
+      with contextlib.suppress(subprocess.TimeoutExpired):
+        proc.wait(timeout=10)
+
+
+def _ready(port: int) -> bool:
+  try:
+    return httpx.get(f'http://127.0.0.1:{port}/readyz', timeout=1.0).status_code == 200
+  except httpx.TransportError:
+    return False
+
+
+async def main(args: argparse.Namespace, gateway_pid: int | None) -> dict[str, t.Any]:
+  essay = synthetic_essay(args.essay_size)
+  limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+  results: dict[str, t.Any] = {
+    'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    'config': {
+      'gateway': args.gateway,
+      'concurrency': args.concurrency,
+      'requests': args.requests,
+      'essay_size': args.essay_size,
+      'tier_max_chars': args.tier_max_chars,
+      'fake_engine': {k: v for k, v in os.environ.items() if k.startswith('FAKE_')},
+    },
+    'host': {'python': platform.python_version(), 'cpus': os.cpu_count(), 'machine': platform.machine()},
+    'scenarios': {},
+  }
+  async with httpx.AsyncClient(base_url=args.gateway, timeout=args.timeout, limits=limits) as client:
+    for name in args.scenarios:
+      scenario = SCENARIO_TYPES[name](client, essay)
+      with contextlib.suppress(Exception):
+        await scenario(-1)  # warm up lazy imports and connection pools, not measured
+      results['scenarios'][name] = report = await run_scenario(
+        scenario, concurrency=args.concurrency, requests=args.requests, gateway_pid=gateway_pid
+      )
+      latency, ttft = report['latency'] or {}, report['ttft'] or {}
+      print(
+        f'{name:>9}: {report["throughput_rps"]:>8} req/s  p50 {latency.get("p50_ms")}ms  p95 {latency.get("p95_ms")}ms'
+        f'  p99 {latency.get("p99_ms")}ms  ttft p50 {ttft.get("p50_ms")}ms  errors {report["errors"]}'
+        f'  cpu/req {report["gateway_cpu_ms_per_request"]}ms',
+        file=sys.stderr,
+      )
+  return results
+
+
+def cli() -> None:
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--gateway', default='http://127.0.0.1:3000')
+  parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+  parser.add_argument('--concurrency', type=int, default=8)
+  parser.add_argument('--requests', type=int, default=100, help='requests per scenario')
+  parser.add_argument('--essay-size', type=int, default=8 * 1024, help='characters of the synthetic essay')
+  parser.add_argument('--timeout', type=float, default=120.0)
+  parser.add_argument('--spawn', action='store_true', help='start the fake engines and the gateway locally')
+  parser.add_argument('--tier-max-chars', type=int, default=None, help='spawn a smaller LLM tier for short excerpts')
+  parser.add_argument('--gateway-pid', type=int, default=None, help='measure CPU of an already running gateway')
+  parser.add_argument('--output', type=pathlib.Path, default=None, help='write the JSON report here')
+  parser.add_argument('--baseline', type=pathlib.Path, default=None, help='JSON report to compare against')
+  args = parser.parse_args()
+
+  if args.spawn:
+    stack = spawn_stack(
+      int(args.gateway.rsplit(':', 1)[-1]),
+      log_dir=WORKING_DIR / 'logs' / 'loadtest',
+      tier_max_chars=args.tier_max_chars,
+    )
+  else:
+    stack = contextlib.nullcontext(args.gateway_pid)
+  with stack as pid:
+    results = asyncio.run(main(args, pid))
+
+  if args.output:
+    args.output.write_text(json.dumps(results, indent=2))
+  if args.baseline:
+    for line in compare(results, json.loads(args.baseline.read_text())):
+      print(line, file=sys.stderr)
+  if not args.output:
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+  cli()
@@ -0,0 +1,96 @@
+"""Microbenchmarks for the gateway's per-request CPU work, over synthetic essays from 1 KB to 1 MB.
+
+Run with ``make bench`` (pytest-benchmark). Results are saved under ``.benchmarks/`` and ``make bench
+ARGS=--benchmark-compare`` compares against the last saved run, so regressions show up before they reach the
+CPU-bound gateway replicas.
+"""
+
+from __future__ import annotations
+
+import functools, pathlib, typing as t
+import jinja2, pytest
+
+from openai.types.completion_usage import CompletionUsage
+
+from benchmarks.loadtest import synthetic_essay
+from libs.codec import CODECS, JSON, MSGPACK, suggestion_frame
+from libs.pipeline import LineNumberMetadataExtractor, MarkdownStructureNodeParser, essay_document
+from libs.protocol import CompactEssayNode, EssayNode, EssayRequest, EssayResponse, Suggestion
+
+if t.TYPE_CHECKING:
+  from llama_index.core.schema import BaseNode
+
+pytest.importorskip('pytest_benchmark')
+
+SIZES = {'1KB': 1 << 10, '16KB': 1 << 14, '128KB': 1 << 17, '1MB': 1 << 20}
+# legacy nodes carry the whole essay in their metadata, so serializing them is quadratic in the essay size
+LEGACY_MAX_SIZE = 1 << 17
+EMBED_DIM = 1536
+WORKING_DIR = pathlib.Path(__file__).parent.parent
+
+sizes = pytest.mark.parametrize('size', SIZES.values(), ids=SIZES.keys())
+
+
+def essay(size: int) -> EssayRequest:
+  return EssayRequest(vault_id='bench', file_id=f'essay-{size}', content=synthetic_essay(size))
+
+
+@functools.cache
+def chunked(size: int) -> tuple[BaseNode, ...]:
+  """Markdown-chunked nodes with line numbers and fake embeddings, as they come out of the ingestion pipeline."""
+  nodes = MarkdownStructureNodeParser().get_nodes_from_documents([essay_document(essay(size))])
+  LineNumberMetadataExtractor()(nodes)
+  for i, node in enumerate(nodes):
+    node.embedding = [float(i % 7) / 7] * EMBED_DIM
+  return tuple(nodes)
+
+
+@sizes
+def test_line_numbers(benchmark, size: int):
+  nodes = list(chunked(size))
+  benchmark(LineNumberMetadataExtractor(), nodes)
+  assert all(node.metadata['start_line'] > 0 for node in nodes)
+
+
+@sizes
+@pytest.mark.parametrize('format', ['compact', 'legacy'])
+@pytest.mark.parametrize('codec', ['pydantic', JSON, MSGPACK])
+def test_essay_response(benchmark, size: int, format: str, codec: str):
+  if format == 'legacy' and size > LEGACY_MAX_SIZE:
+    pytest.skip('legacy nodes copy the full essay into every node')
+  nodes, node_cls = chunked(size), CompactEssayNode if format == 'compact' else EssayNode
+
+  def serialize() -> str | bytes:
+    response = EssayResponse(
+      vault_id='bench', file_id='essay', format=format, nodes=[node_cls.from_node(node) for node in nodes]
+    )
+    return response.model_dump_json() if codec == 'pydantic' else CODECS[codec].dumps(response)
+
+  assert benchmark(serialize)
+
+
+@pytest.mark.parametrize('usage', [False, True], ids=['content', 'usage'])
+@pytest.mark.parametrize('codec', ['pydantic', 'orjson'])
+def test_suggestion_chunk(benchmark, usage: bool, codec: str):
+  stats = CompletionUsage(prompt_tokens=1024, completion_tokens=128, total_tokens=1152) if usage else None
+  # one streamed token from LLM.generate, serialized per chunk
+  if codec == 'pydantic':
+    assert benchmark(lambda: f'{Suggestion(suggestion="happy ", usage=stats).model_dump_json()}\n\n')
+  else:
+    assert benchmark(suggestion_frame, 'happy ', usage=stats)
+
+
+@sizes
+@pytest.mark.parametrize('template', ['SYSTEM_PROMPT.md', 'TOOL_CALLING.md'])
+def test_render_prompt(benchmark, size: int, template: str):
+  templater = jinja2.Environment(loader=jinja2.FileSystemLoader(searchpath=WORKING_DIR))
+  excerpt = synthetic_essay(size)
+  context = dict(
+    excerpt=excerpt,
+    num_suggestions=3,
+    num_authors=5,
+    notes=[{'content': 'The struggle itself toward the heights is enough to fill a heart.'}],
+    authors=['Albert Camus', 'Franz Kafka'],
+    tonality='{"formal":0.5,"humorous":0.2}',
+  )
+  assert len(benchmark(lambda: templater.get_template(template).render(**context))) >= size
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import bisect, contextlib, hashlib, json, logging, math, typing as t
+import httpx
+
+from libs.metrics import AFFINITY_REQUESTS
+from libs.transport import DEFAULT_TIMEOUT
+
+if t.TYPE_CHECKING:
+  from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger('bentoml.service')
+
+FORWARDED_HEADER = 'X-Vault-Forwarded'
+# not forwarded, httpx and the ASGI server set their own
+HOP_HEADERS = frozenset({b'host', b'connection', b'keep-alive', b'transfer-encoding', b'content-length', b'upgrade'})
+
+
+class HashRing:
+  """Consistent hashing with bounded loads over a set of replicas, keyed by vault id.
+
+  Every replica owns ``vnodes`` points on a 64-bit ring, and a vault goes to the first replica clockwise from its
+  hash, so adding or removing a replica only moves the vaults of the arcs it gains or loses (about 1/n of them).
+  A replica already holding more than ``load_factor`` times the average in-flight requests is skipped for the next
+  one on the ring, which keeps a hot vault from overloading its owner.
+  """
+
+  def __init__(
+    self, replicas: t.Iterable[str] = (), *, name: str = 'ring', vnodes: int = 64, load_factor: float = 1.25
+  ):
+    self.name = name
+    self.vnodes = vnodes
+    self.load_factor = load_factor
+    self.loads: dict[str, int] = {}
+    self._points: list[int] = []
+    self._owners: list[str] = []
+    for replica in replicas:
+      self.add(replica)
+
+  @staticmethod
+  def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest())
+
+  @property
+  def replicas(self) -> list[str]:
+    return list(self.loads)
+
+  def add(self, replica: str) -> None:
+    if replica in self.loads:
+      return
+    self.loads[replica] = 0
+    for i in range(self.vnodes):
+      point = self._hash(f'{replica}#{i}')
+      index = bisect.bisect(self._points, point)
+      self._points.insert(index, point)
+      self._owners.insert(index, replica)
+
+  def remove(self, replica: str) -> None:
+    if self.loads.pop(replica, None) is None:
+      return
+    kept = [(p, o) for p, o in zip(self._points, self._owners) if o != replica]
+    self._points, self._owners = [p for p, _ in kept], [o for _, o in kept]
+
+  def bound(self) -> int:
+    return math.ceil(self.load_factor * (sum(self.loads.values()) + 1) / len(self.loads))
+
+  def owner(self, key: str) -> str:
+    """The replica a vault maps to without load bounds."""
+    if not self._points:
+      raise LookupError(f'{self.name} has no replicas')
+    return self._owners[bisect.bisect(self._points, self._hash(key)) % len(self._points)]
+
+  def pick(self, key: str) -> str:
+    """The first replica clockwise from ``key`` that is under the load bound."""
+    owner = self.owner(key)
+    if len(self.loads) == 1:
+      return owner
+    bound = self.bound()
+    start, seen = bisect.bisect(self._points, self._hash(key)), set()
+    for i in range(len(self._points)):
+      replica = self._owners[(start + i) % len(self._points)]
+      if replica in seen:
+        continue
+      if self.loads[replica] < bound:
+        AFFINITY_REQUESTS.labels(ring=self.name, result='owner' if replica == owner else 'spill').inc()
+        return replica
+      seen.add(replica)
+    return owner  # unreachable, the bound is above the average load
+
+  @contextlib.contextmanager
+  def acquire(self, key: str) -> t.Iterator[str]:
+    """Pick a replica for ``key`` and count the request against its load until it is done."""
+    replica = self.pick(key)
+    self.loads[replica] += 1
+    try:
+      yield replica
+    finally:
+      if replica in self.loads:
+        self.loads[replica] -= 1
+
+
+class VaultAffinityMiddleware:
+  """ASGI middleware forwarding requests of a vault to the gateway replica that owns it on ``ring``.
+
+  Only ``paths`` are routed, by the ``vault_id`` of their JSON body. Forwarded requests carry ``X-Vault-Forwarded``
+  and are always served by the replica that receives them, and so are requests for a peer that cannot be reached.
+  """
+
+  def __init__(
+    self, app: ASGIApp, *, ring: HashRing, url: str, paths: t.Collection[str], client: httpx.AsyncClient | None = None
+  ):
+    self.app = app
+    self.ring = ring
+    self.url = url
+    self.paths = frozenset(paths)
+    self.client = client or httpx.AsyncClient(timeout=DEFAULT_TIMEOUT)
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if (
+      scope['type'] != 'http'
+      or scope['method'] != 'POST'
+      or scope['path'] not in self.paths
+      or len(self.ring.loads) < 2
+      or any(k == FORWARDED_HEADER.lower().encode() for k, _ in scope['headers'])
+    ):
+      return await self.app(scope, receive, send)
+
+    chunks, more = [], True
+    while more:
+      message = await receive()
+      if message['type'] != 'http.request':
+        return
+      chunks.append(message.get('body', b''))
+      more = message.get('more_body', False)
+    body = b''.join(chunks)
+    replayed = False
+
+    async def replay() -> Message:
+      nonlocal replayed
+      if replayed:
+        return await receive()
+      replayed = True
+      return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    try:
+      vault_id = json.loads(body).get('vault_id')
+    except (ValueError, AttributeError):
+      vault_id = None
+    if not isinstance(vault_id, str) or not vault_id:
+      return await self.app(scope, replay, send)
+
+    with self.ring.acquire(vault_id) as replica:
+      if replica != self.url and await self._forward(replica, scope, body, send):
+        return
+      await self.app(scope, replay, send)
+
+  async def _forward(self, replica: str, scope: Scope, body: bytes, send: Send) -> bool:
+    """Proxy the request to ``replica``, False if it could not be reached before responding."""
+    headers = [(k.decode(), v.decode()) for k, v in scope['headers'] if k not in HOP_HEADERS]
+    headers.append((FORWARDED_HEADER, '1'))
+    url = f'{replica.rstrip("/")}{scope["path"]}'
+    if query := scope.get('query_string'):
+      url += f'?{query.decode()}'
+    try:
+      resp = await self.client.send(self.client.build_request('POST', url, content=body, headers=headers), stream=True)
+    except httpx.TransportError as e:
+      logger.warning('Serving vault locally, %s is unreachable: %s', replica, e)
+      return False
+    try:
+      await send({
+        'type': 'http.response.start',
+        'status': resp.status_code,
+        'headers': [(k, v) for k, v in resp.headers.raw if k.lower() not in HOP_HEADERS],
+      })
+      async for chunk in resp.aiter_raw():
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+      await send({'type': 'http.response.body', 'body': b''})
+    finally:
+      await resp.aclose()
+    return True
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import collections, dataclasses, hashlib, threading, time, typing as t
+import numpy as np
+
+from libs.metrics import CACHE_REQUESTS
+
+
+@dataclasses.dataclass
+class CachedSuggestions:
+  """A finished ``/suggests`` stream, replayed as-is on a hit."""
+
+  context: str
+  digest: str
+  payload: str
+  created_at: float = dataclasses.field(default_factory=time.monotonic)
+
+  @property
+  def age_s(self) -> float:
+    return time.monotonic() - self.created_at
+
+
+class VaultTable:
+  """Bounded table of unit excerpt embeddings for one vault, evicting the least recently used row when full."""
+
+  __slots__ = ('entries', 'last_used', 'maxsize', 'vectors')
+
+  def __init__(self, maxsize: int):
+    self.maxsize = maxsize
+    self.vectors: np.ndarray | None = None
+    self.entries: list[CachedSuggestions] = []
+    self.last_used = np.zeros(maxsize, dtype=np.float64)
+
+  def exact(self, digest: str) -> int | None:
+    return next((i for i, it in enumerate(self.entries) if it.digest == digest), None)
+
+  def nearest(self, vector: np.ndarray, context: str, threshold: float) -> int | None:
+    if self.vectors is None or not self.entries:
+      return None
+    scores = self.vectors[: len(self.entries)] @ vector
+    for i in np.argsort(-scores):
+      if scores[i] < threshold:
+        return None
+      if self.entries[i].context == context:
+        return int(i)
+    return None
+
+  def touch(self, i: int) -> CachedSuggestions:
+    self.last_used[i] = time.monotonic()
+    return self.entries[i]
+
+  def put(self, vector: np.ndarray, entry: CachedSuggestions) -> None:
+    if self.vectors is None:
+      self.vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+    if (i := self.exact(entry.digest)) is None:
+      if len(self.entries) < self.maxsize:
+        i = len(self.entries)
+        self.entries.append(entry)
+      else:
+        i = int(np.argmin(self.last_used))
+    self.entries[i] = entry
+    self.vectors[i] = vector
+    self.touch(i)
+
+
+class SuggestionCache:
+  """Near-duplicate cache of ``/suggests`` results, keyed by excerpt embedding within a vault.
+
+  Entries only match requests with the same context (authors, tonality, notes, number of suggestions), either by
+  an exact hash of the excerpt or by cosine similarity of the excerpt embeddings above ``threshold``. Every vault
+  has its own bounded vector table, and the least recently used vaults are dropped past ``max_vaults``.
+  """
+
+  def __init__(self, *, threshold: float = 0.97, maxsize: int = 256, max_vaults: int = 1024):
+    self.threshold = threshold
+    self.maxsize = maxsize
+    self.max_vaults = max_vaults
+    self.hits = 0
+    self.misses = 0
+    self._vaults: collections.OrderedDict[str, VaultTable] = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  @property
+  def enabled(self) -> bool:
+    return self.maxsize > 0
+
+  @staticmethod
+  def context(**kwargs: t.Any) -> str:
+    return hashlib.sha256(repr(sorted(kwargs.items())).encode()).hexdigest()
+
+  @staticmethod
+  def digest(context: str, excerpt: str) -> str:
+    return hashlib.sha256(f'{context}\0{excerpt}'.encode()).hexdigest()
+
+  @staticmethod
+  def normalize(embedding: t.Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-8)
+
+  def _count(self, hit: bool) -> None:
+    if hit:
+      self.hits += 1
+    else:
+      self.misses += 1
+    CACHE_REQUESTS.labels(cache='suggestions', result='hit' if hit else 'miss').inc()
+
+  def exact(self, vault_id: str, digest: str) -> CachedSuggestions | None:
+    """Hit on the very same excerpt and context, without embedding it. Misses are counted by ``nearest``."""
+    with self._lock:
+      if (table := self._vaults.get(vault_id)) is None or (i := table.exact(digest)) is None:
+        return None
+      self._vaults.move_to_end(vault_id)
+      self._count(True)
+      return table.touch(i)
+
+  def nearest(self, vault_id: str, context: str, vector: np.ndarray) -> CachedSuggestions | None:
+    with self._lock:
+      table = self._vaults.get(vault_id)
+      if table is None or (i := table.nearest(vector, context, self.threshold)) is None:
+        self._count(False)
+        return None
+      self._vaults.move_to_end(vault_id)
+      self._count(True)
+      return table.touch(i)
+
+  def put(self, vault_id: str, vector: np.ndarray, entry: CachedSuggestions) -> None:
+    with self._lock:
+      if (table := self._vaults.get(vault_id)) is None:
+        table = self._vaults[vault_id] = VaultTable(self.maxsize)
+      self._vaults.move_to_end(vault_id)
+      table.put(vector, entry)
+      while len(self._vaults) > self.max_vaults:
+        self._vaults.popitem(last=False)
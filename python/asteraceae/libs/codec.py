@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import abc, typing as t
+import msgpack, numpy as np, orjson, pydantic
+
+from starlette.responses import Response
+
+if t.TYPE_CHECKING:
+  from openai.types.completion_usage import CompletionUsage
+
+JSON = 'application/json'
+NDJSON = 'application/x-ndjson'
+MSGPACK = 'application/msgpack'
+# models are dumped with this context, so their `Embedding` fields come out as float32 arrays, see libs.protocol
+DUMP_CONTEXT = {'ndarray': True}
+# legacy node metadata has int keys (line_map), written as strings like pydantic does
+JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def loads(data: str | bytes) -> t.Any:
+  """orjson's ``loads``, for tool call arguments and guided output. Raises a ``ValueError`` like ``json.loads``."""
+  return orjson.loads(data)
+
+
+def suggestion_frame(suggestion: str, reasoning: str = '', usage: CompletionUsage | None = None) -> str:
+  """One ``/suggests`` SSE frame, the same JSON as ``Suggestion(...).model_dump_json()`` without validating it."""
+  frame = {'suggestion': suggestion, 'reasoning': reasoning, 'usage': usage.model_dump() if usage else None}
+  return f'{orjson.dumps(frame).decode()}\n\n'
+
+
+class Codec(abc.ABC):
+  """Serializes gateway responses from pydantic models, with embeddings read straight from numpy buffers."""
+
+  media_type: str
+  stream_media_type: str
+
+  @abc.abstractmethod
+  def dumps(self, obj: t.Any) -> bytes: ...
+
+  @abc.abstractmethod
+  def frame(self, obj: t.Any) -> bytes:
+    """One frame of a streamed response."""
+
+  def response(self, obj: t.Any, status_code: int = 200) -> Response:
+    return Response(self.dumps(obj), status_code=status_code, media_type=self.media_type)
+
+  @staticmethod
+  def _default(obj: t.Any) -> t.Any:
+    if isinstance(obj, pydantic.BaseModel):
+      return obj.model_dump(context=DUMP_CONTEXT)
+    raise TypeError(f'Object of type {type(obj).__name__} is not serializable')
+
+
+class JSONCodec(Codec):
+  """orjson, which writes float32 arrays without going through Python floats. Streams are NDJSON."""
+
+  media_type = JSON
+  stream_media_type = NDJSON
+
+  def dumps(self, obj: t.Any) -> bytes:
+    return orjson.dumps(obj, default=self._default, option=JSON_OPTIONS)
+
+  def frame(self, obj: t.Any) -> bytes:
+    return orjson.dumps(obj, default=self._default, option=JSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+
+
+class MsgpackCodec(Codec):
+  """MessagePack, with embeddings as ``bin`` payloads of little-endian float32. Streams are concatenated objects."""
+
+  media_type = MSGPACK
+  stream_media_type = MSGPACK
+
+  @classmethod
+  def _default(cls, obj: t.Any) -> t.Any:
+    if isinstance(obj, np.ndarray):
+      return obj.astype('<f4', copy=False).tobytes()
+    return super()._default(obj)
+
+  def dumps(self, obj: t.Any) -> bytes:
+    return msgpack.packb(obj, default=self._default)
+
+  frame = dumps
+
+
+CODECS: dict[str, Codec] = {
+  JSON: JSONCodec(),
+  MSGPACK: MsgpackCodec(),
+  'application/x-msgpack': MsgpackCodec(),
+  'application/vnd.msgpack': MsgpackCodec(),
+}
+
+
+def negotiate(accept: str | None) -> Codec:
+  """The codec of the most preferred media type in an ``Accept`` header, JSON unless msgpack is asked for."""
+  codec, best = CODECS[JSON], 0.0
+  for part in (accept or '').split(','):
+    media_type, *params = (it.strip() for it in part.split(';'))
+    try:
+      q = next((float(v) for k, _, v in (it.partition('=') for it in params) if k.strip() == 'q'), 1.0)
+    except ValueError:
+      continue
+    # the first of equally preferred types wins
+    if (candidate := CODECS.get(media_type.lower())) is not None and q > best:
+      codec, best = candidate, q
+  return codec
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio, contextlib, datetime, logging, time, typing as t
+
+from libs.protocol import DependentStatus, HealthResponse
+
+if t.TYPE_CHECKING:
+  from libs.protocol import CircuitState
+
+logger = logging.getLogger('bentoml.service')
+
+Probe = t.Callable[[float], t.Awaitable[bool]]
+
+
+class CircuitOpenError(RuntimeError):
+  def __init__(self, name: str, retry_after: float):
+    super().__init__(f'{name} is unavailable, retry in {retry_after:.0f}s')
+    self.name = name
+    self.retry_after = retry_after
+
+
+class CircuitBreaker:
+  """Fails calls to a dependency fast while it is down or still warming up.
+
+  Opens after ``failure_threshold`` consecutive call failures, or right away when a health probe fails. After
+  ``reset_timeout_s`` it is half-open: calls go through again, and the next failure re-opens it while a success
+  (or a healthy probe) closes it.
+  """
+
+  def __init__(self, name: str, *, failure_threshold: int = 5, reset_timeout_s: float = 15.0):
+    self.name = name
+    self.failure_threshold = failure_threshold
+    self.reset_timeout_s = reset_timeout_s
+    self.failures = 0
+    self._opened_at: float | None = None
+
+  @property
+  def state(self) -> CircuitState:
+    if self._opened_at is None:
+      return 'closed'
+    return 'half_open' if time.monotonic() - self._opened_at >= self.reset_timeout_s else 'open'
+
+  @property
+  def retry_after(self) -> float:
+    if self._opened_at is None:
+      return 0.0
+    return max(0.0, self.reset_timeout_s - (time.monotonic() - self._opened_at))
+
+  def allow(self) -> bool:
+    return self.state != 'open'
+
+  def trip(self) -> None:
+    if self.state != 'open':
+      logger.warning('Circuit for %s opened', self.name)
+      self._opened_at = time.monotonic()
+
+  def record_success(self) -> None:
+    if self._opened_at is not None:
+      logger.info('Circuit for %s closed', self.name)
+    self.failures, self._opened_at = 0, None
+
+  def record_failure(self) -> None:
+    self.failures += 1
+    if self.failures >= self.failure_threshold or self.state == 'half_open':
+      self.trip()
+
+  @contextlib.asynccontextmanager
+  async def guard(self) -> t.AsyncIterator[None]:
+    """Raise ``CircuitOpenError`` without calling the dependency while open, and record the outcome otherwise."""
+    if not self.allow():
+      raise CircuitOpenError(self.name, self.retry_after)
+    try:
+      yield
+    except Exception:
+      self.record_failure()
+      raise
+    self.record_success()
+
+
+class HealthMonitor:
+  """Probes every dependency in the background, so health checks and request paths read a cached state.
+
+  Each probe round runs concurrently across dependencies, updates a rolling latency and drives the dependency's
+  ``CircuitBreaker``. ``/health`` then answers from memory, without adding load to a struggling engine.
+  """
+
+  def __init__(
+    self,
+    probes: t.Mapping[str, Probe],
+    *,
+    interval_s: float = 5.0,
+    timeout_s: float = 5.0,
+    failure_threshold: int = 5,
+    reset_timeout_s: float = 15.0,
+  ):
+    self.probes = dict(probes)
+    self.interval_s = interval_s
+    self.timeout_s = timeout_s
+    self.breakers = {
+      name: CircuitBreaker(name, failure_threshold=failure_threshold, reset_timeout_s=reset_timeout_s)
+      for name in self.probes
+    }
+    self._status = {name: DependentStatus(name=name, error='not probed yet') for name in self.probes}
+    self._task: asyncio.Task[None] | None = None
+
+  def start(self) -> None:
+    if self._task is None:
+      self._task = asyncio.create_task(self._run())
+
+  async def stop(self) -> None:
+    if self._task is not None:
+      self._task.cancel()
+      await asyncio.gather(self._task, return_exceptions=True)
+      self._task = None
+
+  def status(self, name: str) -> DependentStatus:
+    breaker = self.breakers[name]
+    return self._status[name].model_copy(update={'circuit': breaker.state, 'consecutive_failures': breaker.failures})
+
+  def health(self) -> HealthResponse:
+    services = [self.status(name) for name in self.probes]
+    return HealthResponse(
+      services=services,
+      healthy=all(it.healthy for it in services),
+      timestamp=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    )
+
+  async def probe_once(self) -> None:
+    await asyncio.gather(*[self._probe(name) for name in self.probes])
+
+  async def _probe(self, name: str) -> None:
+    previous, error = self._status[name], ''
+    start = time.perf_counter()
+    try:
+      async with asyncio.timeout(self.timeout_s):
+        healthy = await self.probes[name](self.timeout_s)
+      if not healthy:
+        error = 'not ready'
+    except Exception as e:
+      healthy, error = False, str(e) or type(e).__name__
+    latency_ms = (time.perf_counter() - start) * 1000
+    if previous.checked_at is not None and previous.healthy:
+      latency_ms = 0.8 * previous.latency_ms + 0.2 * latency_ms
+    self._status[name] = DependentStatus(
+      name=name,
+      healthy=healthy,
+      latency_ms=round(latency_ms, 2),
+      error=error,
+      checked_at=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    )
+    if healthy:
+      self.breakers[name].record_success()
+    else:
+      self.breakers[name].trip()
+
+  async def _run(self) -> None:
+    while True:
+      await self.probe_once()
+      await asyncio.sleep(self.interval_s)
@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import asyncio, contextvars, logging, math, time, typing as t
+
+from libs.protocol import ErrorResponse, LimiterStats
+
+if t.TYPE_CHECKING:
+  import httpx
+
+  from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger('bentoml.service')
+
+
+def parse_engine_load(text: str) -> tuple[int, int]:
+  """Sum ``vllm:num_requests_waiting`` and ``vllm:num_requests_running`` from a Prometheus exposition."""
+  waiting = running = 0.0
+  for line in text.splitlines():
+    if line.startswith('vllm:num_requests_waiting'):
+      waiting += float(line.rsplit(' ', 1)[-1])
+    elif line.startswith('vllm:num_requests_running'):
+      running += float(line.rsplit(' ', 1)[-1])
+  return int(waiting), int(running)
+
+
+class AdaptiveLimiter:
+  """AIMD concurrency limit for latency-sensitive requests to the LLM engine.
+
+  The limit grows by ``1 / limit`` per healthy completion while it is actually used, and is multiplied by
+  ``backoff`` (at most once per ``cooldown_s``) when a request fails, its latency exceeds ``latency_threshold_s``,
+  or the engine reports more than ``max_engine_waiting`` queued sequences. Requests over the limit are rejected
+  right away with a Retry-After hint rather than queued behind the overload.
+  """
+
+  def __init__(
+    self,
+    *,
+    initial: int,
+    min_limit: int = 1,
+    max_limit: int,
+    latency_threshold_s: float,
+    max_engine_waiting: int,
+    backoff: float = 0.9,
+    cooldown_s: float = 1.0,
+    max_retry_after_s: int = 60,
+  ):
+    self.limit = float(initial)
+    self.min_limit, self.max_limit = min_limit, max_limit
+    self.latency_threshold_s = latency_threshold_s
+    self.max_engine_waiting = max_engine_waiting
+    self.backoff = backoff
+    self.cooldown_s = cooldown_s
+    self.max_retry_after_s = max_retry_after_s
+    self.in_flight = 0
+    self.engine_waiting: int | None = None
+    self.engine_running: int | None = None
+    self.accepted = 0
+    self.rejected = 0
+    self._latency_ewma: float | None = None
+    self._last_decrease = -math.inf
+
+  @property
+  def engine_overloaded(self) -> bool:
+    return self.engine_waiting is not None and self.engine_waiting > self.max_engine_waiting
+
+  def stats(self) -> LimiterStats:
+    return LimiterStats(
+      limit=round(self.limit, 2),
+      in_flight=self.in_flight,
+      accepted=self.accepted,
+      rejected=self.rejected,
+      latency_ewma_ms=round(self._latency_ewma * 1000, 2) if self._latency_ewma is not None else None,
+      engine_waiting=self.engine_waiting,
+      engine_running=self.engine_running,
+    )
+
+  def try_acquire(self) -> bool:
+    if self.in_flight >= int(self.limit) or self.engine_overloaded:
+      self.rejected += 1
+      return False
+    self.in_flight += 1
+    self.accepted += 1
+    return True
+
+  def release(self, latency_s: float | None, *, ok: bool = True) -> None:
+    self.in_flight -= 1
+    if latency_s is not None:
+      self._latency_ewma = latency_s if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * latency_s
+    slow = latency_s is not None and latency_s > self.latency_threshold_s
+    if not ok or slow or self.engine_overloaded:
+      self._decrease()
+    elif self.in_flight + 1 >= self.limit / 2:
+      # only probe upwards while the current limit is actually exercised
+      self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+  def _decrease(self) -> None:
+    now = time.monotonic()
+    if now - self._last_decrease >= self.cooldown_s:
+      self.limit = max(self.min_limit, self.limit * self.backoff)
+      self._last_decrease = now
+
+  def observe_engine(self, waiting: int, running: int) -> None:
+    self.engine_waiting, self.engine_running = waiting, running
+    if self.engine_overloaded:
+      self._decrease()
+
+  def retry_after(self) -> int:
+    """Rough time for the current backlog to drain, in whole seconds."""
+    latency = self._latency_ewma or self.latency_threshold_s
+    backlog = max(1.0, (self.in_flight + (self.engine_waiting or 0)) / max(self.limit, 1.0))
+    return max(1, min(self.max_retry_after_s, math.ceil(latency * backlog)))
+
+
+class EngineLoadMonitor:
+  """Polls the engine's Prometheus endpoint and feeds its queue depth into an ``AdaptiveLimiter``."""
+
+  def __init__(self, client: httpx.AsyncClient, limiter: AdaptiveLimiter, *, path: str, interval_s: float = 1.0):
+    self.client = client
+    self.limiter = limiter
+    self.path = path
+    self.interval_s = interval_s
+    self._task: asyncio.Task[None] | None = None
+
+  def start(self) -> None:
+    if self._task is None:
+      self._task = asyncio.create_task(self._poll())
+
+  async def stop(self) -> None:
+    if self._task is not None:
+      self._task.cancel()
+      await asyncio.gather(self._task, return_exceptions=True)
+      self._task = None
+
+  async def _poll(self) -> None:
+    while True:
+      try:
+        resp = await self.client.get(self.path, timeout=self.interval_s)
+        resp.raise_for_status()
+        self.limiter.observe_engine(*parse_engine_load(resp.text))
+      except Exception as e:
+        # unknown load never sheds on its own, latency still drives the limit
+        self.limiter.engine_waiting = self.limiter.engine_running = None
+        logger.debug('Failed to poll engine metrics: %s', e)
+      await asyncio.sleep(self.interval_s)
+
+
+class Admission:
+  """Limiter slot of one request on a deferred path, only taken once its endpoint is about to call the engine."""
+
+  __slots__ = ('acquired', 'limiter', 'rejected')
+
+  def __init__(self, limiter: AdaptiveLimiter):
+    self.limiter = limiter
+    self.acquired = self.rejected = False
+
+  def acquire(self) -> bool:
+    if not (self.acquired or self.rejected):
+      self.acquired = self.limiter.try_acquire()
+      self.rejected = not self.acquired
+    return self.acquired
+
+
+ADMISSION: contextvars.ContextVar[Admission | None] = contextvars.ContextVar('admission', default=None)
+
+
+def admit() -> bool:
+  """Take the deferred limiter slot of the current request, if any. When False, the endpoint must return without
+  sending anything, and ``LoadShedMiddleware`` answers 429 instead."""
+  return (admission := ADMISSION.get()) is None or admission.acquire()
+
+
+class LoadShedMiddleware:
+  """ASGI middleware answering 429 with Retry-After when the LLM engine is saturated.
+
+  ``limited_paths`` hold a limiter slot for the whole response and report their time to first byte back to it.
+  ``deferred_paths`` do the same, but only once their endpoint calls ``admit``, so that responses which never reach
+  the engine (cache hits) are served even while it is saturated. Their response start is held back until the first
+  body message, to be replaced by the 429 if the slot was refused. ``shed_paths`` (task submissions) are only
+  rejected while the engine itself reports an overloaded queue.
+  """
+
+  def __init__(
+    self,
+    app: ASGIApp,
+    *,
+    limiter: AdaptiveLimiter,
+    limited_paths: t.Collection[str],
+    deferred_paths: t.Collection[str] = (),
+    shed_paths: t.Collection[str] = (),
+    allow_origins: t.Collection[str] = (),
+  ):
+    self.app = app
+    self.limiter = limiter
+    self.limited_paths = frozenset(limited_paths)
+    self.deferred_paths = frozenset(deferred_paths)
+    self.shed_paths = frozenset(shed_paths)
+    self.allow_origins = frozenset(allow_origins)
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope['type'] != 'http' or scope['method'] != 'POST':
+      return await self.app(scope, receive, send)
+    path = scope['path']
+    if path in self.shed_paths:
+      if self.limiter.engine_overloaded:
+        self.limiter.rejected += 1
+        return await self._reject(scope, send)
+      return await self.app(scope, receive, send)
+    if path in self.deferred_paths:
+      return await self._deferred(scope, receive, send)
+    if path not in self.limited_paths:
+      return await self.app(scope, receive, send)
+    if not self.limiter.try_acquire():
+      return await self._reject(scope, send)
+
+    start = time.perf_counter()
+    first_byte: float | None = None
+    status = 500
+
+    async def send_wrapper(message: Message) -> None:
+      nonlocal first_byte, status
+      if message['type'] == 'http.response.start':
+        status = message['status']
+      elif message['type'] == 'http.response.body' and first_byte is None:
+        first_byte = time.perf_counter() - start
+      await send(message)
+
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      self.limiter.release(first_byte, ok=status < 500)
+
+  async def _deferred(self, scope: Scope, receive: Receive, send: Send) -> None:
+    admission = Admission(self.limiter)
+    token = ADMISSION.set(admission)
+    start = time.perf_counter()
+    first_byte: float | None = None
+    response_start: Message | None = None
+    status, shed = 500, False
+
+    async def send_wrapper(message: Message) -> None:
+      nonlocal first_byte, response_start, status, shed
+      if message['type'] == 'http.response.start':
+        status, response_start = message['status'], message
+        return
+      if shed:
+        return
+      if response_start is not None:
+        if admission.rejected:
+          shed = True
+          return await self._reject(scope, send)
+        await send(response_start)
+        response_start = None
+      if message['type'] == 'http.response.body' and first_byte is None:
+        first_byte = time.perf_counter() - start
+      await send(message)
+
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      ADMISSION.reset(token)
+      if admission.acquired:
+        self.limiter.release(first_byte, ok=status < 500)
+
+  async def _reject(self, scope: Scope, send: Send) -> None:
+    retry_after = self.limiter.retry_after()
+    body = ErrorResponse(
+      message=f'LLM engine is overloaded, retry in {retry_after}s', type='TooManyRequests', code=429
+    )
+    headers = [(b'content-type', b'application/json'), (b'retry-after', str(retry_after).encode())]
+    # sent before the CORS middleware runs, so the browser client can still read the status and Retry-After
+    origin = next((v.decode() for k, v in scope['headers'] if k == b'origin'), None)
+    if origin in self.allow_origins:
+      headers += [
+        (b'access-control-allow-origin', origin.encode()),
+        (b'access-control-allow-credentials', b'true'),
+        (b'access-control-expose-headers', b'Retry-After'),
+      ]
+    await send({'type': 'http.response.start', 'status': 429, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body.model_dump_json().encode()})
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import contextlib, functools, inspect, time, typing as t
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from libs.profiling import record_span
+
+# Exported on the gateway's /metrics next to BentoML's own request metrics. Counters and histograms aggregate across
+# BentoML's worker processes as is; gauges are summed over the live processes (``livesum``).
+F = t.TypeVar('F', bound=t.Callable[..., t.Any])
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+TOKEN_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0)
+
+STAGE_SECONDS = Histogram(
+  'morph_stage_duration_seconds',
+  'Wall time per pipeline stage (chunking, line numbers, titles, embeddings, prompt rendering).',
+  ['stage'],
+  buckets=LATENCY_BUCKETS,
+)
+QUEUE_WAIT_SECONDS = Histogram(
+  'morph_queue_wait_seconds',
+  'Time spent waiting for an ingest worker or an LLM admission slot.',
+  ['queue'],
+  buckets=LATENCY_BUCKETS,
+)
+QUEUE_DEPTH = Gauge('morph_queue_depth', 'Jobs waiting for an ingest worker.', ['queue'], multiprocess_mode='livesum')
+TTFT_SECONDS = Histogram(
+  'morph_time_to_first_token_seconds',
+  'Time from request arrival to the first generated token.',
+  ['endpoint'],
+  buckets=LATENCY_BUCKETS,
+)
+ITL_SECONDS = Histogram(
+  'morph_inter_token_latency_seconds',
+  'Mean latency between generated tokens, one sample per request.',
+  ['endpoint'],
+  buckets=TOKEN_LATENCY_BUCKETS,
+)
+TOKENS = Counter('morph_tokens', 'Prompt (in) and completion (out) tokens.', ['endpoint', 'direction'])
+CACHE_REQUESTS = Counter('morph_cache_requests', 'Cache lookups by result (hit or miss).', ['cache', 'result'])
+ROUTED_REQUESTS = Counter('morph_routed_requests', 'Requests routed to each model tier.', ['task', 'tier'])
+CASCADE_ESCALATIONS = Counter(
+  'morph_cascade_escalations', 'Requests escalated past a model tier whose output failed validation.', ['task', 'tier']
+)
+AFFINITY_REQUESTS = Counter(
+  'morph_affinity_requests',
+  'Vault requests routed to their owning replica, or spilled to the next one.',
+  ['ring', 'result'],
+)
+
+
+def record_usage(endpoint: str, usage: t.Any) -> None:
+  """Count tokens from an OpenAI completion or embedding usage, if the engine reported one."""
+  if usage is not None:
+    TOKENS.labels(endpoint=endpoint, direction='in').inc(usage.prompt_tokens or 0)
+    TOKENS.labels(endpoint=endpoint, direction='out').inc(getattr(usage, 'completion_tokens', None) or 0)
+
+
+def timed(stage: str) -> t.Callable[[F], F]:
+  """Observe the wall time of a sync or async function under ``morph_stage_duration_seconds{stage=...}``.
+
+  The call is also added to the request's timeline, see ``libs.profiling``.
+  """
+  histogram = STAGE_SECONDS.labels(stage=stage)
+
+  def decorator(fn: F) -> F:
+    if inspect.iscoroutinefunction(fn):
+
+      @functools.wraps(fn)
+      async def async_wrapper(*args: t.Any, **kwargs: t.Any) -> t.Any:
+        start = time.perf_counter()
+        try:
+          return await fn(*args, **kwargs)
+        finally:
+          end = time.perf_counter()
+          histogram.observe(end - start)
+          record_span(stage, start, end)
+
+      return t.cast(F, async_wrapper)
+
+    @functools.wraps(fn)
+    def wrapper(*args: t.Any, **kwargs: t.Any) -> t.Any:
+      start = time.perf_counter()
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        end = time.perf_counter()
+        histogram.observe(end - start)
+        record_span(stage, start, end)
+
+    return t.cast(F, wrapper)
+
+  return decorator
+
+
+@contextlib.contextmanager
+def stage(name: str) -> t.Iterator[None]:
+  """Same as ``timed``, for a block."""
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    end = time.perf_counter()
+    STAGE_SECONDS.labels(stage=name).observe(end - start)
+    record_span(name, start, end)
+
+
+class TokenTimer:
+  """Tracks TTFT and inter-token latency of one stream with two clock reads per token and no metric calls.
+
+  The histograms are only touched once, in ``finish``, which keeps the per-token path cheap.
+  """
+
+  __slots__ = ('endpoint', 'first', 'last', 'start', 'tokens')
+
+  def __init__(self, endpoint: str):
+    self.endpoint = endpoint
+    self.start = time.perf_counter()
+    self.first: float | None = None
+    self.last = 0.0
+    self.tokens = 0
+
+  def tick(self) -> None:
+    now = time.perf_counter()
+    if self.first is None:
+      self.first = now
+    self.last = now
+    self.tokens += 1
+
+  def finish(self) -> None:
+    if self.first is None:
+      return
+    TTFT_SECONDS.labels(endpoint=self.endpoint).observe(self.first - self.start)
+    record_span(f'{self.endpoint}_first_token', self.start, self.first)
+    record_span(f'{self.endpoint}_decode', self.first, self.last)
+    if self.tokens > 1:
+      ITL_SECONDS.labels(endpoint=self.endpoint).observe((self.last - self.first) / (self.tokens - 1))
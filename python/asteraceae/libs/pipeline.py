@@ -0,0 +1,639 @@
+from __future__ import annotations
+
+import logging, hashlib, threading, contextlib, collections, re, typing as t
+import numpy as np, pydantic
+
+from llama_index.core import Document
+from llama_index.core.ingestion import IngestionPipeline
+from llama_index.core.node_parser import NodeParser, SemanticSplitterNodeParser
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import MetadataMode, TransformComponent
+from llama_index.core.utils import get_tokenizer
+
+from llama_index.embeddings.openai import OpenAIEmbedding
+
+from libs.metrics import CACHE_REQUESTS, record_usage, timed
+from libs.protocol import ChunkerMode, ChunkTitlesSchema, EssayRequest, TitleMode
+from libs.schemas import GUIDED_SCHEMAS
+
+if t.TYPE_CHECKING:
+  import openai
+
+  from libs.scheduler import AdmissionScheduler
+  from libs.transport import Upstream
+  from llama_index.core.base.embeddings.base import BaseEmbedding
+  from llama_index.core.schema import BaseNode
+
+logger = logging.getLogger('bentoml.service')
+
+
+def pool_embeddings(embeddings: t.Sequence[t.Sequence[float]]) -> list[float]:
+  """Mean-pool a group of embeddings and L2-normalise the result."""
+  pooled = np.asarray(embeddings, dtype=np.float32).mean(axis=0)
+  norm = float(np.linalg.norm(pooled))
+  return (pooled / norm if norm > 0 else pooled).tolist()
+
+
+class PooledSemanticSplitterNodeParser(SemanticSplitterNodeParser):
+  """Semantic splitter that keeps the sentence embeddings it computes for breakpoints.
+
+  Every chunk is assigned the mean-pooled embedding of the sentence groups it was built from,
+  so the final embedding stage (see ``EmbedMissingTransform``) can skip nodes that already carry a vector.
+  """
+
+  pool_chunk_embeddings: bool = True
+
+  @classmethod
+  def class_name(cls) -> str:
+    return 'PooledSemanticSplitterNodeParser'
+
+  def _group_sentences(
+    self, sentences: list[dict[str, t.Any]], distances: list[float]
+  ) -> list[list[dict[str, t.Any]]]:
+    # mirrors SemanticSplitterNodeParser._build_node_chunks, but keeps the groups instead of only the joined text
+    if not distances:
+      return [sentences]
+    threshold = np.percentile(distances, self.breakpoint_percentile_threshold)
+    groups, start = [], 0
+    for index in (i for i, d in enumerate(distances) if d > threshold):
+      groups.append(sentences[start : index + 1])
+      start = index + 1
+    if start < len(sentences):
+      groups.append(sentences[start:])
+    return groups
+
+  def _build_pooled_nodes(self, doc: Document, sentences: list[dict[str, t.Any]]) -> list[BaseNode]:
+    distances = self._calculate_distances_between_sentence_groups(sentences)
+    groups = self._group_sentences(sentences, distances)
+    joiner = '' if distances else ' '
+    nodes = build_nodes_from_splits([joiner.join(s['sentence'] for s in g) for g in groups], doc, id_func=self.id_func)
+    if self.pool_chunk_embeddings:
+      for node, group in zip(nodes, (g for g in groups if g)):
+        node.embedding = pool_embeddings([s['combined_sentence_embedding'] for s in group])
+    return nodes
+
+  @timed('chunk_semantic')  # includes embedding every sentence group
+  def build_semantic_nodes_from_documents(
+    self, documents: t.Sequence[Document], show_progress: bool = False
+  ) -> list[BaseNode]:
+    all_nodes: list[BaseNode] = []
+    for doc in documents:
+      sentences = self._build_sentence_groups(self.sentence_splitter(doc.text))
+      embeddings = self.embed_model.get_text_embedding_batch(
+        [s['combined_sentence'] for s in sentences], show_progress=show_progress
+      )
+      for sentence, embedding in zip(sentences, embeddings):
+        sentence['combined_sentence_embedding'] = embedding
+      all_nodes.extend(self._build_pooled_nodes(doc, sentences))
+    return all_nodes
+
+  @timed('chunk_semantic')
+  async def abuild_semantic_nodes_from_documents(
+    self, documents: t.Sequence[Document], show_progress: bool = False
+  ) -> list[BaseNode]:
+    all_nodes: list[BaseNode] = []
+    for doc in documents:
+      sentences = self._build_sentence_groups(self.sentence_splitter(doc.text))
+      embeddings = await self.embed_model.aget_text_embedding_batch(
+        [s['combined_sentence'] for s in sentences], show_progress=show_progress
+      )
+      for sentence, embedding in zip(sentences, embeddings):
+        sentence['combined_sentence_embedding'] = embedding
+      all_nodes.extend(self._build_pooled_nodes(doc, sentences))
+    return all_nodes
+
+  async def _aparse_nodes(
+    self, nodes: t.Sequence[BaseNode], show_progress: bool = False, **kwargs: t.Any
+  ) -> list[BaseNode]:
+    return await self.abuild_semantic_nodes_from_documents(t.cast('t.Sequence[Document]', nodes), show_progress)
+
+
+_FENCE = re.compile(r'^\s*(```+|~~~+)')
+_HEADING = re.compile(r'^(#{1,6})\s')
+_LIST_ITEM = re.compile(r'^\s*([-*+]|\d+[.)])\s')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+Span = tuple[int, int]
+
+
+class MarkdownStructureNodeParser(NodeParser):
+  """CPU-only chunker that splits on markdown structure instead of sentence embeddings.
+
+  Fenced code blocks, headings, paragraphs and lists are parsed into blocks, which are then packed into chunks
+  of at most ``chunk_size`` tokens. Every heading up to ``split_heading_level`` starts a new chunk, and blocks that
+  are larger than ``chunk_size`` on their own are split on sentences (or lines for code and lists).
+  Chunks are exact slices of the source text, and their character offsets are kept on the nodes.
+  """
+
+  chunk_size: int = pydantic.Field(default=512, gt=0)
+  split_heading_level: int = pydantic.Field(default=3, ge=1, le=6)
+  tokenizer: t.Callable[[str], t.Sequence[t.Any]] = pydantic.Field(default_factory=get_tokenizer, exclude=True)
+
+  @classmethod
+  def class_name(cls) -> str:
+    return 'MarkdownStructureNodeParser'
+
+  def _num_tokens(self, text: str) -> int:
+    return len(self.tokenizer(text))
+
+  @staticmethod
+  def parse_blocks(text: str) -> list[tuple[int, int, str]]:
+    """Parse ``text`` into ``(start, end, kind)`` spans, kind being one of heading/paragraph/list/code."""
+    blocks: list[tuple[int, int, str]] = []
+    start: int | None = None
+    end, kind, fence, pos = 0, '', '', 0
+
+    def flush():
+      nonlocal start
+      if start is not None:
+        blocks.append((start, end, kind))
+      start = None
+
+    for line in text.splitlines(keepends=True):
+      line_start, pos = pos, pos + len(line)
+      line_end = line_start + len(line.rstrip('\r\n'))
+      if fence:
+        end = line_end
+        if line.strip().startswith(fence):
+          flush()
+          fence = ''
+        continue
+      if match := _FENCE.match(line):
+        flush()
+        start, end, kind, fence = line_start, line_end, 'code', match.group(1)
+        continue
+      if not line.strip():
+        flush()
+        continue
+      if _HEADING.match(line):
+        flush()
+        blocks.append((line_start, line_end, 'heading'))
+        continue
+      line_kind = 'list' if _LIST_ITEM.match(line) else 'paragraph'
+      # indented continuation lines belong to the list item above them
+      if start is not None and line_kind != kind and not (kind == 'list' and line[:1].isspace()):
+        flush()
+      if start is None:
+        start, kind = line_start, line_kind
+      end = line_end
+    flush()
+    return blocks
+
+  def _split_block(self, text: str, start: int, end: int, kind: str) -> list[Span]:
+    if kind in ('code', 'list'):
+      units, pos = [], start
+      for line in text[start:end].splitlines(keepends=True):
+        units.append((pos, pos + len(line.rstrip('\r\n'))))
+        pos += len(line)
+    else:
+      units, pos = [], start
+      for match in _SENTENCE_END.finditer(text, start, end):
+        units.append((pos, match.start()))
+        pos = match.end()
+      units.append((pos, end))
+    return self._pack(text, [(s, e) for s, e in units if e > s])
+
+  def _pack(self, text: str, units: list[Span], *, boundaries: t.Container[int] = ()) -> list[Span]:
+    chunks: list[Span] = []
+    current: Span | None = None
+    for index, (start, end) in enumerate(units):
+      # count the merged slice rather than summing units, separators between units cost tokens too
+      if current is not None and (index in boundaries or self._num_tokens(text[current[0] : end]) > self.chunk_size):
+        chunks.append(current)
+        current = None
+      current = (current[0] if current else start, end)
+    if current is not None:
+      chunks.append(current)
+    return chunks
+
+  def split_text_spans(self, text: str) -> list[Span]:
+    """Return ``(start, end)`` character spans of the chunks for ``text``."""
+    units: list[Span] = []
+    boundaries: set[int] = set()
+    previous = ''
+    for start, end, kind in self.parse_blocks(text):
+      if kind == 'heading' and len(text[start:end]) - len(text[start:end].lstrip('#')) <= self.split_heading_level:
+        boundaries.add(len(units))
+      if self._num_tokens(text[start:end]) > self.chunk_size:
+        # keep a heading attached to the first piece of the oversized block that follows it
+        if previous == 'heading':
+          start = units.pop()[0]
+        boundaries.add(len(units))
+        units.extend(self._split_block(text, start, end, kind))
+        boundaries.add(len(units))
+      else:
+        units.append((start, end))
+      previous = kind
+    return self._pack(text, units, boundaries=boundaries)
+
+  @timed('chunk_markdown')
+  def _parse_nodes(self, nodes: t.Sequence[BaseNode], show_progress: bool = False, **kwargs: t.Any) -> list[BaseNode]:
+    all_nodes: list[BaseNode] = []
+    for node in nodes:
+      text = node.get_content(metadata_mode=MetadataMode.NONE)
+      spans = self.split_text_spans(text)
+      chunks = build_nodes_from_splits([text[s:e] for s, e in spans], node, id_func=self.id_func)
+      for chunk, (start, end) in zip(chunks, spans):
+        chunk.start_char_idx, chunk.end_char_idx = start, end
+      all_nodes.extend(chunks)
+    return all_nodes
+
+
+class EmbedMissingTransform(TransformComponent):
+  """Final embedding stage that only sends nodes without an embedding to the embedding engine."""
+
+  embed_model: t.Any
+
+  def _missing(self, nodes: t.Sequence[BaseNode]) -> tuple[list[BaseNode], list[str]]:
+    missing = [node for node in nodes if node.embedding is None]
+    if (reused := len(nodes) - len(missing)) > 0:
+      logger.debug('reusing %d pooled chunk embeddings, embedding %d nodes', reused, len(missing))
+    return missing, [node.get_content(metadata_mode=MetadataMode.EMBED) for node in missing]
+
+  @timed('embed')
+  def __call__(self, nodes: t.Sequence[BaseNode], **kwargs: t.Any) -> t.Sequence[BaseNode]:
+    missing, texts = self._missing(nodes)
+    if texts:
+      model = t.cast('BaseEmbedding', self.embed_model)
+      for node, embedding in zip(missing, model.get_text_embedding_batch(texts)):
+        node.embedding = embedding
+    return nodes
+
+  @timed('embed')
+  async def acall(self, nodes: t.Sequence[BaseNode], **kwargs: t.Any) -> t.Sequence[BaseNode]:
+    missing, texts = self._missing(nodes)
+    if texts:
+      model = t.cast('BaseEmbedding', self.embed_model)
+      for node, embedding in zip(missing, await model.aget_text_embedding_batch(texts)):
+        node.embedding = embedding
+    return nodes
+
+
+TITLE_PROMPT = """You are given {num_chunks} consecutive chunks of a single essay, each wrapped in a <chunk index="..."> tag.
+Write one short, descriptive title (at most 10 words) for every chunk that captures its main topic.
+Return exactly one entry per chunk, using the chunk's index."""
+
+
+def heuristic_title(text: str, max_words: int = 8) -> str:
+  """Derive a title without the LLM: the first markdown heading, otherwise the first sentence of the chunk."""
+  lines = [line.strip() for line in text.splitlines() if line.strip()]
+  for line in lines:
+    if line.startswith('#'):
+      return line.lstrip('#').strip()
+  if not lines:
+    return ''
+  first = re.split(r'(?<=[.!?])\s', re.sub(r'^([-*+>]|\d+[.)])\s+', '', lines[0]), maxsplit=1)[0]
+  words = first.split()
+  return ' '.join(words[:max_words]) + ('…' if len(words) > max_words else '')
+
+
+class TitleCache:
+  """Bounded LRU of chunk titles, keyed by a hash of the title mode and chunk text."""
+
+  def __init__(self, maxsize: int = 4096):
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self._store: collections.OrderedDict[str, str] = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def key(mode: TitleMode, text: str) -> str:
+    return hashlib.sha256(f'{mode}\0{text}'.encode()).hexdigest()
+
+  def get(self, key: str) -> str | None:
+    with self._lock:
+      if (title := self._store.get(key)) is None:
+        self.misses += 1
+        CACHE_REQUESTS.labels(cache='titles', result='miss').inc()
+        return None
+      self._store.move_to_end(key)
+      self.hits += 1
+      CACHE_REQUESTS.labels(cache='titles', result='hit').inc()
+      return title
+
+  def put(self, key: str, title: str) -> None:
+    with self._lock:
+      self._store[key] = title
+      self._store.move_to_end(key)
+      while len(self._store) > self.maxsize:
+        self._store.popitem(last=False)
+
+
+TITLE_CACHE = TitleCache()
+
+
+class BatchTitleExtractor(TransformComponent):
+  """Titles every chunk of a document with a single guided-JSON completion.
+
+  Replaces ``TitleExtractor``, which issues one completion per node plus a combine step. Titles are written to
+  ``metadata_key`` per node, cached by chunk hash, and ``mode='heuristic'`` skips the LLM altogether.
+  ``client``/``aclient`` are the OpenAI clients of the LLM upstream, used from worker threads and the event loop.
+  """
+
+  mode: TitleMode = 'llm'
+  client: t.Any = pydantic.Field(default=None, exclude=True)
+  aclient: t.Any = pydantic.Field(default=None, exclude=True)
+  scheduler: t.Any = pydantic.Field(default=None, exclude=True, description='AdmissionScheduler for the LLM')
+  priority: str = 'background'
+  model: str = ''
+  temperature: float = 0.6
+  max_tokens: int = 8192
+  max_chunk_chars: int = 1500
+  metadata_key: str = 'document_title'
+
+  @classmethod
+  def class_name(cls) -> str:
+    return 'BatchTitleExtractor'
+
+  def _pending(self, nodes: t.Sequence[BaseNode]) -> list[tuple[int, str]]:
+    pending = []
+    for index, node in enumerate(nodes):
+      text = node.get_content(metadata_mode=MetadataMode.NONE)
+      if self.mode == 'heuristic':
+        node.metadata[self.metadata_key] = heuristic_title(text)
+      elif (title := TITLE_CACHE.get(TitleCache.key(self.mode, text))) is not None:
+        node.metadata[self.metadata_key] = title
+      else:
+        pending.append((index, text))
+    return pending
+
+  def _request(self, pending: list[tuple[int, str]]) -> dict[str, t.Any]:
+    chunks = '\n'.join(f'<chunk index="{i}">\n{text[: self.max_chunk_chars]}\n</chunk>' for i, text in pending)
+    return dict(
+      model=self.model,
+      messages=[
+        {'role': 'system', 'content': TITLE_PROMPT.format(num_chunks=len(pending))},
+        {'role': 'user', 'content': chunks},
+      ],
+      temperature=self.temperature,
+      max_tokens=self.max_tokens,
+      extra_body={'guided_json': GUIDED_SCHEMAS.get(ChunkTitlesSchema)},
+    )
+
+  def _apply(self, nodes: t.Sequence[BaseNode], pending: list[tuple[int, str]], content: str | None) -> None:
+    titles: dict[int, str] = {}
+    try:
+      titles = {it.index: it.title.strip() for it in ChunkTitlesSchema.model_validate_json(content or '{}').titles}
+    except pydantic.ValidationError as e:
+      logger.error('Failed to parse batched chunk titles: %s', e)
+    for index, text in pending:
+      if title := titles.get(index):
+        TITLE_CACHE.put(TitleCache.key(self.mode, text), title)
+      else:
+        title = heuristic_title(text)
+      nodes[index].metadata[self.metadata_key] = title
+
+  @timed('titles')
+  def __call__(self, nodes: t.Sequence[BaseNode], **kwargs: t.Any) -> t.Sequence[BaseNode]:
+    if pending := self._pending(nodes):
+      content = None
+      try:
+        client = t.cast('openai.OpenAI', self.client)
+        with self.scheduler.blocking_slot(self.priority) if self.scheduler else contextlib.nullcontext():
+          completion = client.chat.completions.create(**self._request(pending))
+        record_usage('titles', completion.usage)
+        content = completion.choices[0].message.content
+      except Exception as e:
+        logger.error('Batched chunk titling failed, falling back to heuristic titles: %s', e)
+      self._apply(nodes, pending, content)
+    return nodes
+
+  @timed('titles')
+  async def acall(self, nodes: t.Sequence[BaseNode], **kwargs: t.Any) -> t.Sequence[BaseNode]:
+    if pending := self._pending(nodes):
+      content = None
+      try:
+        client = t.cast('openai.AsyncOpenAI', self.aclient)
+        async with self.scheduler.slot(self.priority) if self.scheduler else contextlib.nullcontext():
+          completion = await client.chat.completions.create(**self._request(pending))
+        record_usage('titles', completion.usage)
+        content = completion.choices[0].message.content
+      except Exception as e:
+        logger.error('Batched chunk titling failed, falling back to heuristic titles: %s', e)
+      self._apply(nodes, pending, content)
+    return nodes
+
+
+class LineNumberMetadataExtractor(TransformComponent):
+  """Extracts line numbers from document content and adds them to node metadata.
+
+  This extractor assigns line numbers to each line in the document,
+  preserving whitespace, and ensures this information is available
+  in the node metadata after semantic chunking.
+  """
+
+  include_whitespace: bool = True
+
+  @timed('line_numbers')
+  def __call__(self, nodes: list[BaseNode], **kwargs: t.Any) -> list[BaseNode]:
+    """Process nodes to add line number metadata.
+
+    For each node, this adds:
+    - line_numbers: List of line numbers contained in this node
+    - start_line: First line number in this node
+    - end_line: Last line number in this node
+    - line_map: Dictionary mapping line numbers to line content
+
+    Args:
+        nodes: The list of nodes to extract metadata from
+
+    Returns:
+        The same list of nodes with updated metadata
+    """
+    for node in nodes:
+      if not hasattr(node, 'metadata'):
+        continue
+
+      # Get the original text - either from metadata or by looking at source node
+      original_text = None
+
+      # First check if we stored original_text in metadata during document creation
+      if 'content' in node.metadata:
+        original_text = node.metadata['content']
+      # Then check source_node for Document-derived nodes
+      elif hasattr(node, 'source_node') and node.source_node and hasattr(node.source_node, 'text'):
+        original_text = node.source_node.text
+      # Or check if this is actually a Document
+      elif hasattr(node, 'text'):
+        original_text = node.text
+
+      if not original_text:
+        logger.warning(
+          'No original text found for node %s, skipping line number extraction', getattr(node, 'node_id', 'unknown')
+        )
+        continue
+
+      # Get the content of this node
+      node_text = node.get_content() if hasattr(node, 'get_content') else getattr(node, 'text', '')
+      node_text = node_text.strip()  # Strip for better matching
+
+      if not node_text:
+        continue
+
+      # Split the original text into lines
+      original_lines = original_text.splitlines()
+
+      # Process line by line
+      line_numbers = []
+      line_map = {}
+
+      # Find the chunk text in the original document
+      try:
+        # Simple approach: try to find exact chunk in text
+        start_char_index = original_text.find(node_text)
+
+        if start_char_index >= 0:
+          # If found directly, calculate line numbers
+          start_line = original_text.count('\n', 0, start_char_index) + 1
+          end_char_index = start_char_index + len(node_text)
+          end_line = original_text.count('\n', 0, end_char_index) + 1
+
+          # Generate line numbers and map
+          for i in range(start_line, end_line + 1):
+            line_numbers.append(i)
+            # Use 1-indexed for line numbers
+            if i - 1 < len(original_lines):
+              line_map[i] = original_lines[i - 1]
+        else:
+          # Fallback: check line by line for partial matches
+          node_sentences = [s.strip() for s in node_text.split('.') if s.strip()]
+
+          for i, line in enumerate(original_lines):
+            line_num = i + 1  # 1-indexed
+
+            # Skip empty lines if configured
+            if not line.strip() and not self.include_whitespace:
+              continue
+
+            # Direct match
+            if line.strip() in node_text or any(sent in line for sent in node_sentences):
+              line_numbers.append(line_num)
+              line_map[line_num] = line
+      except Exception as e:
+        logger.error('Error extracting line numbers for node %s: %s', getattr(node, 'node_id', 'unknown'), e)
+        # Continue with partial results if any
+
+      # Update metadata with line information
+      if line_numbers:
+        node.metadata['line_numbers'] = line_numbers
+        node.metadata['start_line'] = min(line_numbers)
+        node.metadata['end_line'] = max(line_numbers)
+        node.metadata['line_map'] = line_map
+      else:
+        # Default values
+        node.metadata['line_numbers'] = []
+        node.metadata['start_line'] = -1
+        node.metadata['end_line'] = -1
+        node.metadata['line_map'] = {}
+
+    return nodes
+
+  # For compatibility with llama_index BaseExtractor
+  def extract(self, nodes, **kwargs):
+    """Extract line metadata as BaseExtractor interface.
+
+    This is for compatibility with the BaseExtractor interface in llama_index,
+    which might be used alongside this component.
+    """
+    # Process nodes using the __call__ method
+    self.__call__(nodes, **kwargs)
+
+    # Return metadata in the format expected by BaseExtractor
+    metadata_list = []
+    for node in nodes:
+      if hasattr(node, 'metadata'):
+        metadata_list.append({
+          'line_numbers': node.metadata.get('line_numbers', []),
+          'start_line': node.metadata.get('start_line', -1),
+          'end_line': node.metadata.get('end_line', -1),
+          'line_map': node.metadata.get('line_map', {}),
+        })
+      else:
+        metadata_list.append({})
+
+    return metadata_list
+
+
+def essay_document(essay: EssayRequest) -> Document:
+  # The full essay is only kept in metadata for line number extraction, it is never embedded nor sent to the LLM
+  excluded = ['content', 'line_map', 'line_numbers']
+  return Document(
+    text=essay.content,
+    doc_id=essay.file_id,
+    metadata=essay.model_dump(include={'vault_id', 'file_id', 'content'}),
+    excluded_embed_metadata_keys=excluded,
+    excluded_llm_metadata_keys=excluded,
+  )
+
+
+class Ingestion:
+  """All stages of the essays ingestion, with one full pipeline per chunker mode."""
+
+  def __init__(
+    self,
+    *,
+    llm: Upstream,
+    embed: Upstream,
+    llm_model_id: str,
+    embed_model_id: str,
+    title_mode: TitleMode,
+    temperature: float,
+    max_tokens: int,
+    scheduler: AdmissionScheduler | None = None,
+  ):
+    # reuse the gateway's shared connection pools for the embedding engine
+    self.embed_model = OpenAIEmbedding(
+      api_key='dummy',
+      model_name=embed_model_id,
+      api_base=f'{embed.base_url}/v1',
+      dimensions=None,
+      default_headers=embed.headers,
+      http_client=embed.http,
+      async_http_client=embed.ahttp,
+    )
+
+    # The splitter already embeds every sentence group to find breakpoints, so we pool those vectors into
+    # chunk embeddings instead of sending each chunk back to the embedding engine.
+    # The markdown structure chunker runs purely on CPU, for already well-structured vault content.
+    self.chunkers: dict[ChunkerMode, TransformComponent] = {
+      'semantic': PooledSemanticSplitterNodeParser(
+        buffer_size=1, breakpoint_percentile_threshold=70, embed_model=self.embed_model
+      ),
+      'markdown': MarkdownStructureNodeParser(chunk_size=512),
+    }
+
+    # Create our line number metadata extractor
+    self.line_extractor = LineNumberMetadataExtractor(include_whitespace=True)
+
+    # Title all chunks of an essay in one guided_json request (or heuristically with TITLE_MODE=heuristic)
+    self.title_extractor = BatchTitleExtractor(
+      mode=title_mode,
+      client=llm.openai,
+      aclient=llm.aopenai,
+      scheduler=scheduler,
+      model=llm_model_id,
+      temperature=temperature,
+      max_tokens=max_tokens,
+    )
+
+    # Embed chunks that don't already carry a pooled embedding
+    self.chunk_embedder = EmbedMissingTransform(embed_model=self.embed_model)
+
+    # Set up the full ingestion pipelines with all components, one per chunker mode
+    self.pipelines: dict[ChunkerMode, IngestionPipeline] = {
+      mode: IngestionPipeline(
+        transformations=[
+          chunker,  # First split into chunks
+          self.line_extractor,  # Then extract line numbers for each chunk
+          self.title_extractor,  # Then generate titles for each chunk
+          self.chunk_embedder,  # Finally generate embeddings
+        ]
+      )
+      for mode, chunker in self.chunkers.items()
+    }
+
+  @staticmethod
+  def document(essay: EssayRequest) -> Document:
+    """``essay_document``, for the gateway which only reaches this module once it is imported off the event loop."""
+    return essay_document(essay)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import collections, contextvars, dataclasses, datetime, logging, sys, threading, time, typing as t
+
+from libs.protocol import RequestTimeline, SlowRequestStats, StageSpan
+
+if t.TYPE_CHECKING:
+  from types import FrameType
+
+  from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger('bentoml.service')
+
+MAX_SPANS = 512
+
+
+@dataclasses.dataclass
+class Timeline:
+  """Stages of one request, as ``(stage, start, end)`` in ``time.perf_counter`` seconds."""
+
+  method: str
+  path: str
+  start: float = dataclasses.field(default_factory=time.perf_counter)
+  started_at: float = dataclasses.field(default_factory=time.time)
+  spans: list[tuple[str, float, float]] = dataclasses.field(default_factory=list)
+  dropped: int = 0
+  status: int = 0
+
+  def add(self, stage: str, start: float, end: float) -> None:
+    # a large essay has a span per batch of titles and embeddings, so very long requests only keep the first ones
+    if len(self.spans) >= MAX_SPANS:
+      self.dropped += 1
+    else:
+      self.spans.append((stage, start, end))
+
+  def summary(self, end: float) -> RequestTimeline:
+    stages: collections.Counter[str] = collections.Counter()
+    for stage, start, stop in self.spans:
+      stages[stage] += stop - start
+    return RequestTimeline(
+      method=self.method,
+      path=self.path,
+      status=self.status,
+      started_at=datetime.datetime.fromtimestamp(self.started_at, tz=datetime.timezone.utc).isoformat(),
+      duration_ms=round((end - self.start) * 1000, 2),
+      stages_ms={stage: round(total * 1000, 2) for stage, total in stages.most_common()},
+      spans=[
+        StageSpan(
+          stage=stage, start_ms=round((start - self.start) * 1000, 2), duration_ms=round((stop - start) * 1000, 2)
+        )
+        for stage, start, stop in self.spans
+      ],
+      dropped_spans=self.dropped,
+    )
+
+
+# set by TimelineMiddleware for every request, and copied into the ingest worker threads
+TIMELINE: contextvars.ContextVar[Timeline | None] = contextvars.ContextVar('timeline', default=None)
+
+
+def record_span(stage: str, start: float, end: float | None = None) -> None:
+  """Add a stage to the timeline of the current request, if any."""
+  if (timeline := TIMELINE.get()) is not None:
+    timeline.add(stage, start, time.perf_counter() if end is None else end)
+
+
+class SlowRequests:
+  """Ring buffer of the timelines of the last ``maxsize`` requests that took at least ``threshold_s``."""
+
+  def __init__(self, *, threshold_s: float, maxsize: int = 64):
+    self.threshold_s = threshold_s
+    self.captured = 0
+    self._timelines: collections.deque[RequestTimeline] = collections.deque(maxlen=maxsize)
+
+  @property
+  def enabled(self) -> bool:
+    return self.threshold_s > 0 and self._timelines.maxlen != 0
+
+  def add(self, timeline: Timeline, end: float) -> None:
+    if end - timeline.start >= self.threshold_s:
+      self.captured += 1
+      self._timelines.append(timeline.summary(end))
+
+  def stats(self) -> SlowRequestStats:
+    return SlowRequestStats(
+      threshold_s=self.threshold_s, captured=self.captured, timelines=list(reversed(self._timelines))
+    )
+
+
+class TimelineMiddleware:
+  """ASGI middleware tracking the stage timeline of every request, and keeping the slow ones in ``recorder``.
+
+  Background tasks (``/*/submit``) run before the ASGI call returns, so their timelines cover the whole task.
+  """
+
+  def __init__(self, app: ASGIApp, *, recorder: SlowRequests, exclude_paths: t.Collection[str] = ()):
+    self.app = app
+    self.recorder = recorder
+    self.exclude_paths = frozenset(exclude_paths)
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope['type'] != 'http' or scope['path'] in self.exclude_paths:
+      return await self.app(scope, receive, send)
+    timeline = Timeline(scope['method'], scope['path'])
+
+    async def send_status(message: Message) -> None:
+      if message['type'] == 'http.response.start':
+        timeline.status = message['status']
+      await send(message)
+
+    token = TIMELINE.set(timeline)
+    try:
+      await self.app(scope, receive, send_status)
+    finally:
+      TIMELINE.reset(token)
+      self.recorder.add(timeline, time.perf_counter())
+
+
+class ProfilerBusyError(RuntimeError):
+  pass
+
+
+class SamplingProfiler:
+  """Samples the Python stack of every thread of this process, only while ``profile`` runs.
+
+  Profiles are returned as collapsed stacks (``thread;outer;...;inner <samples>`` per line), the input of
+  flamegraph.pl, inferno and speedscope. Sampling holds the GIL for one stack walk every ``interval_s``, so the
+  overhead on the profiled process stays at a few percent, and nothing runs between profiles.
+  """
+
+  def __init__(self, *, interval_s: float = 0.01):
+    self.interval_s = interval_s
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def _frame(frame: FrameType) -> str:
+    code = frame.f_code
+    # paths relative to site-packages, the rest are this service's own modules
+    return f'{code.co_qualname} ({code.co_filename.rpartition("site-packages/")[2]}:{frame.f_lineno})'
+
+  def _stack(self, thread: str, frame: FrameType | None) -> str:
+    frames = []
+    while frame is not None:
+      frames.append(self._frame(frame))
+      frame = frame.f_back
+    return ';'.join([thread, *reversed(frames)])
+
+  def _sample(self, counts: collections.Counter[str], current: int) -> None:
+    # the frames are only referenced in here, so they are not kept alive while sleeping
+    names = {it.ident: it.name for it in threading.enumerate()}
+    for ident, frame in sys._current_frames().items():
+      if ident != current:
+        counts[self._stack(names.get(ident, str(ident)), frame)] += 1
+
+  def profile(self, seconds: float) -> str:
+    """Sample for ``seconds`` in the calling thread, which is left out of the profile."""
+    if not self._lock.acquire(blocking=False):
+      raise ProfilerBusyError('A profile is already running')
+    try:
+      counts: collections.Counter[str] = collections.Counter()
+      current, samples = threading.get_ident(), 0
+      deadline = time.monotonic() + seconds
+      while time.monotonic() < deadline:
+        self._sample(counts, current)
+        samples += 1
+        time.sleep(self.interval_s)
+      logger.info('Profiled %d samples over %.1fs', samples, seconds)
+      return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+    finally:
+      self._lock.release()
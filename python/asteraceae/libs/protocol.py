@@ -5,14 +5,21 @@ import pydantic
 
 from openai.types.completion_usage import CompletionUsage
 from openai.types.create_embedding_response import Usage as EmbeddingUsage
-from llama_index.core.schema import EnumNameSerializer, NodeRelationship, RelatedNodeType, TransformComponent
 
+# NOTE: This module is imported by the API gateway at startup, so keep it free of heavy dependencies
+# (vllm, torch, llama_index). llama_index types are only referenced for type checking.
 if t.TYPE_CHECKING:
   from llama_index.core.schema import BaseNode
   from _bentoml_sdk.images import Image
   from _bentoml_sdk.service.config import TrafficSchema, TracingSchema, ResourceSchema, HTTPSchema
 
 TaskType = t.Literal['generate', 'embed']
+TitleMode = t.Literal['llm', 'heuristic']
+TonalityMode = t.Literal['prompt', 'steering']
+RouteTask = t.Literal['suggests', 'authors']
+ChunkerMode = t.Literal['semantic', 'markdown']
+EssayFormat = t.Literal['legacy', 'compact']
+CircuitState = t.Literal['closed', 'open', 'half_open']
 EmbedType = t.Literal['gte-qwen', 'gte-qwen-fast', 'gte-modernbert']
 ModelType = t.Literal['r1-qwen', 'r1-qwen-small', 'r1-qwen-tiny', 'r1-qwen-fast', 'r1-llama', 'r1-llama-small', 'qwq']
 
@@ -23,6 +30,24 @@ def random_uuid() -> str:
   return str(uuid.uuid4().hex)
 
 
+def _dump_embedding(
+  value: list[float], handler: pydantic.SerializerFunctionWrapHandler, info: pydantic.SerializationInfo
+) -> t.Any:
+  # libs.codec dumps with this context, and serializes the float32 buffer instead of a list of Python floats
+  if isinstance(info.context, dict) and info.context.get('ndarray'):
+    import numpy as np
+
+    return np.asarray(value, dtype=np.float32)
+  return handler(value)
+
+
+Embedding = t.Annotated[
+  list[float],
+  pydantic.WrapSerializer(_dump_embedding),
+  pydantic.WithJsonSchema({'type': 'array', 'items': {'type': 'number'}}, mode='serialization'),
+]
+
+
 class ModelForCausalLM(t.TypedDict):
   model_id: str
   structured_output_backend: str
@@ -41,6 +66,12 @@ class ModelForClassification(t.TypedDict):
   resources: ResourceSchema
 
 
+class PriorityClass(t.TypedDict):
+  priority: int  # lower is admitted first
+  max_concurrency: int
+  queue_slo_s: float
+
+
 class ServiceOpts(t.TypedDict, total=False):
   name: str
   image: Image
@@ -152,34 +183,113 @@ class EssayRequest(pydantic.BaseModel):
   vault_id: str
   file_id: str
   content: str
+  chunker: t.Optional[ChunkerMode] = pydantic.Field(
+    default=None, description='Chunking strategy for this essay, defaults to the server-side CHUNKER'
+  )
+  format: EssayFormat = pydantic.Field(
+    default='legacy',
+    description="'compact' returns offsets and line ranges per node instead of the full metadata and line_map",
+  )
 
 
 class EssayNode(pydantic.BaseModel):
-  embedding: list[float] | None
+  embedding: Embedding | None
   node_id: str
   metadata: dict[str, t.Any]
-  relationships: dict[t.Annotated[NodeRelationship, EnumNameSerializer], RelatedNodeType]
+  relationships: dict[str, t.Union[dict[str, t.Any], list[dict[str, t.Any]]]] = pydantic.Field(
+    description="llama_index NodeRelationship value ('1' for SOURCE, '2' for PREVIOUS, ...) to the related node info"
+  )
   metadata_separator: str
 
+  @classmethod
+  def from_node(cls, node: BaseNode) -> EssayNode:
+    return cls(
+      embedding=node.embedding,
+      node_id=node.node_id,
+      metadata=node.metadata,
+      relationships={
+        relation.value: [it.model_dump(mode='json') for it in related]
+        if isinstance(related, list)
+        else related.model_dump(mode='json')
+        for relation, related in node.relationships.items()
+      },
+      metadata_separator=node.metadata_separator,
+    )
+
+
+class CompactEssayNode(pydantic.BaseModel):
+  embedding: Embedding | None
+  node_id: str
+  start_char_idx: int | None = None
+  end_char_idx: int | None = None
+  start_line: int = -1
+  end_line: int = -1
+  title: str = ''
+  relationships: dict[str, str] = pydantic.Field(
+    default_factory=dict,
+    description="llama_index NodeRelationship value ('1' for SOURCE, '2' for PREVIOUS, ...) to the related node id, "
+    'keyed as in the legacy format',
+  )
+
+  @classmethod
+  def from_node(cls, node: BaseNode) -> CompactEssayNode:
+    return cls(
+      embedding=node.embedding,
+      node_id=node.node_id,
+      start_char_idx=node.start_char_idx,
+      end_char_idx=node.end_char_idx,
+      start_line=node.metadata.get('start_line', -1),
+      end_line=node.metadata.get('end_line', -1),
+      title=node.metadata.get('document_title', ''),
+      relationships={
+        relation.value: related.node_id
+        for relation, related in node.relationships.items()
+        if not isinstance(related, list)
+      },
+    )
+
 
 class EssayResponse(pydantic.BaseModel):
   vault_id: str
   file_id: str
-  nodes: list[EssayNode]
+  nodes: list[t.Union[EssayNode, CompactEssayNode]]
   error: str = ''
+  format: EssayFormat = 'legacy'
+  metadata: dict[str, t.Any] = pydantic.Field(
+    default_factory=dict, description='Essay-level metadata, shared by all nodes in the compact format'
+  )
+
+
+class EssayNodeFrame(pydantic.BaseModel):
+  type: t.Literal['node'] = 'node'
+  node: t.Union[EssayNode, CompactEssayNode]
+
+
+class EssaySummaryFrame(pydantic.BaseModel):
+  type: t.Literal['summary'] = 'summary'
+  vault_id: str
+  file_id: str
+  num_nodes: int = 0
+  elapsed_ms: float = 0.0
+  error: str = ''
+  format: EssayFormat = 'legacy'
+  metadata: dict[str, t.Any] = pydantic.Field(default_factory=dict)
 
 
 class NotesResponse(pydantic.BaseModel):
   vault_id: str
   file_id: str
   note_id: str
-  embedding: list[float]
+  embedding: Embedding
   error: str = ''
   usage: EmbeddingUsage = pydantic.Field(default_factory=lambda: EmbeddingUsage(prompt_tokens=0, total_tokens=0))
 
 
 class HealthRequest(pydantic.BaseModel):
-  timeout: int = 30
+  timeout: int = pydantic.Field(
+    default=30,
+    description='Unused, health is served from the background prober, which times out after HEALTH_INTERVAL_S',
+  )
 
 
 class DependentStatus(pydantic.BaseModel):
@@ -187,6 +297,9 @@ class DependentStatus(pydantic.BaseModel):
   healthy: bool = pydantic.Field(default=False)
   latency_ms: float = pydantic.Field(default=0.0)
   error: str = pydantic.Field(default='')
+  circuit: CircuitState = 'closed'
+  consecutive_failures: int = 0
+  checked_at: t.Optional[str] = None
 
 
 class HealthResponse(pydantic.BaseModel):
@@ -195,6 +308,81 @@ class HealthResponse(pydantic.BaseModel):
   timestamp: str
 
 
+class WorkerPoolStats(pydantic.BaseModel):
+  name: str
+  max_workers: int
+  active: int
+  queue_depth: int
+  queued: dict[str, int] = pydantic.Field(default_factory=dict, description='Number of waiting jobs per vault')
+  completed: int = 0
+  avg_wait_ms: float = 0.0
+
+
+class PriorityClassStats(pydantic.BaseModel):
+  in_flight: int = 0
+  queued: int = 0
+  admitted: int = 0
+  slo_violations: int = pydantic.Field(default=0, description='Admissions that waited longer than the queue SLO')
+  avg_wait_ms: float = 0.0
+
+
+class SchedulerStats(pydantic.BaseModel):
+  capacity: int
+  in_flight: int
+  classes: dict[str, PriorityClassStats]
+
+
+class LimiterStats(pydantic.BaseModel):
+  limit: float
+  in_flight: int
+  accepted: int
+  rejected: int
+  latency_ewma_ms: t.Optional[float] = None
+  engine_waiting: t.Optional[int] = None
+  engine_running: t.Optional[int] = None
+
+
+class StageSpan(pydantic.BaseModel):
+  stage: str
+  start_ms: float = pydantic.Field(description='Offset from the start of the request')
+  duration_ms: float
+
+
+class RequestTimeline(pydantic.BaseModel):
+  method: str
+  path: str
+  status: int
+  started_at: str
+  duration_ms: float
+  stages_ms: dict[str, float] = pydantic.Field(default_factory=dict, description='Total time per stage, slowest first')
+  spans: list[StageSpan] = pydantic.Field(default_factory=list)
+  dropped_spans: int = 0
+
+
+class SlowRequestStats(pydantic.BaseModel):
+  threshold_s: float
+  captured: int = pydantic.Field(default=0, description='Requests over the threshold since startup')
+  timelines: list[RequestTimeline] = pydantic.Field(default_factory=list, description='The most recent first')
+
+
+class LLMTier(pydantic.BaseModel):
+  """An extra LLM engine deployment the gateway routes to, see ``LLM_TIERS``."""
+
+  model: ModelType
+  url: t.Optional[str] = None
+  deployment: t.Optional[str] = None
+  max_chars: t.Optional[int] = pydantic.Field(
+    default=None, description='Longest excerpt routed to this tier, unbounded if unset'
+  )
+  tasks: list[RouteTask] = pydantic.Field(default_factory=lambda: ['suggests', 'authors'])
+
+  @pydantic.model_validator(mode='after')
+  def check_endpoint(self) -> LLMTier:
+    if (self.url is None) == (self.deployment is None):
+      raise ValueError('exactly one of url or deployment must be set')
+    return self
+
+
 class LLMInfo(pydantic.BaseModel):
   model_id: str
   model_type: str
@@ -211,6 +399,7 @@ class EmbedInfo(pydantic.BaseModel):
 
 class MetadataResponse(pydantic.BaseModel):
   llm: LLMInfo
+  tiers: list[LLMInfo] = pydantic.Field(default_factory=list)
   embed: EmbedInfo
 
 
@@ -239,6 +428,15 @@ class Authors(AuthorSchema):
   queries: t.Optional[list[str]] = pydantic.Field(description='Optional search queries', default=None)
 
 
+class ChunkTitle(pydantic.BaseModel):
+  index: int = pydantic.Field(description='Index of the chunk this title belongs to')
+  title: str = pydantic.Field(description='A short, descriptive title for the chunk')
+
+
+class ChunkTitlesSchema(pydantic.BaseModel):
+  titles: list[ChunkTitle] = pydantic.Field(description='One title per chunk, indexed by chunk position')
+
+
 class Tonality(pydantic.BaseModel):
   formal: float = 0
   fun: float = 0
@@ -250,140 +448,43 @@ class Tonality(pydantic.BaseModel):
   )
 
 
-class LineNumberMetadataExtractor(TransformComponent):
-  """Extracts line numbers from document content and adds them to node metadata.
-
-  This extractor assigns line numbers to each line in the document,
-  preserving whitespace, and ensures this information is available
-  in the node metadata after semantic chunking.
-  """
-
-  include_whitespace: bool = True
-
-  def __call__(self, nodes: list[BaseNode], **kwargs: t.Any) -> list[BaseNode]:
-    """Process nodes to add line number metadata.
-
-    For each node, this adds:
-    - line_numbers: List of line numbers contained in this node
-    - start_line: First line number in this node
-    - end_line: Last line number in this node
-    - line_map: Dictionary mapping line numbers to line content
-
-    Args:
-        nodes: The list of nodes to extract metadata from
-
-    Returns:
-        The same list of nodes with updated metadata
-    """
-    for node in nodes:
-      if not hasattr(node, 'metadata'):
-        continue
-
-      # Get the original text - either from metadata or by looking at source node
-      original_text = None
-
-      # First check if we stored original_text in metadata during document creation
-      if 'content' in node.metadata:
-        original_text = node.metadata['content']
-      # Then check source_node for Document-derived nodes
-      elif hasattr(node, 'source_node') and node.source_node and hasattr(node.source_node, 'text'):
-        original_text = node.source_node.text
-      # Or check if this is actually a Document
-      elif hasattr(node, 'text'):
-        original_text = node.text
-
-      if not original_text:
-        logger.warning(
-          'No original text found for node %s, skipping line number extraction', getattr(node, 'node_id', 'unknown')
-        )
-        continue
-
-      # Get the content of this node
-      node_text = node.get_content() if hasattr(node, 'get_content') else getattr(node, 'text', '')
-      node_text = node_text.strip()  # Strip for better matching
-
-      if not node_text:
-        continue
-
-      # Split the original text into lines
-      original_lines = original_text.splitlines()
-
-      # Process line by line
-      line_numbers = []
-      line_map = {}
-
-      # Find the chunk text in the original document
-      try:
-        # Simple approach: try to find exact chunk in text
-        start_char_index = original_text.find(node_text)
-
-        if start_char_index >= 0:
-          # If found directly, calculate line numbers
-          start_line = original_text.count('\n', 0, start_char_index) + 1
-          end_char_index = start_char_index + len(node_text)
-          end_line = original_text.count('\n', 0, end_char_index) + 1
-
-          # Generate line numbers and map
-          for i in range(start_line, end_line + 1):
-            line_numbers.append(i)
-            # Use 1-indexed for line numbers
-            if i - 1 < len(original_lines):
-              line_map[i] = original_lines[i - 1]
-        else:
-          # Fallback: check line by line for partial matches
-          node_sentences = [s.strip() for s in node_text.split('.') if s.strip()]
-
-          for i, line in enumerate(original_lines):
-            line_num = i + 1  # 1-indexed
-
-            # Skip empty lines if configured
-            if not line.strip() and not self.include_whitespace:
-              continue
-
-            # Direct match
-            if line.strip() in node_text or any(sent in line for sent in node_sentences):
-              line_numbers.append(line_num)
-              line_map[line_num] = line
-      except Exception as e:
-        logger.error('Error extracting line numbers for node %s: %s', getattr(node, 'node_id', 'unknown'), e)
-        # Continue with partial results if any
-
-      # Update metadata with line information
-      if line_numbers:
-        node.metadata['line_numbers'] = line_numbers
-        node.metadata['start_line'] = min(line_numbers)
-        node.metadata['end_line'] = max(line_numbers)
-        node.metadata['line_map'] = line_map
-      else:
-        # Default values
-        node.metadata['line_numbers'] = []
-        node.metadata['start_line'] = -1
-        node.metadata['end_line'] = -1
-        node.metadata['line_map'] = {}
-
-    return nodes
-
-  # For compatibility with llama_index BaseExtractor
-  def extract(self, nodes, **kwargs):
-    """Extract line metadata as BaseExtractor interface.
-
-    This is for compatibility with the BaseExtractor interface in llama_index,
-    which might be used alongside this component.
-    """
-    # Process nodes using the __call__ method
-    self.__call__(nodes, **kwargs)
-
-    # Return metadata in the format expected by BaseExtractor
-    metadata_list = []
-    for node in nodes:
-      if hasattr(node, 'metadata'):
-        metadata_list.append({
-          'line_numbers': node.metadata.get('line_numbers', []),
-          'start_line': node.metadata.get('start_line', -1),
-          'end_line': node.metadata.get('end_line', -1),
-          'line_map': node.metadata.get('line_map', {}),
-        })
-      else:
-        metadata_list.append({})
-
-    return metadata_list
+# Lightweight mirrors of the vLLM OpenAI-compatible protocol, for the gateway's proxy endpoints.
+# The gateway only forwards these payloads, so unknown fields are kept as-is.
+class ChatCompletionRequest(pydantic.BaseModel):
+  model: str = ''
+  messages: list[dict[str, t.Any]]
+  stream: bool = False
+
+  model_config = pydantic.ConfigDict(extra='allow')
+
+
+class EmbeddingCompletionRequest(pydantic.BaseModel):
+  model: str = ''
+  input: t.Union[str, list[str], list[int], list[list[int]]]
+
+  model_config = pydantic.ConfigDict(extra='allow')
+
+
+class ModelCard(pydantic.BaseModel):
+  id: str
+  object: str = 'model'
+  created: int = 0
+  owned_by: str = 'vllm'
+  root: t.Optional[str] = None
+  parent: t.Optional[str] = None
+  max_model_len: t.Optional[int] = None
+
+  model_config = pydantic.ConfigDict(extra='allow')
+
+
+class ModelList(pydantic.BaseModel):
+  object: str = 'list'
+  data: list[ModelCard] = pydantic.Field(default_factory=list)
+
+
+class ErrorResponse(pydantic.BaseModel):
+  object: str = 'error'
+  message: str
+  type: str
+  param: t.Optional[str] = None
+  code: int
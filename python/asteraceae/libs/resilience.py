@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio, collections, contextvars, logging, math, time, typing as t
+
+from libs.protocol import ErrorResponse
+
+if t.TYPE_CHECKING:
+  from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger('bentoml.service')
+
+T = t.TypeVar('T')
+
+DEADLINE_HEADER = 'x-request-timeout'
+# absolute deadline of the current request on the event loop clock (``time.monotonic``), if the client set one
+DEADLINE: contextvars.ContextVar[float | None] = contextvars.ContextVar('deadline', default=None)
+
+
+def remaining() -> float | None:
+  """Seconds left before the current request's deadline, or None without a deadline."""
+  if (deadline := DEADLINE.get()) is None:
+    return None
+  return max(0.0, deadline - time.monotonic())
+
+
+def within_deadline() -> asyncio.Timeout:
+  """Cancel the enclosed upstream call with ``TimeoutError`` once the request deadline passes."""
+  return asyncio.timeout_at(DEADLINE.get())
+
+
+class DeadlineMiddleware:
+  """Reads the client's ``X-Request-Timeout`` (in seconds) into ``DEADLINE`` for every upstream call it makes.
+
+  ``exclude_paths`` (task submissions) outlive the request that created them, so they never inherit a deadline.
+  """
+
+  def __init__(self, app: ASGIApp, *, exclude_paths: t.Collection[str] = ()):
+    self.app = app
+    self.exclude_paths = frozenset(exclude_paths)
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope['type'] != 'http' or scope['path'] in self.exclude_paths:
+      return await self.app(scope, receive, send)
+    value = next((v.decode() for k, v in scope['headers'] if k == DEADLINE_HEADER.encode()), None)
+    try:
+      timeout = float(value) if value is not None else None
+    except ValueError:
+      timeout = None
+    if timeout is None or not math.isfinite(timeout):
+      return await self.app(scope, receive, send)
+    if timeout <= 0:
+      body = ErrorResponse(message='Request deadline already exceeded', type='DeadlineExceeded', code=504)
+      await send({'type': 'http.response.start', 'status': 504, 'headers': [(b'content-type', b'application/json')]})
+      await send({'type': 'http.response.body', 'body': body.model_dump_json().encode()})
+      return
+    token = DEADLINE.set(time.monotonic() + timeout)
+    try:
+      await self.app(scope, receive, send)
+    finally:
+      DEADLINE.reset(token)
+
+
+class RetryBudget:
+  """Caps retries and hedges to ``ratio`` of the calls made in the last ``ttl_s``, plus ``min_per_s`` retries.
+
+  This keeps retry amplification bounded when an upstream is slow for everyone, not just for one request.
+  """
+
+  def __init__(self, *, ratio: float = 0.1, min_per_s: float = 1.0, ttl_s: float = 10.0):
+    self.ratio, self.min_per_s, self.ttl_s = ratio, min_per_s, ttl_s
+    self._calls: collections.deque[float] = collections.deque()
+    self._retries: collections.deque[float] = collections.deque()
+    self.exhausted = 0
+
+  def _expire(self, now: float) -> None:
+    for it in (self._calls, self._retries):
+      while it and now - it[0] > self.ttl_s:
+        it.popleft()
+
+  def deposit(self) -> None:
+    self._calls.append(time.monotonic())
+
+  def try_withdraw(self) -> bool:
+    now = time.monotonic()
+    self._expire(now)
+    if len(self._retries) >= self.min_per_s * self.ttl_s + self.ratio * len(self._calls):
+      self.exhausted += 1
+      return False
+    self._retries.append(now)
+    return True
+
+
+class Hedger:
+  """Runs short idempotent upstream calls with hedging and retries, within the request deadline.
+
+  A second attempt is started when the first one has not finished after the ``quantile`` latency of recent
+  successful calls, or right away when it fails. Either way the extra attempt is paid from ``budget``, and the
+  first successful attempt wins while the others are cancelled.
+  """
+
+  def __init__(
+    self,
+    budget: RetryBudget,
+    *,
+    quantile: float = 0.95,
+    max_attempts: int = 2,
+    min_delay_s: float = 0.005,
+    initial_delay_s: float = 1.0,
+    window: int = 256,
+  ):
+    self.budget = budget
+    self.quantile = quantile
+    self.max_attempts = max_attempts
+    self.min_delay_s = min_delay_s
+    self.initial_delay_s = initial_delay_s
+    self._latencies: collections.deque[float] = collections.deque(maxlen=window)
+    self.hedged = 0
+    self.retried = 0
+
+  def delay(self) -> float:
+    if len(self._latencies) < 16:
+      return self.initial_delay_s
+    ordered = sorted(self._latencies)
+    return max(self.min_delay_s, ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))])
+
+  async def run(self, fn: t.Callable[[], t.Awaitable[T]]) -> T:
+    self.budget.deposit()
+    async with within_deadline():
+      return await self._run(fn)
+
+  async def _run(self, fn: t.Callable[[], t.Awaitable[T]]) -> T:
+    async def attempt() -> tuple[T, float]:
+      start = time.monotonic()
+      result = await fn()
+      return result, time.monotonic() - start
+
+    pending = {asyncio.ensure_future(attempt())}
+    launched, error, refused = 1, None, False
+    try:
+      while pending:
+        # once the budget refuses, the rest of the call just waits on the attempts in flight
+        can_launch = launched < self.max_attempts and not refused
+        done, pending = await asyncio.wait(
+          pending, timeout=self.delay() if can_launch else None, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in done:
+          if (exc := task.exception()) is None:
+            result, latency = task.result()
+            self._latencies.append(latency)
+            return result
+          error = exc
+        if not can_launch:
+          continue
+        if not self.budget.try_withdraw():
+          refused = True
+          continue
+        if done:
+          self.retried += 1
+          logger.debug('Retrying upstream call after error: %s', error)
+        else:
+          self.hedged += 1
+        pending.add(asyncio.ensure_future(attempt()))
+        launched += 1
+      assert error is not None
+      raise error
+    finally:
+      for task in pending:
+        task.cancel()
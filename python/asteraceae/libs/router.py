@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import dataclasses, logging, typing as t
+
+from libs.metrics import CASCADE_ESCALATIONS, ROUTED_REQUESTS
+
+if t.TYPE_CHECKING:
+  from libs.protocol import RouteTask
+
+logger = logging.getLogger('bentoml.service')
+
+T = t.TypeVar('T')
+
+
+@dataclasses.dataclass(frozen=True)
+class ModelTier:
+  """One LLM engine deployment the gateway can route to."""
+
+  name: str
+  model_id: str
+  llm: t.Any  # the LLM service, or its RemoteProxy
+  upstream: t.Any  # libs.transport.Upstream of the engine, for the OpenAI endpoints
+  max_chars: int | None = None  # longest excerpt routed here, None for any length
+  tasks: frozenset[str] = frozenset({'suggests', 'authors'})
+
+  def accepts(self, task: RouteTask, num_chars: int) -> bool:
+    return task in self.tasks and (self.max_chars is None or num_chars <= self.max_chars)
+
+
+class ModelRouter:
+  """Picks a model tier per request from its task, excerpt length and latency SLO.
+
+  Extra tiers are ordered from the smallest excerpt budget up, and the first one that accepts the request wins;
+  requests that fit none go to the ``default`` tier, i.e. this deployment's ``LLM``. Requests with less than
+  ``fast_slo_s`` left on their deadline go to the first tier of their task regardless of length. With ``cascade``,
+  the default tier is appended as a fallback for when the small model's guided output fails validation.
+  """
+
+  def __init__(
+    self, tiers: t.Sequence[ModelTier], default: ModelTier, *, fast_slo_s: float = 0, cascade: bool = False
+  ):
+    self.tiers = sorted(tiers, key=lambda it: float('inf') if it.max_chars is None else it.max_chars)
+    self.default = default
+    self.fast_slo_s = fast_slo_s
+    self.cascade = cascade
+
+  @property
+  def enabled(self) -> bool:
+    return bool(self.tiers)
+
+  def route(self, task: RouteTask, *, num_chars: int, slo_s: float | None = None) -> list[ModelTier]:
+    """Tiers to try, in order: the chosen one, then the default tier when cascading."""
+    tier = self.default
+    if slo_s is not None and slo_s < self.fast_slo_s:
+      tier = next((it for it in self.tiers if task in it.tasks), tier)
+    else:
+      tier = next((it for it in self.tiers if it.accepts(task, num_chars)), tier)
+    ROUTED_REQUESTS.labels(task=task, tier=tier.name).inc()
+    return [tier, self.default] if self.cascade and tier is not self.default else [tier]
+
+
+async def cascade(
+  task: RouteTask,
+  tiers: t.Sequence[ModelTier],
+  stream: t.Callable[[ModelTier], t.AsyncIterator[T]],
+  valid: t.Callable[[list[T]], bool],
+  commit: t.Callable[[list[T]], bool] | None = None,
+) -> t.AsyncGenerator[T, None]:
+  """Stream from the first tier whose output is ``valid``.
+
+  Every tier but the last is buffered, and escalates to the next one if its output is invalid or it fails. With
+  ``commit``, the buffer is flushed as soon as ``commit`` accepts the output so far (e.g. its first complete item
+  validates), and the rest of that tier is streamed without escalating, which keeps the time to first token of
+  streaming responses. The last tier is streamed as-is.
+  """
+  *small, last = tiers
+  for tier in small:
+    chunks: list[T] = []
+    committed = False
+    try:
+      async for chunk in stream(tier):
+        if committed:
+          yield chunk
+          continue
+        chunks.append(chunk)
+        if commit is not None and commit(chunks):
+          committed = True
+          for it in chunks:
+            yield it
+    except Exception as e:
+      if committed:
+        raise
+      logger.warning('Escalating %s from %s, which failed: %s', task, tier.name, e)
+    else:
+      if committed:
+        return
+      if valid(chunks):
+        for chunk in chunks:
+          yield chunk
+        return
+      logger.info('Escalating %s from %s, its output failed validation', task, tier.name)
+    CASCADE_ESCALATIONS.labels(task=task, tier=tier.name).inc()
+  async for chunk in stream(last):
+    yield chunk
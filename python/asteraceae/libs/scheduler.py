@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio, collections, contextlib, time, typing as t
+
+from libs.metrics import QUEUE_WAIT_SECONDS
+from libs.profiling import record_span
+from libs.protocol import PriorityClassStats, SchedulerStats
+
+if t.TYPE_CHECKING:
+  from libs.protocol import PriorityClass
+
+
+class AdmissionScheduler:
+  """Gateway-side admission control in front of the LLM engine.
+
+  At most ``capacity`` requests are in flight on the engine, and at most ``max_concurrency`` of them per class.
+  When contended, a freed slot goes to the waiting class with the lowest ``priority`` value, unless a waiter of
+  another class has already exceeded its ``queue_slo_s``. Overdue waiters are admitted oldest first, so background
+  work is delayed by interactive traffic but never starved.
+  """
+
+  def __init__(self, capacity: int, classes: t.Mapping[str, PriorityClass]):
+    self.capacity = capacity
+    self.classes = dict(classes)
+    self._loop: asyncio.AbstractEventLoop | None = None
+    self._in_flight = dict.fromkeys(self.classes, 0)
+    self._waiters: dict[str, collections.deque[tuple[float, asyncio.Future[None]]]] = {
+      name: collections.deque() for name in self.classes
+    }
+    self._admitted = dict.fromkeys(self.classes, 0)
+    self._violations = dict.fromkeys(self.classes, 0)
+    self._wait_s = dict.fromkeys(self.classes, 0.0)
+
+  def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+    """Bind the event loop used by ``blocking_slot`` from worker threads."""
+    self._loop = loop
+
+  @property
+  def in_flight(self) -> int:
+    return sum(self._in_flight.values())
+
+  def stats(self) -> SchedulerStats:
+    return SchedulerStats(
+      capacity=self.capacity,
+      in_flight=self.in_flight,
+      classes={
+        name: PriorityClassStats(
+          in_flight=self._in_flight[name],
+          queued=len(self._waiters[name]),
+          admitted=self._admitted[name],
+          slo_violations=self._violations[name],
+          avg_wait_ms=round(self._wait_s[name] / self._admitted[name] * 1000, 2) if self._admitted[name] else 0.0,
+        )
+        for name in self.classes
+      },
+    )
+
+  def _admissible(self, name: str) -> bool:
+    return self.in_flight < self.capacity and self._in_flight[name] < self.classes[name]['max_concurrency']
+
+  def _admit(self, name: str, waited: float) -> None:
+    self._in_flight[name] += 1
+    self._admitted[name] += 1
+    self._wait_s[name] += waited
+    QUEUE_WAIT_SECONDS.labels(queue=name).observe(waited)
+    if waited > self.classes[name]['queue_slo_s']:
+      self._violations[name] += 1
+
+  def _next_class(self, now: float) -> str | None:
+    candidates = [name for name, queue in self._waiters.items() if queue and self._admissible(name)]
+    if not candidates:
+      return None
+    overdue = [name for name in candidates if now - self._waiters[name][0][0] > self.classes[name]['queue_slo_s']]
+    if overdue:
+      return min(overdue, key=lambda name: self._waiters[name][0][0])
+    return min(candidates, key=lambda name: (self.classes[name]['priority'], self._waiters[name][0][0]))
+
+  def _dispatch(self) -> None:
+    now = time.perf_counter()
+    while (name := self._next_class(now)) is not None:
+      enqueued_at, waiter = self._waiters[name].popleft()
+      if waiter.done():
+        continue
+      self._admit(name, now - enqueued_at)
+      waiter.set_result(None)
+
+  async def acquire(self, name: str) -> None:
+    if name not in self.classes:
+      raise ValueError(f'Unknown priority class {name!r}, expected one of {list(self.classes)}')
+    if not any(self._waiters.values()) and self._admissible(name):
+      self._admit(name, 0.0)
+      return
+    waiter = asyncio.get_running_loop().create_future()
+    self._waiters[name].append((time.perf_counter(), waiter))
+    self._dispatch()
+    try:
+      await waiter
+    except asyncio.CancelledError:
+      if waiter.done() and not waiter.cancelled():
+        self.release(name)
+      else:
+        self._waiters[name] = collections.deque(it for it in self._waiters[name] if it[1] is not waiter)
+      raise
+
+  def release(self, name: str) -> None:
+    self._in_flight[name] -= 1
+    self._dispatch()
+
+  @contextlib.asynccontextmanager
+  async def slot(self, name: str) -> t.AsyncIterator[None]:
+    queued_at = time.perf_counter()
+    await self.acquire(name)
+    record_span(f'queue_{name}', queued_at)
+    try:
+      yield
+    finally:
+      self.release(name)
+
+  @contextlib.contextmanager
+  def blocking_slot(self, name: str) -> t.Iterator[None]:
+    """Same as ``slot``, for worker threads. Must not be called from the event loop thread itself."""
+    if self._loop is None:
+      raise RuntimeError('AdmissionScheduler.bind() must be called before using blocking_slot')
+    loop = self._loop
+    asyncio.run_coroutine_threadsafe(self.acquire(name), loop).result()
+    try:
+      yield
+    finally:
+      loop.call_soon_threadsafe(self.release, name)
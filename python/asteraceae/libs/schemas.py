@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import asyncio, hashlib, json, logging, time, typing as t
+import pydantic
+
+from libs.metrics import CACHE_REQUESTS, STAGE_SECONDS
+from libs.protocol import AuthorSchema, Authors, ChunkTitlesSchema, SuggestionsSchema
+
+if t.TYPE_CHECKING:
+  from vllm.engine.protocol import EngineClient
+
+logger = logging.getLogger('bentoml.service')
+
+
+class GuidedSchemas:
+  """JSON schemas for guided decoding, serialized once per model and keyed by the hash of their JSON.
+
+  vLLM's xgrammar backend caches compiled grammars by the exact schema string it receives, so every request sends the
+  canonical string from here, and ``warm`` compiles all of them when the engine starts instead of during the first
+  request after every scale-from-zero. Requests for a schema that ``warm`` compiled count as ``hit`` under
+  ``morph_cache_requests{cache="grammars"}``, and the first request for any other one as ``miss``.
+  """
+
+  def __init__(self, models: t.Iterable[type[pydantic.BaseModel]]):
+    self.models = list(models)
+    self.schemas: dict[str, str] = {}
+    self._keys: dict[type[pydantic.BaseModel], str] = {}
+    self._compiled: set[str] | None = None
+
+  def key(self, model: type[pydantic.BaseModel]) -> str:
+    if (key := self._keys.get(model)) is not None:
+      return key
+    schema = json.dumps(model.model_json_schema(), separators=(',', ':'), sort_keys=True)
+    key = hashlib.sha256(schema.encode()).hexdigest()[:16]
+    # models with identical schemas share an entry, and so does their grammar on the engine
+    self.schemas.setdefault(key, schema)
+    self._keys[model] = key
+    return key
+
+  def compiled(self) -> set[str]:
+    """Keys whose grammar the engine already holds, starting with the ones ``warm`` compiles."""
+    if self._compiled is None:
+      self._compiled = {self.key(it) for it in self.models}
+    return self._compiled
+
+  def get(self, model: type[pydantic.BaseModel]) -> str:
+    """The schema of ``model`` as sent in ``guided_json``."""
+    key, compiled = self.key(model), self.compiled()
+    CACHE_REQUESTS.labels(cache='grammars', result='hit' if key in compiled else 'miss').inc()
+    compiled.add(key)
+    return self.schemas[key]
+
+  async def warm(self, engine: EngineClient) -> None:
+    """Compile the grammar of every schema with a one-token guided request through ``engine``."""
+    from vllm import SamplingParams
+    from vllm.sampling_params import GuidedDecodingParams
+
+    async def compile_grammar(key: str, schema: str) -> None:
+      params = SamplingParams(max_tokens=1, guided_decoding=GuidedDecodingParams(json=schema))
+      async for _ in engine.generate('{', params, request_id=f'warmup-grammar-{key}'):
+        pass
+
+    start = time.perf_counter()
+    keys = list(dict.fromkeys(self.key(it) for it in self.models))
+    with STAGE_SECONDS.labels(stage='compile_grammars').time():
+      results = await asyncio.gather(
+        *(compile_grammar(key, self.schemas[key]) for key in keys), return_exceptions=True
+      )
+    for key, result in zip(keys, results):
+      if isinstance(result, Exception):
+        self.compiled().discard(key)
+        logger.warning('Failed to precompile the grammar of schema %s: %s', key, result)
+    logger.info('Precompiled %d guided decoding grammars in %.2fs', len(keys), time.perf_counter() - start)
+
+
+GUIDED_SCHEMAS = GuidedSchemas([SuggestionsSchema, AuthorSchema, Authors, ChunkTitlesSchema])
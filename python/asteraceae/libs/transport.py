@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import asyncio, concurrent.futures, importlib.util, typing as t
+import httpx, openai
+
+if t.TYPE_CHECKING:
+  from starlette.types import ASGIApp, Message
+
+# vLLM's OpenAI server can stream for a long time, so only connecting is bounded tightly.
+DEFAULT_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+
+class ASGIResponseStream(httpx.AsyncByteStream):
+  def __init__(self, messages: asyncio.Queue[Message | None], task: asyncio.Task[None], disconnected: asyncio.Event):
+    self.messages = messages
+    self.task = task
+    self.disconnected = disconnected
+
+  async def __aiter__(self) -> t.AsyncIterator[bytes]:
+    while (message := await self.messages.get()) is not None:
+      if message['type'] == 'http.response.body':
+        if body := message.get('body', b''):
+          yield body
+        if not message.get('more_body', False):
+          break
+
+  async def aclose(self) -> None:
+    # lets streaming handlers see the client going away, e.g. vLLM aborts the request
+    self.disconnected.set()
+    await asyncio.wait({self.task}, timeout=1.0)
+    if not self.task.done():
+      self.task.cancel()
+    elif not self.task.cancelled() and (e := self.task.exception()) is not None:
+      raise httpx.RemoteProtocolError(f'ASGI app failed while streaming: {e}') from e
+
+
+class ASGIStreamTransport(httpx.AsyncBaseTransport):
+  """Calls an ASGI app in-process, for colocated engines (``COLOCATED``).
+
+  Unlike ``httpx.ASGITransport``, which buffers the whole response, the body is streamed as the app sends it.
+  Requests to ``{root_path}/...`` are routed to ``/...`` of ``app``, as if it was mounted there.
+  """
+
+  def __init__(self, app: ASGIApp, *, root_path: str = ''):
+    self.app = app
+    self.root_path = root_path
+
+  async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+    body = await request.aread()
+    path = request.url.path.removeprefix(self.root_path) or '/'
+    scope = {
+      'type': 'http',
+      'asgi': {'version': '3.0'},
+      'http_version': '1.1',
+      'method': request.method,
+      'scheme': request.url.scheme,
+      'path': path,
+      'raw_path': path.encode(),
+      'query_string': request.url.query,
+      'root_path': '',
+      'headers': [(k.lower(), v) for k, v in request.headers.raw],
+      'server': (request.url.host, request.url.port or 80),
+      'client': ('127.0.0.1', 0),
+    }
+    messages: asyncio.Queue[Message | None] = asyncio.Queue()
+    disconnected = asyncio.Event()
+    sent = False
+
+    async def receive() -> Message:
+      nonlocal sent
+      if not sent:
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+      await disconnected.wait()
+      return {'type': 'http.disconnect'}
+
+    async def run() -> None:
+      try:
+        await self.app(scope, receive, messages.put)
+      finally:
+        messages.put_nowait(None)
+
+    task = asyncio.create_task(run())
+    start = await messages.get()
+    if start is None or start['type'] != 'http.response.start':
+      await task  # raises the app's error, if any
+      raise httpx.RemoteProtocolError('ASGI app returned without a response', request=request)
+    return httpx.Response(
+      start['status'],
+      headers=start.get('headers', []),
+      stream=ASGIResponseStream(messages, task, disconnected),
+      request=request,
+    )
+
+
+class ThreadedASGITransport(httpx.BaseTransport):
+  """Sync counterpart of ``ASGIStreamTransport`` for worker threads, running requests on the app's event loop.
+
+  Responses are read whole, and it must not be called from ``loop``'s own thread.
+  """
+
+  def __init__(self, transport: ASGIStreamTransport, loop: asyncio.AbstractEventLoop):
+    self.transport = transport
+    self.loop = loop
+
+  def handle_request(self, request: httpx.Request) -> httpx.Response:
+    request.read()
+
+    async def call() -> httpx.Response:
+      response = await self.transport.handle_async_request(request)
+      try:
+        content = await response.aread()
+      finally:
+        await response.aclose()
+      return httpx.Response(response.status_code, headers=response.headers, content=content, request=request)
+
+    future: concurrent.futures.Future[httpx.Response] = asyncio.run_coroutine_threadsafe(call(), self.loop)
+    return future.result()
+
+
+class Upstream:
+  """One shared, tuned HTTP stack per upstream engine.
+
+  Every client that talks to the same engine (raw httpx proxying, the OpenAI clients and the llama_index
+  components) shares one connection pool, sized after the service concurrency. HTTP/2 is negotiated over TLS when
+  ``h2`` is installed and the upstream supports it; httpx has no cleartext HTTP/2 (h2c), so ``http://`` engines stay
+  on HTTP/1.1 keep-alive connections. With ``app``, the engine's ASGI app (mounted at ``/v1``) is called
+  in-process instead; this must happen on the running event loop.
+  """
+
+  def __init__(
+    self,
+    name: str,
+    base_url: str,
+    *,
+    concurrency: int,
+    app: ASGIApp | None = None,
+    headers: t.Mapping[str, str] | None = None,
+    keepalive_expiry: float = 60.0,
+    timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+  ):
+    self.name = name
+    self.base_url = base_url.rstrip('/')
+    self.app = app
+    self.http2 = app is None and self.base_url.startswith('https://') and importlib.util.find_spec('h2') is not None
+    self.headers = dict(headers or {})
+
+    transport: httpx.BaseTransport
+    atransport: httpx.AsyncBaseTransport
+    if app is not None:
+      atransport = ASGIStreamTransport(app, root_path='/v1')
+      transport = ThreadedASGITransport(atransport, asyncio.get_running_loop())
+    else:
+      limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency, keepalive_expiry=keepalive_expiry
+      )
+      transport = httpx.HTTPTransport(limits=limits, http2=self.http2)
+      atransport = httpx.AsyncHTTPTransport(limits=limits, http2=self.http2)
+    self.http = httpx.Client(base_url=self.base_url, headers=self.headers, timeout=timeout, transport=transport)
+    self.ahttp = httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=timeout, transport=atransport)
+    self.openai = openai.OpenAI(
+      base_url=f'{self.base_url}/v1', api_key='dummy', default_headers=self.headers, http_client=self.http
+    )
+    self.aopenai = openai.AsyncOpenAI(
+      base_url=f'{self.base_url}/v1', api_key='dummy', default_headers=self.headers, http_client=self.ahttp
+    )
+
+  def __repr__(self) -> str:
+    return f'Upstream(name={self.name!r}, base_url={self.base_url!r}, in_process={self.app is not None}, http2={self.http2})'
+
+  async def aclose(self) -> None:
+    await self.ahttp.aclose()
+    self.http.close()
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio, collections, concurrent.futures, contextvars, functools, time, typing as t
+
+from libs.metrics import QUEUE_DEPTH, QUEUE_WAIT_SECONDS
+from libs.profiling import record_span
+from libs.protocol import WorkerPoolStats
+
+T = t.TypeVar('T')
+
+
+class FairWorkerPool:
+  """Long-lived, bounded thread pool shared by every ingest on the gateway.
+
+  At most ``max_workers`` jobs run at once. Waiting jobs are queued per key (the vault id for essays),
+  and a freed slot is handed to the keys in round-robin order, so one bulk vault import cannot starve the others.
+  """
+
+  def __init__(self, max_workers: int, *, name: str = 'ingest'):
+    self.max_workers = max_workers
+    self.name = name
+    self.completed = 0
+    self._wait_s = 0.0
+    self._active = 0
+    self._executor: concurrent.futures.ThreadPoolExecutor | None = None
+    self._queues: dict[str, collections.deque[asyncio.Future[None]]] = {}
+    self._order: collections.deque[str] = collections.deque()
+    self._depth = QUEUE_DEPTH.labels(queue=name)
+
+  def start(self) -> None:
+    if self._executor is None:
+      self._executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=self.max_workers, thread_name_prefix=self.name
+      )
+
+  def shutdown(self, wait: bool = True) -> None:
+    if self._executor is not None:
+      self._executor.shutdown(wait=wait, cancel_futures=True)
+      self._executor = None
+
+  @property
+  def queue_depth(self) -> int:
+    return sum(len(q) for q in self._queues.values())
+
+  def stats(self) -> WorkerPoolStats:
+    return WorkerPoolStats(
+      name=self.name,
+      max_workers=self.max_workers,
+      active=self._active,
+      queue_depth=self.queue_depth,
+      queued={key: len(q) for key, q in self._queues.items()},
+      completed=self.completed,
+      avg_wait_ms=round(self._wait_s / self.completed * 1000, 2) if self.completed else 0.0,
+    )
+
+  async def _acquire(self, key: str) -> None:
+    if self._active < self.max_workers and not self._order:
+      self._active += 1
+      return
+    waiter = asyncio.get_running_loop().create_future()
+    self._queues.setdefault(key, collections.deque()).append(waiter)
+    self._depth.inc()
+    if key not in self._order:
+      self._order.append(key)
+    try:
+      await waiter
+    except asyncio.CancelledError:
+      if waiter.done() and not waiter.cancelled():
+        # the slot was handed to us right before cancellation, pass it on
+        self._release()
+      elif (queue := self._queues.get(key)) is not None and waiter in queue:
+        queue.remove(waiter)
+        self._depth.dec()
+        if not queue:
+          del self._queues[key]
+          self._order.remove(key)
+      raise
+
+  def _release(self) -> None:
+    while self._order:
+      key = self._order.popleft()
+      queue = self._queues[key]
+      waiter = queue.popleft()
+      self._depth.dec()
+      if queue:
+        self._order.append(key)
+      else:
+        del self._queues[key]
+      if not waiter.done():
+        waiter.set_result(None)  # hand over the slot without touching the active count
+        return
+    self._active -= 1
+
+  async def run(self, key: str, fn: t.Callable[..., T], /, *args: t.Any, **kwargs: t.Any) -> T:
+    """Run ``fn(*args, **kwargs)`` on the pool once ``key`` gets its fair turn."""
+    if self._executor is None:
+      raise RuntimeError(f'Worker pool {self.name!r} is not started')
+    queued_at = time.perf_counter()
+    await self._acquire(key)
+    waited = time.perf_counter() - queued_at
+    self._wait_s += waited
+    QUEUE_WAIT_SECONDS.labels(queue=self.name).observe(waited)
+    record_span(f'queue_{self.name}', queued_at)
+    # in the caller's context, so that the stages run on the pool land on its request's timeline
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    try:
+      return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+    finally:
+      self.completed += 1
+      self._release()
@@ -1,60 +1,82 @@
 from __future__ import annotations
 
-import logging, argparse, multiprocessing, json, itertools, traceback, asyncio, os, shutil, contextlib, pathlib, time, datetime, typing as t
-import bentoml, fastapi, pydantic, jinja2, annotated_types as at
+import logging, argparse, json, itertools, collections, traceback, asyncio, os, shutil, contextlib, pathlib, time, functools, hmac, typing as t
+import bentoml, fastapi, httpx, pydantic, pydantic_core, jinja2, annotated_types as at
 
-from starlette.responses import JSONResponse, StreamingResponse
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 
+# NOTE: The API gateway imports this module on a CPU-only box, so only dependency-light modules are imported here.
+# vllm/torch are imported inside the engines' startup hooks, and llama_index/exa_py on first use by the gateway.
+# Check `make importtime` and tests/test_import_time.py before adding imports here.
 with bentoml.importing():
-  import openai, exa_py
-
   from openai.types import CreateEmbeddingResponse
-  from openai.types.chat import ChatCompletionChunk
-  from llama_index.core import Document
-  from llama_index.core.ingestion import IngestionPipeline
-  from llama_index.core.node_parser import SemanticSplitterNodeParser
-  from llama_index.core.extractors import TitleExtractor
-  from llama_index.embeddings.openai import OpenAIEmbedding
-  from llama_index.llms.openai_like import OpenAILike
-  from vllm.entrypoints.openai.protocol import (
-    ChatCompletionRequest,
-    DeltaMessage,
-    ModelCard,
-    ModelList,
-    ErrorResponse,
-    EmbeddingCompletionRequest,
-  )
 
   from libs.protocol import (
+    ChatCompletionRequest,
+    CompactEssayNode,
+    EmbeddingCompletionRequest,
+    ErrorResponse,
     EssayNode,
+    EssayFormat,
+    EssayNodeFrame,
+    EssaySummaryFrame,
     EssayRequest,
     EssayResponse,
     HealthRequest,
     MetadataResponse,
+    ModelCard,
+    ModelList,
     NotesResponse,
     ReasoningModels,
     EmbeddingModels,
     ServiceOpts,
     EmbedType,
     ModelType,
-    DependentStatus,
+    TitleMode,
+    TonalityMode,
+    ChunkerMode,
     HealthResponse,
-    LineNumberMetadataExtractor,
     Suggestion,
     SuggestionsSchema,
+    SuggestionResponseSchema,
     Authors,
     TaskType,
     Tonality,
     NotesRequest,
     AuthorSchema,
+    WorkerPoolStats,
+    PriorityClass,
+    SchedulerStats,
+    LimiterStats,
+    LLMTier,
+    SlowRequestStats,
   )
+  from libs.affinity import HashRing, VaultAffinityMiddleware
+  from libs.cache import CachedSuggestions, SuggestionCache
+  from libs.codec import loads, negotiate, suggestion_frame
+  from libs.health import CircuitOpenError, HealthMonitor, Probe
+  from libs.metrics import TokenTimer, record_usage, stage
+  from libs.profiling import ProfilerBusyError, SamplingProfiler, SlowRequests, TimelineMiddleware, record_span
+  from libs.limiter import AdaptiveLimiter, EngineLoadMonitor, LoadShedMiddleware, admit
+  from libs.router import ModelRouter, ModelTier, cascade
+  from libs.schemas import GUIDED_SCHEMAS
+  from libs.resilience import DeadlineMiddleware, Hedger, RetryBudget, remaining, within_deadline
+  from libs.scheduler import AdmissionScheduler
+  from libs.transport import Upstream
+  from libs.workers import FairWorkerPool
 
 if t.TYPE_CHECKING:
+  import exa_py, numpy as np
   from _bentoml_impl.client import RemoteProxy
+  from llama_index.core.schema import BaseNode
+  from openai.types.chat import ChatCompletionChunk
+  from vllm.entrypoints.openai.protocol import DeltaMessage
+  from vllm.entrypoints.openai.serving_chat import OpenAIServingChat
   from vllm.entrypoints.openai.serving_embedding import OpenAIServingEmbedding
 
-logger = logging.getLogger('bentoml.service')
+  from libs.pipeline import Ingestion
 
+logger = logging.getLogger('bentoml.service')
 
 WORKING_DIR = pathlib.Path(__file__).parent
 IGNORE_PATTERNS = ['*.pth', '*.pt', 'original/**/*']
@@ -65,6 +87,71 @@ EMBED_TYPE = t.cast(EmbedType, os.getenv('EMBED', 'gte-qwen-fast'))
 EMBED_ID: str = (embed_ := EmbeddingModels[EMBED_TYPE])['model_id']
 MAX_MODEL_LEN = int(os.environ.get('MAX_MODEL_LEN', llm_['max_model_len']))
 MAX_TOKENS = int(os.environ.get('MAX_TOKENS', llm_['max_tokens']))
+TITLE_MODE = t.cast(TitleMode, os.getenv('TITLE_MODE', 'llm'))
+TONALITY = t.cast(TonalityMode, os.getenv('TONALITY', 'prompt'))
+CHUNKER = t.cast(ChunkerMode, os.getenv('CHUNKER', 'semantic'))
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '4'))
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '8'))
+STREAM_MAX_BATCHES = int(os.getenv('STREAM_MAX_BATCHES', '4'))
+# Admission control in front of the LLM engine, capacity mirrors vLLM's max_num_seqs.
+# Interactive suggestions are admitted ahead of background work (essay titles, authors) when contended.
+LLM_CAPACITY = int(os.getenv('LLM_CAPACITY', '128'))
+PRIORITY_CLASSES: dict[str, PriorityClass] = {
+  'interactive': {'priority': 0, 'max_concurrency': LLM_CAPACITY, 'queue_slo_s': 2.0},
+  'background': {'priority': 1, 'max_concurrency': LLM_CAPACITY // 2, 'queue_slo_s': 120.0},
+}
+# Load shedding: interactive requests beyond an adaptive (AIMD) limit, or while vLLM reports more than
+# MAX_ENGINE_WAITING queued sequences, are answered with 429 + Retry-After instead of waiting for the timeout.
+TTFT_THRESHOLD_S = float(os.getenv('TTFT_THRESHOLD_S', '5'))
+MAX_ENGINE_WAITING = int(os.getenv('MAX_ENGINE_WAITING', '64'))
+# Dependencies are probed in the background every HEALTH_INTERVAL_S; a failed probe opens their circuit breaker.
+HEALTH_INTERVAL_S = float(os.getenv('HEALTH_INTERVAL_S', '5'))
+# Near-duplicate /suggests cache, per vault: excerpts whose embeddings are within SUGGEST_CACHE_THRESHOLD cosine
+# similarity replay the cached stream. Hits older than SUGGEST_CACHE_REFRESH_S (0: never) are refreshed in the
+# background.
+SUGGEST_CACHE = SuggestionCache(
+  threshold=float(os.getenv('SUGGEST_CACHE_THRESHOLD', '0.97')),
+  maxsize=int(os.getenv('SUGGEST_CACHE_SIZE', '256')),
+  max_vaults=int(os.getenv('SUGGEST_CACHE_VAULTS', '1024')),
+)
+SUGGEST_CACHE_REFRESH_S = float(os.getenv('SUGGEST_CACHE_REFRESH_S', '0'))
+# a lookup must stay much cheaper than the generation it saves
+SUGGEST_CACHE_EMBED_TIMEOUT_S = 1.0
+ENGINE_ERROR = 'Internal error found. Check server logs for more information'
+# Model tiers: LLM_TIERS is a JSON list of extra LLM deployments of this bento (see LLMTier), e.g.
+# '[{"model": "r1-qwen-tiny", "url": "http://tiny:3000", "max_chars": 2000}]'. Suggestions and authors go to the
+# smallest tier that fits their excerpt, or to the smallest one when less than ROUTE_FAST_SLO_S is left on their
+# deadline, and to this deployment's LLM otherwise. With LLM_CASCADE set, guided output of a smaller tier that fails
+# validation is regenerated by this deployment's LLM.
+LLM_TIERS = pydantic.TypeAdapter(list[LLMTier]).validate_json(os.getenv('LLM_TIERS', '[]'))
+ROUTE_FAST_SLO_S = float(os.getenv('ROUTE_FAST_SLO_S', '10'))
+LLM_CASCADE = bool(os.getenv('LLM_CASCADE'))
+# Single-node installs: with COLOCATED set, `bentoml serve service:API` runs both engines inside the API process and
+# calls them directly, instead of over HTTP through the LLM and Embeddings services.
+COLOCATED = bool(os.getenv('COLOCATED'))
+# Vault affinity across replicas, by consistent hashing of the vault id with bounded loads (AFFINITY_LOAD_FACTOR).
+# EMBED_REPLICAS lists extra Embeddings deployments (comma-separated URLs) that share the per-vault embedding work of
+# this gateway's own. GATEWAY_REPLICAS lists the URLs of every gateway replica, and GATEWAY_URL is this one's:
+# /suggests and /essays/stream are then forwarded to the replica that owns their vault, and its caches.
+EMBED_REPLICAS = [it for it in os.getenv('EMBED_REPLICAS', '').split(',') if it]
+GATEWAY_REPLICAS = [it for it in os.getenv('GATEWAY_REPLICAS', '').split(',') if it]
+GATEWAY_URL = os.getenv('GATEWAY_URL', '')
+AFFINITY_LOAD_FACTOR = float(os.getenv('AFFINITY_LOAD_FACTOR', '1.25'))
+# Debugging in production: with DEBUG_TOKEN set, `GET /debug/profile?seconds=N` (with `Authorization: Bearer
+# <DEBUG_TOKEN>`) samples every thread of the worker for a flamegraph, and `GET /debug/slow` lists the stage timelines
+# of the last SLOW_REQUEST_BUFFER requests slower than SLOW_REQUEST_S (0 disables the capture).
+DEBUG_TOKEN = os.getenv('DEBUG_TOKEN', '')
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '10'))
+MAX_PROFILE_S = 120
+SLOW_REQUESTS = SlowRequests(
+  threshold_s=float(os.getenv('SLOW_REQUEST_S', '10')), maxsize=int(os.getenv('SLOW_REQUEST_BUFFER', '64'))
+)
+LIMITER = AdaptiveLimiter(
+  initial=LLM_CAPACITY // 2,
+  max_limit=LLM_CAPACITY,
+  latency_threshold_s=TTFT_THRESHOLD_S,
+  max_engine_waiting=MAX_ENGINE_WAITING,
+)
 
 SupportedBackend = t.Literal['vllm']
 SUPPORTED_BACKENDS: t.Sequence[SupportedBackend] = ['vllm']
@@ -82,7 +169,7 @@ SERVICE_CONFIG: ServiceOpts = {
       'access_control_allow_credentials': True,
       'access_control_allow_headers': ['*', 'Content-Type', 'Authorization'],
       'access_control_max_age': 1200,
-      'access_control_expose_headers': ['Access-Control-Allow-Origin'],
+      'access_control_expose_headers': ['Access-Control-Allow-Origin', 'Retry-After'],
     }
   },
   'image': bentoml.images.PythonImage(python_version='3.11')
@@ -94,6 +181,10 @@ SERVICE_CONFIG: ServiceOpts = {
 
 class SuggestRequest(pydantic.BaseModel):
   essay: str
+  vault_id: t.Optional[str] = pydantic.Field(
+    default=None, description='Enables the near-duplicate suggestion cache, which is scoped per vault'
+  )
+  cache: bool = True
   authors: t.Optional[list[str]] = pydantic.Field(DEFAULT_AUTHORS)
   tonality: t.Optional[Tonality] = None
   notes: t.Optional[list[NotesRequest]] = None
@@ -118,7 +209,8 @@ class AuthorRequest(pydantic.BaseModel):
 
 class StreamingCall(pydantic.BaseModel):
   task: t.Literal['tool-call', 'tool-result', 'tool-error', 'tool-end', 'tool-start', 'llm-call', 'llm-result']
-  content: t.Union[pydantic.BaseModel, dict, str]
+  # SerializeAsAny, so that models such as Authors keep their fields when dumped
+  content: t.Union[pydantic.SerializeAsAny[pydantic.BaseModel], dict, str]
   error: t.Optional[str] = None
 
 
@@ -236,6 +328,17 @@ def make_url(task: TaskType) -> str | None:
   return f'http://127.0.0.1:{os.getenv((k := var[task])["key"], k["value"])}' if os.getenv('DEVELOPMENT') else None
 
 
+def make_metrics_app() -> t.Any:
+  from prometheus_client import REGISTRY, CollectorRegistry, make_asgi_app, multiprocess
+
+  registry = REGISTRY
+  # set by vLLM when the engine runs in a separate process from the frontend
+  if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+  return make_asgi_app(registry=registry)
+
+
 @bentoml.asgi_app(llm_app, path='/v1')
 @bentoml.service(
   labels={'owner': 'aarnphm', 'type': 'engine', 'task': 'generate'}, envs=make_env(0), **make_engine_service_config()
@@ -247,15 +350,12 @@ class LLM:
   def __init__(self):
     self.exit_stack = contextlib.AsyncExitStack()
 
-  @bentoml.on_startup
-  def setup_client(self):
-    self.client = openai.AsyncOpenAI(base_url=f'{LLM.url}/v1', api_key='dummy')
-
   @bentoml.on_startup
   async def init_engine(self) -> None:
     import vllm.entrypoints.openai.api_server as vllm_api_server
 
-    args = make_args(self.model, self.model_id, task='generate', gpu_memory_utilization=0.90)
+    # colocated, the embedding engine shares the GPU
+    args = make_args(self.model, self.model_id, task='generate', gpu_memory_utilization=0.70 if COLOCATED else 0.90)
 
     router = fastapi.APIRouter(lifespan=vllm_api_server.lifespan)
     OPENAI_ENDPOINTS = [
@@ -272,11 +372,30 @@ class LLM:
     self.model_config = await self.engine.get_model_config()
     self.tokenizer = await self.engine.get_tokenizer()
     await vllm_api_server.init_app_state(self.engine, self.model_config, llm_app.state, args)
+    self.chat_handler: OpenAIServingChat = llm_app.state.openai_serving_chat
+    # compiled before the service reports ready, instead of in the TTFT of the first guided requests
+    await GUIDED_SCHEMAS.warm(self.engine)
+    # waiting/running sequence gauges, polled by the API gateway for load shedding
+    llm_app.mount('/metrics', make_metrics_app())
 
   @bentoml.on_shutdown
   async def teardown_engine(self):
     await self.exit_stack.aclose()
 
+  async def _stream_chat(self, **body: t.Any) -> t.AsyncGenerator[ChatCompletionChunk, None]:
+    """Streamed chat completion from vLLM's OpenAI handler, called in-process instead of over HTTP."""
+    from openai.types.chat import ChatCompletionChunk
+    from vllm.entrypoints.openai.protocol import ChatCompletionRequest as VLLMChatCompletionRequest, ErrorResponse
+
+    result = await self.chat_handler.create_chat_completion(VLLMChatCompletionRequest.model_validate(body))
+    if isinstance(result, ErrorResponse):
+      raise RuntimeError(result.message)
+    async for event in t.cast('t.AsyncGenerator[str, None]', result):
+      if (data := event.removeprefix('data: ').strip()) == '[DONE]':
+        break
+      # lenient like the OpenAI client, keeping vLLM's extra fields such as reasoning_content
+      yield ChatCompletionChunk.construct(**loads(data))
+
   @bentoml.api
   async def generate(
     self,
@@ -286,40 +405,40 @@ class LLM:
     top_p: t.Annotated[float, at.Ge(0), at.Le(1)] = llm_['top_p'],
     max_tokens: t.Annotated[int, at.Ge(256), at.Le(MAX_TOKENS)] = MAX_TOKENS,
     usage: bool = False,
+    steering: dict[str, float] | None = None,
   ) -> t.AsyncGenerator[str, None]:
     prefill = False
+    extra_body: dict[str, t.Any] = {'guided_json': GUIDED_SCHEMAS.get(SuggestionsSchema)}
+    if steering:
+      # per-request SAE feature strengths, read by exo's LlamaSAEForCausalLM
+      extra_body['steering'] = steering
     try:
-      completions = t.cast(
-        openai.AsyncStream[ChatCompletionChunk],
-        await self.client.chat.completions.create(
-          model=self.model_id,
-          temperature=temperature,
-          top_p=top_p,
-          max_tokens=max_tokens,
-          messages=messages,
-          stream=True,
-          extra_body={'guided_json': SuggestionsSchema.model_json_schema()},
-          stream_options={'continuous_usage_stats': True, 'include_usage': True} if usage else None,
-        ),
+      completions = self._stream_chat(
+        model=self.model_id,
+        temperature=temperature,
+        top_p=top_p,
+        max_tokens=max_tokens,
+        messages=messages,
+        stream=True,
+        stream_options={'continuous_usage_stats': True, 'include_usage': True} if usage else None,
+        **extra_body,
       )
-      async for chunk in completions:
-        delta_choice = t.cast(DeltaMessage, chunk.choices[0].delta)
-        if hasattr(delta_choice, 'reasoning_content'):
-          s = Suggestion(
-            suggestion=delta_choice.content or '', reasoning=delta_choice.reasoning_content or '', usage=chunk.usage
-          )
-        else:
-          s = Suggestion(suggestion=delta_choice.content or '', usage=chunk.usage)
-        if not prefill:
-          prefill = True
-          yield ''
-        else:
-          if not s.reasoning and not s.suggestion:
-            break
-          yield f'{s.model_dump_json()}\n\n'
+      async with contextlib.aclosing(completions):
+        async for chunk in completions:
+          delta_choice = t.cast('DeltaMessage', chunk.choices[0].delta)
+          content = delta_choice.content or ''
+          reasoning = getattr(delta_choice, 'reasoning_content', None) or ''
+          if not prefill:
+            prefill = True
+            yield ''
+          else:
+            if not reasoning and not content:
+              break
+            # serialized once per token, so skip building a Suggestion
+            yield suggestion_frame(content, reasoning, chunk.usage)
     except Exception:
       logger.error(traceback.format_exc())
-      yield f'{Suggestion(suggestion="Internal error found. Check server logs for more information").model_dump_json()}\n\n'
+      yield suggestion_frame(ENGINE_ERROR)
       return
 
 
@@ -336,10 +455,6 @@ class Embeddings:
   def __init__(self):
     self.exit_stack = contextlib.AsyncExitStack()
 
-  @bentoml.on_startup
-  def setup_client(self):
-    self.client = openai.AsyncOpenAI(base_url=f'{Embeddings.url}/v1', api_key='dummy')
-
   @bentoml.on_startup
   async def init_engine(self) -> None:
     import torch, vllm.entrypoints.openai.api_server as vllm_api_server
@@ -354,6 +469,7 @@ class Embeddings:
       prefix_caching=False,
       dtype=torch.float16,
       max_num_seqs=256,
+      gpu_memory_utilization=0.20 if COLOCATED else 0.90,
       chunked_prefill=False,
       hf_overrides={'is_causal': True},
     )
@@ -381,8 +497,16 @@ class Embeddings:
 
   @bentoml.api
   async def generate(self, content: list[str]) -> CreateEmbeddingResponse:
+    from vllm.entrypoints.openai.protocol import EmbeddingCompletionRequest, ErrorResponse
+
     try:
-      return await self.client.embeddings.create(input=content, model=self.model_id)
+      # vLLM's OpenAI handler, called in-process instead of over HTTP
+      result = await self.embed_handler.create_embedding(
+        EmbeddingCompletionRequest(input=content, model=self.model_id)
+      )
+      if isinstance(result, ErrorResponse):
+        raise RuntimeError(result.message)
+      return CreateEmbeddingResponse.model_validate(result.model_dump())
     except Exception:
       logger.error(traceback.format_exc())
       raise
@@ -397,90 +521,228 @@ class Embeddings:
   **SERVICE_CONFIG,
 )
 class API:
-  llm = bentoml.depends(LLM, url=make_url('generate'))
-  embed = bentoml.depends(Embeddings, url=make_url('embed'))
+  # colocated, the engines are created by `start_engines` instead, so BentoML does not serve them separately
+  if not COLOCATED:
+    llm = bentoml.depends(LLM, url=make_url('generate'))
+    embed = bentoml.depends(Embeddings, url=make_url('embed'))
 
   search_backend: t.Literal['exa'] = 'exa'
 
   def __init__(self):
     loader = jinja2.FileSystemLoader(searchpath=WORKING_DIR)
     self.templater = jinja2.Environment(loader=loader)
+    # shared by all ingests, instead of a fresh process pool per essay
+    self.ingest_pool = FairWorkerPool(max_workers=INGEST_WORKERS, name='ingest')
+    self.scheduler = AdmissionScheduler(capacity=LLM_CAPACITY, classes=PRIORITY_CLASSES)
+    self.limiter = LIMITER
+    self.profiler = SamplingProfiler(interval_s=PROFILE_INTERVAL_MS / 1000)
+    # embeddings are short and idempotent: hedge them past the p95 latency, within a shared retry budget
+    self.embed_hedger = Hedger(RetryBudget(ratio=0.1, min_per_s=1.0), quantile=0.95)
+    # llama_index is only imported once the first essay comes in, see `ingestion`; one per embedding replica
+    self._ingestions: dict[str, Ingestion] = {}
+    self._ingestion_lock = asyncio.Lock()
+    # background cache refreshes, referenced until done; _refreshing dedupes them per excerpt
+    self._background: set[asyncio.Task[None]] = set()
+    self._refreshing: set[str] = set()
 
   def as_proxy(self, it: t.Any) -> RemoteProxy:
     return t.cast('RemoteProxy', it)
 
+  def _probe(self, dependency: t.Any) -> Probe:
+    if not COLOCATED:
+      return lambda timeout: self.as_proxy(dependency).is_ready(int(timeout))
+
+    async def check_health(timeout: float) -> bool:
+      # raises once the engine process is dead
+      async with asyncio.timeout(timeout):
+        await dependency.engine.check_health()
+      return True
+
+    return check_health
+
+  @staticmethod
+  def _upstream_headers() -> dict[str, str]:
+    # no deadline header: vLLM ignores it, and cancelling the call on our side (within_deadline) closes the
+    # connection, which aborts the request in the engine
+    return {'Accept': 'application/json', 'Content-Type': 'application/json'}
+
+  @staticmethod
+  def _unavailable(e: CircuitOpenError) -> JSONResponse:
+    return JSONResponse(
+      content=ErrorResponse(message=str(e), type='ServiceUnavailable', code=503).model_dump(),
+      status_code=503,
+      headers={'Retry-After': str(max(1, round(e.retry_after)))},
+    )
+
+  @staticmethod
+  def _deadline_exceeded() -> JSONResponse:
+    return JSONResponse(
+      content=ErrorResponse(message='Request deadline exceeded', type='DeadlineExceeded', code=504).model_dump(),
+      status_code=504,
+    )
+
   @bentoml.on_startup
-  def setup_clients(self):
-    self.llm_httpx = (tllm := self.as_proxy(self.llm)).to_async.client
-    self.embed_httpx = (tembed := self.as_proxy(self.embed)).to_async.client
+  async def start_workers(self):
+    self.ingest_pool.start()
+    self.scheduler.bind(asyncio.get_running_loop())
 
-    self.exa = exa_py.Exa(api_key=os.environ.get('EXA_API_KEY'))
+  @bentoml.on_shutdown
+  def stop_workers(self):
+    self.ingest_pool.shutdown(wait=False)
+
+  @bentoml.on_startup
+  async def start_engines(self):
+    if not COLOCATED:
+      return
+    # the engines' own startup hooks, run in this process: LLM.generate and Embeddings.generate become plain calls
+    self.llm, self.embed = LLM(), Embeddings()
+    await self.llm.init_engine()
+    await self.embed.init_engine()
 
-    self.llm_client = openai.AsyncOpenAI(
-      base_url=f'{tllm.client_url}/v1', api_key='dummy', default_headers={'Runner-Name': LLM.name}
+  @bentoml.on_shutdown
+  async def stop_engines(self):
+    if COLOCATED:
+      await asyncio.gather(self.llm.teardown_engine(), self.embed.teardown_engine())
+
+  @bentoml.on_startup
+  def setup_clients(self):
+    # One shared connection pool per upstream, sized after our own concurrency, used by every client below
+    concurrency = SERVICE_CONFIG['traffic']['concurrency']
+    self.llm_upstream = Upstream(
+      'llm',
+      'http://llm' if COLOCATED else self.as_proxy(self.llm).client_url,
+      concurrency=concurrency,
+      app=llm_app if COLOCATED else None,
+      headers={'Runner-Name': LLM.name},
     )
-    self.embed_client = openai.AsyncOpenAI(
-      base_url=f'{tembed.client_url}/v1', api_key='dummy', default_headers={'Runner-Name': Embeddings.name}
+    self.embed_upstream = Upstream(
+      'embed',
+      'http://embed' if COLOCATED else self.as_proxy(self.embed).client_url,
+      concurrency=concurrency,
+      app=embed_app if COLOCATED else None,
+      headers={'Runner-Name': Embeddings.name},
     )
-
-    self.llm_model = OpenAILike(
-      model=LLM.inner.model_id,
-      tokenizer=LLM.inner.model_id,
-      api_key='dummy',
-      api_version='',
-      api_base=f'{tllm.client_url}/v1',
-      is_chat_model=True,
-      max_tokens=MAX_TOKENS,
-      context_window=MAX_MODEL_LEN,
-      temperature=llm_['temperature'],
-      default_headers={'Runner-Name': LLM.name},
-      strict=True,
-      timeout=600.0,  # V0 limitations atm, but once we support thinking in V1, will move there.
+    logger.info('Upstreams: %s, %s', self.llm_upstream, self.embed_upstream)
+
+    self.llm_httpx, self.embed_httpx = self.llm_upstream.ahttp, self.embed_upstream.ahttp
+    self.llm_client, self.embed_client = self.llm_upstream.aopenai, self.embed_upstream.aopenai
+
+    # per-vault embedding work goes to the replica owning the vault, see EMBED_REPLICAS
+    self.embedders: dict[str, tuple[t.Any, Upstream]] = {'embed': (self.embed, self.embed_upstream)}
+    for i, url in enumerate(EMBED_REPLICAS, start=1):
+      upstream = Upstream(f'embed-{i}', url, concurrency=concurrency, headers={'Runner-Name': Embeddings.name})
+      self.embedders[url] = (bentoml.depends(Embeddings, url=url).get(), upstream)
+    self.embed_ring = HashRing(self.embedders, name='embed', load_factor=AFFINITY_LOAD_FACTOR)
+
+    self.router = ModelRouter(
+      [self._make_tier(it, concurrency) for it in LLM_TIERS],
+      ModelTier(MODEL_TYPE, LLM_ID, self.llm, self.llm_upstream),
+      fast_slo_s=ROUTE_FAST_SLO_S,
+      cascade=LLM_CASCADE,
     )
-    self.embed_model = OpenAIEmbedding(
-      api_key='dummy',
-      model_name=Embeddings.inner.model_id,
-      api_base=f'{tembed.client_url}/v1',
-      dimensions=None,
-      default_headers={'Runner-Name': Embeddings.name},
+    if self.router.enabled:
+      tiers = ', '.join(f'{it.name} (<={it.max_chars or "any"} chars)' for it in self.router.tiers)
+      logger.info('Routing across %s', tiers)
+
+  def _make_tier(self, tier: LLMTier, concurrency: int) -> ModelTier:
+    # the same LLM service, deployed separately with another `LLM` model type
+    llm = bentoml.depends(LLM, url=tier.url, deployment=tier.deployment).get()
+    upstream = Upstream(
+      tier.model, self.as_proxy(llm).client_url, concurrency=concurrency, headers={'Runner-Name': LLM.name}
     )
-
-    chunker = SemanticSplitterNodeParser(
-      buffer_size=1, breakpoint_percentile_threshold=70, embed_model=self.embed_model
+    return ModelTier(
+      tier.model, ReasoningModels[tier.model]['model_id'], llm, upstream, tier.max_chars, frozenset(tier.tasks)
     )
 
-    # Create our line number metadata extractor
-    line_extractor = LineNumberMetadataExtractor(include_whitespace=True)
+  @bentoml.on_startup
+  async def start_load_monitor(self):
+    # trailing slash: the engine mounts its metrics app under /v1/metrics
+    self.load_monitor = EngineLoadMonitor(self.llm_httpx, self.limiter, path='/v1/metrics/')
+    self.load_monitor.start()
 
-    # Create the title extractor
-    title_extractor = TitleExtractor(llm=self.llm_model)
+  @bentoml.on_startup
+  async def start_health_monitor(self):
+    self.health_monitor = HealthMonitor(
+      {'llm': self._probe(self.llm), 'embed': self._probe(self.embed)},
+      interval_s=HEALTH_INTERVAL_S,
+      timeout_s=HEALTH_INTERVAL_S,
+    )
+    self.llm_breaker, self.embed_breaker = self.health_monitor.breakers['llm'], self.health_monitor.breakers['embed']
+    self.health_monitor.start()
 
-    # Set up the full ingestion pipeline with all components
-    self.pipeline = IngestionPipeline(
-      transformations=[
-        chunker,  # First split into semantic chunks
-        line_extractor,  # Then extract line numbers for each chunk
-        title_extractor,  # Then generate titles for each chunk
-        self.embed_model,  # Finally generate embeddings
-      ]
+  @bentoml.on_shutdown
+  async def teardown_clients(self):
+    await asyncio.gather(self.load_monitor.stop(), self.health_monitor.stop())
+    await asyncio.gather(self.llm_upstream.aclose(), self.embed_upstream.aclose())
+    await asyncio.gather(*(it.upstream.aclose() for it in self.router.tiers))
+    await asyncio.gather(*(self.as_proxy(it.llm).close() for it in self.router.tiers))
+    replicas = [it for name, it in self.embedders.items() if name != 'embed']
+    await asyncio.gather(*(upstream.aclose() for _, upstream in replicas))
+    await asyncio.gather(*(self.as_proxy(embed).close() for embed, _ in replicas))
+
+  @functools.cached_property
+  def exa(self) -> exa_py.Exa:
+    import exa_py
+
+    return exa_py.Exa(api_key=os.environ.get('EXA_API_KEY'))
+
+  def _make_ingestion(self, embed: Upstream) -> Ingestion:
+    from libs.pipeline import Ingestion
+
+    return Ingestion(
+      llm=self.llm_upstream,
+      embed=embed,
+      llm_model_id=LLM.inner.model_id,
+      embed_model_id=Embeddings.inner.model_id,
+      title_mode=TITLE_MODE,
+      temperature=llm_['temperature'],
+      max_tokens=MAX_TOKENS,
+      scheduler=self.scheduler,
     )
 
+  async def ingestion(self, replica: str = 'embed') -> Ingestion:
+    # importing llama_index takes seconds, so it happens off the event loop and only once
+    if (ingestion := self._ingestions.get(replica)) is None:
+      async with self._ingestion_lock:
+        if (ingestion := self._ingestions.get(replica)) is None:
+          ingestion = await asyncio.to_thread(self._make_ingestion, self.embedders[replica][1])
+          self._ingestions[replica] = ingestion
+    return ingestion
+
+  @contextlib.contextmanager
+  def embedder(self, vault_id: str) -> t.Iterator[tuple[str, t.Any]]:
+    """The embedding replica that owns ``vault_id`` and its Embeddings service, counted against its load."""
+    with self.embed_ring.acquire(vault_id) as replica:
+      yield replica, self.embedders[replica][0]
+
   @bentoml.api(route='/v1/embeddings')
   async def create_embedding(self, request: EmbeddingCompletionRequest, /):
     request.model = Embeddings.inner.model_id
+
+    async def post() -> httpx.Response:
+      async with self.embed_breaker.guard():
+        resp = await self.embed_httpx.post(
+          '/v1/embeddings', json=request.model_dump(exclude_unset=True), headers=self._upstream_headers()
+        )
+        if resp.status_code >= 500:
+          resp.raise_for_status()  # retried or hedged by embed_hedger
+      return resp
+
     try:
       # Make a direct request to the embed endpoint
-      resp = await self.embed_httpx.post(
-        '/v1/embeddings',
-        json=request.model_dump(exclude_unset=True),
-        headers={'Accept': 'application/json', 'Content-Type': 'application/json'},
-      )
+      resp = await self.embed_hedger.run(post)
 
       if resp.status_code != 200:
         error_content = resp.json()
         return JSONResponse(content=error_content, status_code=resp.status_code)
 
       return resp.json()
+    except CircuitOpenError as e:
+      return self._unavailable(e)
+    except TimeoutError:
+      return self._deadline_exceeded()
+    except httpx.HTTPStatusError as e:
+      return JSONResponse(content=e.response.json(), status_code=e.response.status_code)
     except Exception as e:
       logger.error('Error forwarding embedding request: %s', e)
       logger.error(traceback.format_exc())
@@ -494,44 +756,54 @@ class API:
   @bentoml.api(route='/v1/chat/completions')
   async def create_chat_completion(self, request: ChatCompletionRequest, /):
     request.model = LLM.inner.model_id
+    if not self.llm_breaker.allow():
+      return self._unavailable(CircuitOpenError('llm', self.llm_breaker.retry_after))
     try:
       if request.stream:
         # Use streaming context manager for streaming responses
         async def stream_response():
-          async with self.llm_httpx.stream(
-            'POST',
-            '/v1/chat/completions',
-            json=request.model_dump(exclude_unset=True),
-            headers={'Accept': 'application/json', 'Content-Type': 'application/json'},
-          ) as resp:
-            if resp.status_code != 200:
-              error_content = await resp.json()
-              yield f'data: {json.dumps(error_content)}\n\n'
-              return
-
-            async for chunk in resp.aiter_text():
-              if chunk.strip():
-                # Pass through the chunk directly if it's already in SSE format
-                if chunk.startswith('data:'):
-                  yield chunk
-                else:
-                  # Wrap it in SSE format if it's not
-                  yield f'data: {chunk}\n\n'
+          try:
+            async with (
+              within_deadline(),
+              self.llm_httpx.stream(
+                'POST',
+                '/v1/chat/completions',
+                json=request.model_dump(exclude_unset=True),
+                headers=self._upstream_headers(),
+              ) as resp,
+            ):
+              if resp.status_code != 200:
+                error_content = json.loads(await resp.aread())
+                yield f'data: {json.dumps(error_content)}\n\n'
+                return
+
+              async for chunk in resp.aiter_text():
+                if chunk.strip():
+                  # Pass through the chunk directly if it's already in SSE format
+                  if chunk.startswith('data:'):
+                    yield chunk
+                  else:
+                    # Wrap it in SSE format if it's not
+                    yield f'data: {chunk}\n\n'
+          except TimeoutError:
+            error = ErrorResponse(message='Request deadline exceeded', type='DeadlineExceeded', code=504)
+            yield f'data: {error.model_dump_json()}\n\n'
 
         return StreamingResponse(stream_response(), media_type='text/event-stream')
       else:
         # For non-streaming responses, continue using post
-        resp = await self.llm_httpx.post(
-          '/v1/chat/completions',
-          json=request.model_dump(exclude_unset=True),
-          headers={'Accept': 'application/json', 'Content-Type': 'application/json'},
-        )
+        async with within_deadline():
+          resp = await self.llm_httpx.post(
+            '/v1/chat/completions', json=request.model_dump(exclude_unset=True), headers=self._upstream_headers()
+          )
 
         if resp.status_code != 200:
           error_content = resp.json()
           return JSONResponse(content=error_content, status_code=resp.status_code)
 
         return JSONResponse(content=resp.json())
+    except TimeoutError:
+      return self._deadline_exceeded()
     except Exception as e:
       logger.error('Error forwarding chat completion request: %s', e)
       logger.error(traceback.format_exc())
@@ -554,6 +826,36 @@ class API:
   @bentoml.task
   async def authors(self, request: AuthorRequest, /) -> Authors:
     """Generate author suggestions based on essay analysis, using function calling and search tools."""
+    result = Authors(authors=DEFAULT_AUTHORS)
+    async with contextlib.aclosing(self._author_events(request)) as events:
+      async for event in events:
+        if event.task == 'llm-result':
+          result = t.cast(Authors, event.content)
+    return result
+
+  @bentoml.api(route='/authors/stream')
+  async def authors_stream(self, request: AuthorRequest, /, ctx: bentoml.Context):
+    """Stream the progress of ``/authors`` as NDJSON (or msgpack) events, ending with an ``llm-result`` of the authors.
+
+    Generated search queries are sent as ``tool-start`` events, and every search as a ``tool-result`` (or
+    ``tool-error``) once it lands. Closing the connection cancels the LLM and search calls still in flight.
+    """
+    codec = negotiate(ctx.request.headers.get('accept'))
+
+    async def stream_events() -> t.AsyncGenerator[bytes, None]:
+      async with contextlib.aclosing(self._author_events(request)) as events:
+        async for event in events:
+          yield codec.frame(event)
+
+    return StreamingResponse(stream_events(), media_type=codec.stream_media_type)
+
+  async def _author_events(self, request: AuthorRequest) -> t.AsyncGenerator[StreamingCall, None]:
+    """Steps of an ``/authors`` request as they happen. The last event is always an ``llm-result`` with ``Authors``."""
+
+    if not self.llm_breaker.allow():
+      logger.warning('LLM circuit is open, returning default authors')
+      yield StreamingCall(task='llm-result', content=Authors(authors=DEFAULT_AUTHORS), error='LLM is unavailable')
+      return
 
     # Use the request's search backend if specified, otherwise use the default
     search_backend = request.search_backend or self.search_backend
@@ -581,24 +883,26 @@ class API:
     ]
 
     # Initial message to analyze the text and consider authors
+    with stage('render_prompt'):
+      system_prompt = self.templater.get_template('TOOL_CALLING.md').render(
+        excerpt=request.essay, num_authors=request.num_authors, authors=request.authors
+      )
     messages = [
-      {
-        'role': 'system',
-        'content': self.templater.get_template('TOOL_CALLING.md').render(
-          excerpt=request.essay, num_authors=request.num_authors, authors=request.authors
-        ),
-      },
+      {'role': 'system', 'content': system_prompt},
       {
         'role': 'user',
         'content': 'Find similar authors that matches the given criteria. Consider key terms, themes, and style elements that would yield relevant results.',
       },
     ]
 
+    tiers = self.router.route('authors', num_chars=len(request.essay), slo_s=remaining())
+    searches: dict[asyncio.Task[SearchResults], tuple[str, str]] = {}
     try:
-      logger.info('Synthesize search query')
+      logger.info('Synthesize search query with %s', tiers[0].name)
+      yield StreamingCall(task='llm-call', content={'tier': tiers[0].name, 'tools': request.use_tool})
       # First call: Let the model analyze and potentially use search tools
-      tool_caller = await self.llm_client.chat.completions.create(
-        model=LLM_ID,
+      tool_caller = await self._background_completion(
+        tiers[0],
         messages=messages,
         tools=tools,
         temperature=request.temperature,
@@ -616,39 +920,51 @@ class API:
       if assistant_message.tool_calls and request.use_tool:
         logger.info('Processing %d tool calls', len(assistant_message.tool_calls))
         queries = []
+        # tool responses go back to the model in the order of its tool calls, empty for failed searches
+        contents: dict[str, str] = {}
         for tool_call in assistant_message.tool_calls:
           if tool_call.function.name == 'search_tool':
+            contents[tool_call.id] = '<empty>'
             try:
               # Parse the arguments - Qwen/vLLM provides JSON string
-              args = json.loads(tool_call.function.arguments)
+              args = loads(tool_call.function.arguments)
               search_query = args.get('query', '')
-              logger.info('Executing search for: "%s"', search_query)
-              queries.append(search_query)
-
-              # Execute the search using the configured backend
-              search_results = await self.search(
-                search_query, backend=search_backend, num_results=request.num_search_results
-              )
-              logger.info('Found %d search results', len(search_results.items))
-
-              # Add the tool response to messages
-              messages.append({
-                'role': 'tool',
-                'tool_call_id': tool_call.id,
-                'name': 'search_tool',
-                'content': search_results.model_dump_json(),
-              })
-
+            except Exception as e:
+              logger.error('Search error: Error executing search tool: %s', e)
+              tool = StreamingToolCall(tool='search_tool', content=tool_call.function.arguments)
+              yield StreamingCall(task='tool-error', content=tool, error=str(e))
+              continue
+            logger.info('Executing search for: "%s"', search_query)
+            queries.append(search_query)
+            yield StreamingCall(task='tool-start', content=StreamingToolCall(tool='search_tool', content=search_query))
+            # Execute the search using the configured backend, all searches run concurrently
+            search = self.search(search_query, backend=search_backend, num_results=request.num_search_results)
+            searches[asyncio.create_task(search)] = (tool_call.id, search_query)
+
+        pending = set(searches)
+        while pending:
+          done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+          for search in done:
+            tool_call_id, search_query = searches[search]
+            try:
+              search_results = search.result()
             except Exception as e:
               # Handle errors in tool execution
-              error_message = f'Error executing search tool: {e!s}'
-              logger.error('Search error: %s', error_message)
-              messages.append({
-                'role': 'tool',
-                'tool_call_id': tool_call.id,
-                'name': 'search_tool',
-                'content': '<empty>',
-              })
+              logger.error('Search error: Error executing search tool: %s', e)
+              tool = StreamingToolCall(tool='search_tool', content=search_query)
+              yield StreamingCall(task='tool-error', content=tool, error=str(e))
+              continue
+            logger.info('Found %d search results', len(search_results.items))
+            contents[tool_call_id] = search_results.model_dump_json()
+            tool = StreamingToolCall(tool='search_tool', content=search_results.model_dump())
+            yield StreamingCall(task='tool-result', content=tool)
+
+        # Add the tool responses to messages
+        messages.extend(
+          {'role': 'tool', 'tool_call_id': tool_call_id, 'name': 'search_tool', 'content': content}
+          for tool_call_id, content in contents.items()
+        )
+        yield StreamingCall(task='tool-end', content={'queries': queries})
 
         section = 'the search results and the excerpt' if queries else 'the excerpt'
         # Add a prompt to use the search results
@@ -658,15 +974,17 @@ class API:
         })
 
         logger.info('Making final completion with guided_json')
+        yield StreamingCall(task='llm-call', content={'tier': tiers[0].name, 'tools': False})
 
         # Final call: Generate structured output with guided_json and enable reasoning
         # For Qwen models with vLLM, guided_json is the recommended structured output format
-        completions = await self.llm_client.chat.completions.create(
-          model=LLM_ID,
+        completions = await self._guided_completion(
+          tiers,
+          AuthorSchema,
           messages=messages,
           temperature=request.temperature * 0.88,  # Slightly lower temperature for more consistent output
           max_tokens=request.max_tokens,
-          extra_body={'guided_json': AuthorSchema.model_json_schema()},
+          extra_body={'guided_json': GUIDED_SCHEMAS.get(AuthorSchema)},
         )
 
         # Parse the response which may contain reasoning
@@ -675,13 +993,13 @@ class API:
           reasoning_content = completions.choices[0].message.reasoning_content
           logger.info('reasoning logics: %s', reasoning_content)
 
-          authors_data = json.loads(content)
+          authors_data = loads(content)
           authors_list = authors_data.get('authors', [])
           logger.info('Found %d authors: %s', len(authors_list), authors_list)
-          return Authors(authors=authors_list, queries=queries)
+          result = StreamingCall(task='llm-result', content=Authors(authors=authors_list, queries=queries))
         except Exception as e:
           logger.error('Error parsing final authors response: %s', e)
-          return Authors(authors=DEFAULT_AUTHORS)
+          result = StreamingCall(task='llm-result', content=Authors(authors=DEFAULT_AUTHORS), error=str(e))
       else:
         logger.info('No tool calls, parsing initial response')
         # The model already generated a response without using tools
@@ -691,10 +1009,10 @@ class API:
           logger.info('reasoning logics: %s', reasoning_content)
 
           # Try regular JSON parsing
-          authors_data = json.loads(content)
+          authors_data = loads(content)
           authors_list = authors_data.get('authors', [])
           logger.info('Found %d authors: %s', len(authors_list), authors_list)
-          return Authors(authors=authors_list)
+          result = StreamingCall(task='llm-result', content=Authors(authors=authors_list))
         except Exception:
           logger.info('Initial response not in JSON format, making final guided_json request')
           # If the output is not JSON, make a final request with guided_json
@@ -702,13 +1020,15 @@ class API:
             'role': 'user',
             'content': "Please format your response as a valid JSON object with a single key 'authors' and a list of author names as strings.",
           })
+          yield StreamingCall(task='llm-call', content={'tier': tiers[0].name, 'tools': False})
 
-          completions = await self.llm_client.chat.completions.create(
-            model=LLM_ID,
+          completions = await self._guided_completion(
+            tiers,
+            Authors,
             messages=messages,
             temperature=request.temperature,
             max_tokens=request.max_tokens,
-            extra_body={'guided_json': Authors.model_json_schema()},
+            extra_body={'guided_json': GUIDED_SCHEMAS.get(Authors)},
           )
 
           try:
@@ -717,26 +1037,91 @@ class API:
             logger.info('reasoning logics: %s', reasoning_content)
 
             # Standard JSON parsing
-            authors_data = json.loads(content)
+            authors_data = loads(content)
             authors_list = authors_data.get('authors', [])
             logger.info('Found %d authors from final request: %s', len(authors_list), authors_list)
-            return Authors(authors=authors_list)
+            result = StreamingCall(task='llm-result', content=Authors(authors=authors_list))
           except Exception as inner_e:
             logger.error('Error generating final authors list: %s', inner_e)
-            return Authors(authors=DEFAULT_AUTHORS)
+            result = StreamingCall(task='llm-result', content=Authors(authors=DEFAULT_AUTHORS), error=str(inner_e))
 
+    except TimeoutError:
+      logger.warning('Request deadline exceeded, returning default authors')
+      result = StreamingCall(
+        task='llm-result', content=Authors(authors=DEFAULT_AUTHORS), error='Request deadline exceeded'
+      )
     except Exception as e:
       logger.error('Error in authors function: %s', e)
       logger.error(traceback.format_exc())
-      return Authors(authors=DEFAULT_AUTHORS)
+      result = StreamingCall(task='llm-result', content=Authors(authors=DEFAULT_AUTHORS), error=str(e))
+    finally:
+      # e.g. the client of /authors/stream went away mid-search
+      for search in searches:
+        search.cancel()
+    yield result
+
+  async def _background_completion(self, tier: ModelTier, **kwargs: t.Any) -> t.Any:
+    # raises CircuitOpenError right away while the LLM is down, callers fall back to their defaults.
+    # Within the client's deadline (/authors, /authors/stream), including the time queued for admission
+    async with within_deadline(), self.llm_breaker.guard(), self.scheduler.slot('background'):
+      start = time.perf_counter()
+      completion = await tier.upstream.aopenai.chat.completions.create(model=tier.model_id, **kwargs)
+      record_span(f'completion_{tier.name}', start)
+    record_usage('authors', completion.usage)
+    return completion
+
+  async def _guided_completion(
+    self, tiers: list[ModelTier], schema: type[pydantic.BaseModel], **kwargs: t.Any
+  ) -> t.Any:
+    """Guided completion from the first tier whose output validates against ``schema``, see ``cascade``."""
+
+    async def complete(tier: ModelTier) -> t.AsyncGenerator[t.Any, None]:
+      yield await self._background_completion(tier, **kwargs)
+
+    def valid(completions: list[t.Any]) -> bool:
+      try:
+        schema.model_validate_json(completions[0].choices[0].message.content or '')
+        return True
+      except pydantic.ValidationError:
+        return False
+
+    return [it async for it in cascade('authors', tiers, complete, valid)][-1]
+
+  @staticmethod
+  def _valid_suggestions(chunks: list[str]) -> bool:
+    # the engine streams deltas of the guided JSON, so the whole output is only checked once it is done
+    try:
+      content = ''.join(Suggestion.model_validate_json(it).suggestion for it in chunks if it)
+      SuggestionsSchema.model_validate_json(content)
+      return True
+    except pydantic.ValidationError:
+      return False
+
+  @staticmethod
+  def _first_suggestion_valid(chunks: list[str]) -> bool:
+    # partial strings are left out of partial JSON, so the first item only parses once its text is complete
+    try:
+      content = ''.join(Suggestion.model_validate_json(it).suggestion for it in chunks if it)
+      SuggestionResponseSchema.model_validate(pydantic_core.from_json(content, allow_partial=True)['suggestions'][0])
+      return True
+    except (ValueError, TypeError, KeyError, IndexError):
+      return False
 
   async def search(self, query: str, backend: t.Literal['exa'] | str = 'exa', num_results: int = 10) -> SearchResults:
     if backend == 'exa':
-      if self.exa is None:
-        raise ValueError('Currently only exa is supported')
-      result = self.exa.search_and_contents(
-        query, num_results=num_results, use_autoprompt=True, text=True, type='auto', highlights=True, summary=True
-      )
+      # exa's client is blocking, so concurrent searches run on threads instead of stalling the event loop.
+      # Past the deadline the search is abandoned, its thread finishes in the background
+      async with within_deadline():
+        result = await asyncio.to_thread(
+          self.exa.search_and_contents,
+          query,
+          num_results=num_results,
+          use_autoprompt=True,
+          text=True,
+          type='auto',
+          highlights=True,
+          summary=True,
+        )
       return SearchResults(
         query=query,
         items=[
@@ -747,72 +1132,307 @@ class API:
     else:
       raise ValueError(f'Unsupported search backend: {backend}')
 
+  async def _excerpt_vector(self, vault_id: str, excerpt: str) -> np.ndarray | None:
+    """Unit embedding of a suggestion excerpt, or None when the embeddings are unavailable or too slow."""
+    if not self.embed_breaker.allow():
+      return None
+    try:
+      with self.embedder(vault_id) as (_, embed):
+        async with asyncio.timeout(SUGGEST_CACHE_EMBED_TIMEOUT_S):
+          result = await embed.generate(content=[excerpt])
+      record_usage('suggests_cache', result.usage)
+      return SuggestionCache.normalize(result.data[0].embedding)
+    except Exception as e:
+      logger.warning('Skipping the suggestion cache, failed to embed the excerpt: %s', e)
+      return None
+
+  async def _refresh_suggestions(
+    self, vault_id: str, cached: CachedSuggestions, digest: str, vector: np.ndarray | None, **generate: t.Any
+  ) -> None:
+    """Regenerate a stale cache entry with background priority, while hits keep being served from it."""
+    chunks: list[str] = []
+    try:
+      async with self.llm_breaker.guard(), self.scheduler.slot('background'):
+        async for chunk in self.llm.generate(**generate):
+          if ENGINE_ERROR in chunk:
+            return
+          chunks.append(chunk)
+    except Exception as e:
+      logger.warning('Failed to refresh cached suggestions: %s', e)
+      return
+    finally:
+      self._refreshing.discard(digest)
+    if vector is None:  # exact hit, i.e. the same excerpt
+      cached.payload, cached.created_at = ''.join(chunks), time.monotonic()
+    else:
+      SUGGEST_CACHE.put(vault_id, vector, CachedSuggestions(cached.context, digest, ''.join(chunks)))
+
   @bentoml.api
   async def suggests(self, request: SuggestRequest, /) -> t.AsyncGenerator[str, None]:
-    # TODO: add tonality lookup and steering vector strength for influence the distributions
-    # for now, we will just use the features lookup from given SAEs constrasted with the models.
-    messages = [
-      dict(
-        role='user',
-        content=self.templater.get_template('SYSTEM_PROMPT.md').render(
-          num_suggestions=request.num_suggestions,
-          notes=request.notes,
-          authors=request.authors,
-          tonality=request.tonality.model_dump_json(exclude_defaults=True) if request.tonality else None,
-          excerpt=request.essay,
-        ),
-      )
-    ]
-
-    async for chunk in self.llm.generate(
+    timer = TokenTimer('suggests')
+    tonality = request.tonality.model_dump(exclude_defaults=True) if request.tonality else {}
+    # with steering, the engine adds the SAE features of the tonality to the residual stream instead of the prompt
+    steering = tonality if TONALITY == 'steering' and tonality else None
+    with stage('render_prompt'):
+      messages = [
+        dict(
+          role='user',
+          content=self.templater.get_template('SYSTEM_PROMPT.md').render(
+            num_suggestions=request.num_suggestions,
+            notes=request.notes,
+            authors=request.authors,
+            tonality=json.dumps(tonality, separators=(',', ':')) if tonality and steering is None else None,
+            excerpt=request.essay,
+          ),
+        )
+      ]
+    generate = dict(
       messages=messages,
       temperature=request.temperature,
       max_tokens=request.max_tokens,
       top_p=request.top_p,
       usage=request.usage,
-    ):
-      yield chunk
+      steering=steering,
+    )
 
-  @bentoml.task
-  async def notes(self, note: NotesRequest, /) -> NotesResponse:
+    # near-duplicate excerpts of the same vault and context are answered from the cache, even while the LLM is down
+    vector, digest, context = None, '', ''
+    if SUGGEST_CACHE.enabled and request.vault_id and request.cache:
+      context = SuggestionCache.context(
+        authors=request.authors,
+        tonality=tonality,
+        notes=[it.content for it in request.notes or []],
+        num_suggestions=request.num_suggestions,
+      )
+      digest = SuggestionCache.digest(context, request.essay)
+      if (cached := SUGGEST_CACHE.exact(request.vault_id, digest)) is None:
+        if (vector := await self._excerpt_vector(request.vault_id, request.essay)) is not None:
+          cached = SUGGEST_CACHE.nearest(request.vault_id, context, vector)
+      if cached is not None:
+        if SUGGEST_CACHE_REFRESH_S and cached.age_s > SUGGEST_CACHE_REFRESH_S and digest not in self._refreshing:
+          self._refreshing.add(digest)
+          refresh = self._refresh_suggestions(request.vault_id, cached, digest, vector, **generate)
+          self._background.add(task := asyncio.create_task(refresh))
+          task.add_done_callback(self._background.discard)
+        yield cached.payload
+        return
+
+    if not self.llm_breaker.allow():
+      yield suggestion_frame('The model is warming up, please try again shortly')
+      return
+    if not admit():
+      return  # answered with 429 by LoadShedMiddleware
+
+    tiers = self.router.route('suggests', num_chars=len(request.essay), slo_s=remaining())
+    last = ''
+    chunks: list[str] | None = [] if vector is not None else None
+    try:
+      # time spent queued for admission counts against the client's deadline too
+      async with within_deadline(), self.scheduler.slot('interactive'):
+        stream = cascade(
+          'suggests',
+          tiers,
+          lambda tier: tier.llm.generate(**generate),
+          self._valid_suggestions,
+          self._first_suggestion_valid,
+        )
+        async for chunk in stream:
+          if chunk:  # the engine sends an empty chunk once prefill is done
+            timer.tick()
+            last = chunk
+            if chunks is not None:
+              chunks.append(chunk)
+          yield chunk
+      if vector is not None and chunks and ENGINE_ERROR not in last:
+        SUGGEST_CACHE.put(request.vault_id or '', vector, CachedSuggestions(context, digest, ''.join(chunks)))
+    except TimeoutError:
+      yield suggestion_frame('Request deadline exceeded, please try again')
+    finally:
+      timer.finish()
+      # usage stats are cumulative, so only the last chunk is parsed
+      if last and request.usage:
+        with contextlib.suppress(pydantic.ValidationError):
+          record_usage('suggests', Suggestion.model_validate_json(last).usage)
+
+  @staticmethod
+  def _respond(ctx: bentoml.Context, response: pydantic.BaseModel) -> Response:
+    """``response`` serialized as negotiated by the request's ``Accept``, which BentoML sends as-is."""
+    return negotiate(ctx.request.headers.get('accept')).response(response)
+
+  # the model is only the documented schema, responses are serialized by `_respond`
+  @bentoml.task(output_spec=NotesResponse)
+  async def notes(self, note: NotesRequest, /, ctx: bentoml.Context) -> Response:
     try:
-      result = await self.embed.generate(content=[note.content])
-      return NotesResponse(
-        embedding=result.data[0].embedding, usage=result.usage, **note.model_dump(exclude={'content'})
+      async with self.embed_breaker.guard():
+        with self.embedder(note.vault_id) as (_, embed):
+          result = await self.embed_hedger.run(lambda: embed.generate(content=[note.content]))
+      record_usage('notes', result.usage)
+      return self._respond(
+        ctx,
+        NotesResponse(embedding=result.data[0].embedding, usage=result.usage, **note.model_dump(exclude={'content'})),
       )
     except Exception as e:
       traceback.print_exc()
-      return NotesResponse(embedding=[], error=str(e), **note.model_dump(exclude={'content'}))
+      return self._respond(ctx, NotesResponse(embedding=[], error=str(e), **note.model_dump(exclude={'content'})))
+
+  @staticmethod
+  def _essay_fields(essay: EssayRequest) -> dict[str, t.Any]:
+    fields = essay.model_dump(include={'vault_id', 'file_id', 'format'})
+    if essay.format == 'compact':
+      fields['metadata'] = {
+        'chunker': essay.chunker or CHUNKER,
+        'num_chars': len(essay.content),
+        'num_lines': essay.content.count('\n') + 1,
+      }
+    return fields
 
-  @bentoml.task
-  async def essays(self, essay: EssayRequest, /) -> EssayResponse:
+  @staticmethod
+  def _as_essay_node(node: BaseNode, format: EssayFormat) -> EssayNode | CompactEssayNode:
+    return (CompactEssayNode if format == 'compact' else EssayNode).from_node(node)
+
+  @bentoml.task(output_spec=EssayResponse)
+  async def essays(self, essay: EssayRequest, /, ctx: bentoml.Context) -> Response:
     try:
-      result = await self.pipeline.arun(
-        show_progress=True,
-        documents=[Document(text=essay.content, doc_id=essay.file_id, metadata=essay.model_dump())],
-        num_workers=multiprocessing.cpu_count(),
-      )
-      return EssayResponse(
-        nodes=[
-          EssayNode(
-            embedding=it.embedding,
-            node_id=it.node_id,
-            metadata=it.metadata,
-            relationships=it.relationships,
-            metadata_separator=it.metadata_separator,
-          )
-          for it in result
-        ],
-        **essay.model_dump(exclude={'content'}),
-      )
+      if not self.embed_breaker.allow():
+        raise CircuitOpenError('embed', self.embed_breaker.retry_after)
+      with self.embedder(essay.vault_id) as (replica, _):
+        ingestion = await self.ingestion(replica)
+        # Runs on the shared ingest pool, queued fairly per vault with other concurrent ingests
+        result = await self.ingest_pool.run(
+          essay.vault_id,
+          ingestion.pipelines[essay.chunker or CHUNKER].run,
+          show_progress=False,
+          documents=[ingestion.document(essay)],
+        )
+      nodes = [self._as_essay_node(it, essay.format) for it in result]
+      return self._respond(ctx, EssayResponse(nodes=nodes, **self._essay_fields(essay)))
     except Exception as e:
       traceback.print_exc()
-      return EssayResponse(nodes=[], error=str(e), **essay.model_dump(exclude={'content'}))
+      return self._respond(ctx, EssayResponse(nodes=[], error=str(e), **self._essay_fields(essay)))
+
+  @bentoml.api(route='/essays/stream')
+  async def essays_stream(self, essay: EssayRequest, /, ctx: bentoml.Context):
+    """Stream essay nodes as NDJSON (or msgpack) as soon as each one is embedded, followed by a summary frame.
+
+    Chunks are processed in batches of STREAM_BATCH_SIZE, each going through line numbers, titling and embedding
+    independently, so early chunks are emitted while later ones are still being processed. At most
+    STREAM_MAX_BATCHES are in flight, and a batch is released once its nodes are written.
+    """
+    codec = negotiate(ctx.request.headers.get('accept'))
+
+    async def process(ingestion: Ingestion, batch: list[BaseNode]) -> list[BaseNode]:
+      await self.ingest_pool.run(essay.vault_id, ingestion.line_extractor, batch)
+      async with within_deadline():
+        await ingestion.title_extractor.acall(batch)
+        return t.cast('list[BaseNode]', await ingestion.chunk_embedder.acall(batch))
+
+    async def stream_nodes() -> t.AsyncGenerator[bytes, None]:
+      start_time, num_nodes, error = time.perf_counter(), 0, ''
+      tasks: set[asyncio.Task[list[BaseNode]]] = set()
+      done: set[asyncio.Task[list[BaseNode]]] = set()
+      try:
+        if not self.embed_breaker.allow():
+          raise CircuitOpenError('embed', self.embed_breaker.retry_after)
+        with self.embedder(essay.vault_id) as (replica, _):
+          ingestion = await self.ingestion(replica)
+          chunker = ingestion.chunkers[essay.chunker or CHUNKER]
+          nodes = await self.ingest_pool.run(essay.vault_id, chunker, [ingestion.document(essay)])
+          batches = collections.deque(
+            nodes[i : i + STREAM_BATCH_SIZE] for i in range(0, len(nodes), STREAM_BATCH_SIZE)
+          )
+          del nodes
+          while batches or tasks:
+            while batches and len(tasks) < STREAM_MAX_BATCHES:
+              tasks.add(asyncio.create_task(process(ingestion, batches.popleft())))
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            while done:
+              for node in done.pop().result():
+                num_nodes += 1
+                yield codec.frame(EssayNodeFrame(node=self._as_essay_node(node, essay.format)))
+      except TimeoutError:
+        error = 'Request deadline exceeded'
+      except Exception as e:
+        traceback.print_exc()
+        error = str(e)
+      finally:
+        for task in tasks:
+          task.cancel()
+        # batches that failed along with the reported one, e.g. all past the deadline
+        for task in done:
+          task.exception()
+      yield codec.frame(
+        EssaySummaryFrame(
+          num_nodes=num_nodes,
+          elapsed_ms=round((time.perf_counter() - start_time) * 1000, 2),
+          error=error,
+          **self._essay_fields(essay),
+        )
+      )
+
+    return StreamingResponse(stream_nodes(), media_type=codec.stream_media_type)
+
+  @app.get('/ingest/stats')
+  def ingest_stats(self) -> WorkerPoolStats:
+    return self.ingest_pool.stats()
+
+  @app.get('/scheduler/stats')
+  def scheduler_stats(self) -> SchedulerStats:
+    return self.scheduler.stats()
+
+  @app.get('/limiter/stats')
+  def limiter_stats(self) -> LimiterStats:
+    return self.limiter.stats()
+
+  @staticmethod
+  def _unauthorized(authorization: str | None) -> JSONResponse | None:
+    """The error response of a /debug request, None if it carries the DEBUG_TOKEN."""
+    if not DEBUG_TOKEN:
+      return JSONResponse(
+        content=ErrorResponse(message='Not Found', type='NotFound', code=404).model_dump(), status_code=404
+      )
+    if not hmac.compare_digest((authorization or '').encode(), f'Bearer {DEBUG_TOKEN}'.encode()):
+      return JSONResponse(
+        content=ErrorResponse(message='Invalid debug token', type='Unauthorized', code=401).model_dump(),
+        status_code=401,
+        headers={'WWW-Authenticate': 'Bearer'},
+      )
+    return None
+
+  @app.get('/debug/profile', response_model=None)
+  async def debug_profile(
+    self,
+    seconds: t.Annotated[float, fastapi.Query(gt=0, le=MAX_PROFILE_S)] = 10,
+    authorization: t.Annotated[str | None, fastapi.Header()] = None,
+  ) -> PlainTextResponse | JSONResponse:
+    """Collapsed stacks of every thread of this worker over ``seconds``, for flamegraph.pl, inferno or speedscope."""
+    if (error := self._unauthorized(authorization)) is not None:
+      return error
+    try:
+      stacks = await asyncio.to_thread(self.profiler.profile, seconds)
+    except ProfilerBusyError as e:
+      return JSONResponse(
+        content=ErrorResponse(message=str(e), type='Conflict', code=409).model_dump(), status_code=409
+      )
+    return PlainTextResponse(stacks)
+
+  @app.get('/debug/slow', response_model=None)
+  def debug_slow(
+    self, authorization: t.Annotated[str | None, fastapi.Header()] = None
+  ) -> SlowRequestStats | JSONResponse:
+    return self._unauthorized(authorization) or SLOW_REQUESTS.stats()
 
   @app.get('/metadata')
   def metadata(self) -> MetadataResponse:
     return MetadataResponse.model_construct(
       llm={'model_id': LLM_ID, 'model_type': MODEL_TYPE, 'structured_outputs': llm_['structured_output_backend']},
+      tiers=[
+        {
+          'model_id': it.model_id,
+          'model_type': it.name,
+          'structured_outputs': ReasoningModels[t.cast(ModelType, it.name)]['structured_output_backend'],
+        }
+        for it in self.router.tiers
+      ],
       embed={
         'model_id': EMBED_ID,
         'model_type': EMBED_TYPE,
@@ -824,24 +1444,29 @@ class API:
 
   @bentoml.api
   async def health(self, request: HealthRequest, /) -> HealthResponse:
-    async def check_service_health(service: RemoteProxy, name: str) -> DependentStatus:
-      health = DependentStatus(name=name)
-      try:
-        start_time = time.time()
-        health.healthy = await service.is_ready(request.timeout)
-        health.latency_ms = round((time.time() - start_time) * 1000, 2)
-      except Exception as e:
-        health.healthy = False
-        health.error = str(e)
-      return health
+    """Served from the background health monitor, so probes from load balancers never reach the engines."""
+    return self.health_monitor.health()
 
-    healthcheck = await asyncio.gather(*[
-      asyncio.create_task(check_service_health(t.cast('RemoteProxy', h), name))
-      for h, name in zip([self.llm, self.embed], ['llm', 'embed'])
-    ])
 
-    return HealthResponse(
-      services=healthcheck,
-      healthy=all(map(lambda x: x.healthy, healthcheck)),
-      timestamp=datetime.datetime.now(datetime.timezone.utc).isoformat(),
-    )
+# outermost, so that timelines cover forwarding and shedding too
+if SLOW_REQUESTS.enabled:
+  API.add_asgi_middleware(
+    TimelineMiddleware, recorder=SLOW_REQUESTS, exclude_paths=['/debug/profile', '/debug/slow', '/metrics']
+  )
+if GATEWAY_URL in GATEWAY_REPLICAS:
+  API.add_asgi_middleware(
+    VaultAffinityMiddleware,
+    ring=HashRing(GATEWAY_REPLICAS, name='gateway', load_factor=AFFINITY_LOAD_FACTOR),
+    url=GATEWAY_URL,
+    paths=['/suggests', '/essays/stream'],
+  )
+API.add_asgi_middleware(DeadlineMiddleware, exclude_paths=['/authors/submit', '/essays/submit', '/notes/submit'])
+API.add_asgi_middleware(
+  LoadShedMiddleware,
+  limiter=LIMITER,
+  limited_paths=['/v1/chat/completions'],
+  # cache hits are replayed without a slot, see `admit` in `suggests`
+  deferred_paths=['/suggests'],
+  shed_paths=['/authors/submit', '/authors/stream', '/essays/submit', '/essays/stream'],
+  allow_origins=SERVICE_CONFIG['http']['cors']['access_control_allow_origins'],
+)
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import asyncio, contextlib
+
+import fastapi, httpx
+
+from libs.affinity import HashRing, VaultAffinityMiddleware
+from libs.transport import ASGIStreamTransport
+
+VAULTS = [f'vault-{i}' for i in range(3000)]
+
+
+def test_hash_ring_balances_and_remaps_only_to_new_replicas():
+  ring = HashRing(['a', 'b', 'c'])
+  before = {it: ring.owner(it) for it in VAULTS}
+  assert all(0.2 < list(before.values()).count(it) / len(VAULTS) < 0.47 for it in 'abc')
+
+  ring.add('d')
+  moved = {it for it in VAULTS if ring.owner(it) != before[it]}
+  assert {ring.owner(it) for it in moved} == {'d'}
+  assert 0.15 < len(moved) / len(VAULTS) < 0.35
+  ring.remove('d')
+  assert {it: ring.owner(it) for it in VAULTS} == before
+
+
+def test_hash_ring_spills_a_hot_vault_past_the_load_bound():
+  ring = HashRing(['a', 'b', 'c'], load_factor=1.25)
+  with contextlib.ExitStack() as stack:
+    replicas = [stack.enter_context(ring.acquire('hot')) for _ in range(12)]
+    assert replicas[0] == ring.owner('hot')
+    assert max(ring.loads.values()) <= 5 and len(set(replicas)) == 3
+  assert set(ring.loads.values()) == {0}
+
+
+def test_affinity_middleware_forwards_to_the_owning_gateway():
+  def gateway(name: str) -> fastapi.FastAPI:
+    app = fastapi.FastAPI()
+
+    @app.post('/suggests')
+    async def suggests(request: fastapi.Request):
+      return {'replica': name, 'vault_id': (await request.json())['vault_id']}
+
+    return app
+
+  ring = HashRing(['http://a', 'http://b'])
+  peer = httpx.AsyncClient(transport=ASGIStreamTransport(gateway('b')))
+  local = VaultAffinityMiddleware(gateway('a'), ring=ring, url='http://a', paths=['/suggests'], client=peer)
+
+  async def main() -> dict[str, str]:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(local), base_url='http://a') as client:
+      # one at a time, so that no replica is past its load bound
+      results = [await client.post('/suggests', json={'vault_id': it}) for it in VAULTS[:20]]
+    await peer.aclose()
+    return {it.json()['vault_id']: it.json()['replica'] for it in results}
+
+  assert asyncio.run(main()) == {it: ring.owner(it).removeprefix('http://') for it in VAULTS[:20]}
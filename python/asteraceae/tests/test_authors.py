@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio, time, types, typing as t
+
+import jinja2
+
+from openai.types.chat import ChatCompletion
+
+from libs.health import CircuitBreaker
+from libs.resilience import DEADLINE
+from libs.router import ModelRouter, ModelTier
+from libs.protocol import Authors
+from libs.scheduler import AdmissionScheduler
+from service import DEFAULT_AUTHORS, PRIORITY_CLASSES, WORKING_DIR, API, AuthorRequest, SearchResults, StreamingCall
+
+DELAYS = {'camus': 0.05, 'kafka': 0.0}
+
+
+class FakeAPI:
+  """Just enough of the gateway for `_author_events`, with canned completions and searches."""
+
+  search_backend = 'exa'
+  templater = jinja2.Environment(loader=jinja2.FileSystemLoader(searchpath=WORKING_DIR))
+
+  def __init__(self):
+    self.llm_breaker = CircuitBreaker('llm')
+    self.router = ModelRouter([], ModelTier('default', 'default', None, None))
+    self.messages: list[dict[str, t.Any]] = []
+
+  async def _background_completion(self, tier: ModelTier, **kwargs: t.Any) -> ChatCompletion:
+    tool_calls = [
+      {'id': query, 'type': 'function', 'function': {'name': 'search_tool', 'arguments': f'{{"query": "{query}"}}'}}
+      for query in DELAYS
+    ]
+    message = {'role': 'assistant', 'content': None, 'tool_calls': tool_calls}
+    choice = {'index': 0, 'finish_reason': 'tool_calls', 'message': message}
+    return ChatCompletion.model_validate({
+      'id': 'authors',
+      'object': 'chat.completion',
+      'created': 0,
+      'model': 'default',
+      'choices': [choice],
+    })
+
+  async def _guided_completion(self, tiers: list[ModelTier], schema: t.Any, **kwargs: t.Any) -> t.Any:
+    self.messages = kwargs['messages']
+    message = types.SimpleNamespace(content='{"authors": ["Albert Camus", "Franz Kafka"]}', reasoning_content='')
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+  async def search(self, query: str, **kwargs: t.Any) -> SearchResults:
+    await asyncio.sleep(DELAYS[query])
+    return SearchResults(query=query, items=[])
+
+
+def test_author_events_stream_searches_as_they_land():
+  api = FakeAPI()
+
+  async def events() -> list[StreamingCall]:
+    request = AuthorRequest(essay='one must imagine sisyphus happy')
+    return [it async for it in API.inner._author_events(api, request)]
+
+  result = asyncio.run(events())
+  assert [it.task for it in result] == [
+    'llm-call',
+    'tool-start',
+    'tool-start',
+    'tool-result',
+    'tool-result',
+    'tool-end',
+    'llm-call',
+    'llm-result',
+  ]
+  # searches run concurrently, so the faster one lands first, but go back to the model in tool call order
+  assert [it.content.content['query'] for it in result if it.task == 'tool-result'] == ['kafka', 'camus']
+  assert [it['tool_call_id'] for it in api.messages if it['role'] == 'tool'] == ['camus', 'kafka']
+  assert result[-1].model_dump()['content'] == {'authors': ['Albert Camus', 'Franz Kafka'], 'queries': list(DELAYS)}
+
+  # while the LLM is down, the stream is just the default authors
+  api.llm_breaker.trip()
+  [result] = asyncio.run(events())
+  assert result.task == 'llm-result' and result.error and result.content == Authors(authors=DEFAULT_AUTHORS)
+
+
+class HangingCompletions:
+  """OpenAI chat completions of an engine that never answers."""
+
+  def __init__(self):
+    self.cancelled = False
+
+  async def create(self, **kwargs: t.Any) -> ChatCompletion:
+    try:
+      await asyncio.Event().wait()
+    except asyncio.CancelledError:
+      self.cancelled = True
+      raise
+    raise AssertionError('unreachable')
+
+
+class HangingEngineAPI(FakeAPI):
+  """`FakeAPI` with the real `_background_completion`, against an engine that hangs."""
+
+  _background_completion = API.inner._background_completion
+
+  def __init__(self):
+    super().__init__()
+    self.completions = HangingCompletions()
+    upstream = types.SimpleNamespace(
+      aopenai=types.SimpleNamespace(chat=types.SimpleNamespace(completions=self.completions))
+    )
+    self.router = ModelRouter([], ModelTier('default', 'default', None, upstream))
+    self.scheduler = AdmissionScheduler(capacity=4, classes=PRIORITY_CLASSES)
+
+
+def test_authors_deadline_cancels_completion():
+  api = HangingEngineAPI()
+
+  async def events() -> list[StreamingCall]:
+    # as set by DeadlineMiddleware from `X-Request-Timeout: 0.05`
+    DEADLINE.set(time.monotonic() + 0.05)
+    request = AuthorRequest(essay='one must imagine sisyphus happy')
+    return [it async for it in API.inner._author_events(api, request)]
+
+  *_, result = asyncio.run(asyncio.wait_for(events(), timeout=5.0))
+  assert result.task == 'llm-result' and result.error == 'Request deadline exceeded'
+  assert result.content == Authors(authors=DEFAULT_AUTHORS)
+  # the engine call is cancelled, and the client's deadline does not count against the engine's health
+  assert api.completions.cancelled and api.llm_breaker.state == 'closed'
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import numpy as np
+
+from libs.cache import CachedSuggestions, SuggestionCache
+
+
+def entry(context: str, excerpt: str, payload: str) -> CachedSuggestions:
+  return CachedSuggestions(context, SuggestionCache.digest(context, excerpt), payload)
+
+
+def test_suggestion_cache_matches_near_duplicates_per_vault_and_context():
+  cache = SuggestionCache(threshold=0.95, maxsize=2)
+  context = SuggestionCache.context(authors=['Albert Camus'], tonality={}, notes=[], num_suggestions=3)
+  cache.put('vault', SuggestionCache.normalize([1.0, 0.0, 0.0]), entry(context, 'one must imagine', 'cached'))
+
+  near = SuggestionCache.normalize([1.0, 0.1, 0.0])
+  assert cache.nearest('vault', context, near).payload == 'cached'
+  assert cache.exact('vault', SuggestionCache.digest(context, 'one must imagine')).payload == 'cached'
+  assert cache.nearest('other-vault', context, near) is None
+  other = SuggestionCache.context(authors=[], tonality={}, notes=[], num_suggestions=3)
+  assert cache.nearest('vault', other, near) is None
+  assert cache.nearest('vault', context, SuggestionCache.normalize([0.0, 1.0, 0.0])) is None
+
+
+def test_suggestion_cache_evicts_least_recently_used_rows():
+  cache = SuggestionCache(threshold=0.99, maxsize=2)
+  vectors = np.eye(3, dtype=np.float32)
+  for i, excerpt in enumerate('abc'):
+    if i == 2:
+      cache.nearest('vault', 'ctx', vectors[0])  # keeps `a` warm, so `b` is evicted
+    cache.put('vault', vectors[i], entry('ctx', excerpt, excerpt))
+  assert [cache.nearest('vault', 'ctx', it) is not None for it in vectors] == [True, False, True]
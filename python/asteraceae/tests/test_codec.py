@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import json
+
+import msgpack, numpy as np
+
+from openai.types.completion_usage import CompletionUsage
+
+from libs.codec import JSONCodec, MsgpackCodec, negotiate, suggestion_frame
+from libs.protocol import CompactEssayNode, EssayNodeFrame, EssayResponse, NotesResponse, Suggestion
+
+
+def essay_response() -> EssayResponse:
+  nodes = [
+    CompactEssayNode(embedding=[0.5, -0.25, 0.125], node_id='a', start_line=1),
+    CompactEssayNode(embedding=None, node_id='b'),
+  ]
+  return EssayResponse(vault_id='vault', file_id='essay', format='compact', nodes=nodes)
+
+
+def test_negotiate_picks_the_most_preferred_supported_type():
+  assert isinstance(negotiate(None), JSONCodec)
+  assert isinstance(negotiate('*/*'), JSONCodec)
+  assert isinstance(negotiate('application/msgpack'), MsgpackCodec)
+  assert isinstance(negotiate('application/json, application/x-msgpack'), JSONCodec)
+  assert isinstance(negotiate('application/json;q=0.5, application/vnd.msgpack;q=0.9'), MsgpackCodec)
+  assert isinstance(negotiate('application/msgpack;q=oops, application/json'), JSONCodec)
+
+
+def test_json_codec_matches_pydantic():
+  response = essay_response()
+  assert json.loads(JSONCodec().dumps(response)) == json.loads(response.model_dump_json())
+  frame = JSONCodec().frame(EssayNodeFrame(node=response.nodes[0]))
+  assert frame.endswith(b'\n') and json.loads(frame)['node']['embedding'] == [0.5, -0.25, 0.125]
+
+
+def test_msgpack_codec_packs_embeddings_as_float32_buffers():
+  note = NotesResponse(vault_id='vault', file_id='file', note_id='note', embedding=[0.5, -0.25])
+  decoded = msgpack.unpackb(MsgpackCodec().dumps(note))
+  assert np.frombuffer(decoded.pop('embedding'), dtype='<f4').tolist() == [0.5, -0.25]
+  assert decoded == note.model_dump(exclude={'embedding'})
+
+  unpacker = msgpack.Unpacker()
+  unpacker.feed(b''.join(MsgpackCodec().frame(EssayNodeFrame(node=it)) for it in essay_response().nodes))
+  assert [it['node']['node_id'] for it in unpacker] == ['a', 'b']
+
+
+def test_suggestion_frame_matches_suggestion_json():
+  usage = CompletionUsage(prompt_tokens=10, completion_tokens=2, total_tokens=12)
+  assert (
+    suggestion_frame('happy ', usage=usage) == f'{Suggestion(suggestion="happy ", usage=usage).model_dump_json()}\n\n'
+  )
+  assert suggestion_frame('', 'hmm') == f'{Suggestion(suggestion="", reasoning="hmm").model_dump_json()}\n\n'
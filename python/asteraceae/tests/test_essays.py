@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import asyncio, contextlib, threading, time, types, typing as t
+
+import orjson, pydantic
+
+from llama_index.core.schema import Document, EnumNameSerializer, NodeRelationship, RelatedNodeType, TextNode
+
+from libs.codec import JSON, CODECS
+from libs.health import CircuitBreaker
+from libs.protocol import CompactEssayNode, EssayNode, EssayResponse
+from libs.resilience import DEADLINE
+from libs.workers import FairWorkerPool
+from service import STREAM_BATCH_SIZE, STREAM_MAX_BATCHES, API, EssayRequest
+
+NUM_BATCHES = STREAM_MAX_BATCHES + 2
+ESSAY = 'one must imagine\nsisyphus happy'
+
+
+class LegacyEssayNode(pydantic.BaseModel):
+  """`EssayNode` before the compact format, built straight from llama_index types."""
+
+  embedding: list[float] | None
+  node_id: str
+  metadata: dict[str, t.Any]
+  relationships: dict[t.Annotated[NodeRelationship, EnumNameSerializer], RelatedNodeType]
+  metadata_separator: str
+
+
+def essay_node() -> TextNode:
+  metadata = {'content': ESSAY, 'line_map': {1: 'one must imagine', 2: 'sisyphus happy'}}
+  node = TextNode(
+    text='one must imagine',
+    embedding=[0.5, 0.25],
+    start_char_idx=0,
+    end_char_idx=16,
+    metadata={**metadata, 'document_title': 'Sisyphus', 'start_line': 1, 'end_line': 1},
+  )
+  node.relationships[NodeRelationship.SOURCE] = Document(text=ESSAY, metadata=metadata).as_related_node_info()
+  node.relationships[NodeRelationship.NEXT] = TextNode(text='sisyphus happy').as_related_node_info()
+  return node
+
+
+def test_legacy_essay_node_is_unchanged():
+  node = essay_node()
+  legacy = LegacyEssayNode(
+    embedding=node.embedding,
+    node_id=node.node_id,
+    metadata=node.metadata,
+    relationships=node.relationships,
+    metadata_separator=node.metadata_separator,
+  ).model_dump_json()
+  assert EssayNode.from_node(node).model_dump_json() == legacy
+  assert CODECS[JSON].dumps(EssayNode.from_node(node)) == legacy.encode()
+
+
+def test_compact_essay_response_drops_duplicated_text():
+  node, request = essay_node(), EssayRequest(vault_id='vault', file_id='essay', content=ESSAY, format='compact')
+  compact = API.inner._as_essay_node(node, request.format)
+  assert isinstance(compact, CompactEssayNode)
+  assert compact.model_dump(exclude={'node_id', 'relationships'}) == {
+    'embedding': [0.5, 0.25],
+    'start_char_idx': 0,
+    'end_char_idx': 16,
+    'start_line': 1,
+    'end_line': 1,
+    'title': 'Sisyphus',
+  }
+  # same keys as the legacy format
+  assert compact.relationships == {
+    NodeRelationship.SOURCE.value: node.relationships[NodeRelationship.SOURCE].node_id,
+    NodeRelationship.NEXT.value: node.relationships[NodeRelationship.NEXT].node_id,
+  }
+  assert compact.relationships.keys() == EssayNode.from_node(node).relationships.keys()
+
+  response = CODECS[JSON].dumps(EssayResponse(nodes=[compact], **API.inner._essay_fields(request))).decode()
+  assert 'sisyphus happy' not in response and 'line_map' not in response
+  assert orjson.loads(response)['metadata'] == {'chunker': 'semantic', 'num_chars': len(ESSAY), 'num_lines': 2}
+
+
+class FakeIngestion:
+  """Stages of `Ingestion` that `essays_stream` calls, embedding every chunk once its batch is released."""
+
+  def __init__(self, *, hold_first: bool = True, fail: bool = False):
+    self.hold_first, self.fail = hold_first, fail
+    self.release = asyncio.Event()
+    self.running = self.max_running = 0
+    self.line_threads: set[str] = set()
+    self.cancelled = 0
+    self.chunkers = {'semantic': self.chunk}
+    self.title_extractor = types.SimpleNamespace(acall=self.title)
+    self.chunk_embedder = types.SimpleNamespace(acall=self.embed)
+
+  @staticmethod
+  def document(essay: EssayRequest) -> Document:
+    return Document(text=essay.content)
+
+  @staticmethod
+  def chunk(documents: list[t.Any]) -> list[TextNode]:
+    return [TextNode(text=f'chunk {i}') for i in range(NUM_BATCHES * STREAM_BATCH_SIZE)]
+
+  def line_extractor(self, nodes: list[TextNode]) -> None:
+    self.line_threads.add(threading.current_thread().name)
+
+  async def title(self, nodes: list[TextNode]) -> list[TextNode]:
+    self.running += 1
+    self.max_running = max(self.max_running, self.running)
+    try:
+      if self.hold_first or nodes[0].text != 'chunk 0':
+        await self.release.wait()
+    except asyncio.CancelledError:
+      self.cancelled += 1
+      raise
+    finally:
+      self.running -= 1
+    return nodes
+
+  async def embed(self, nodes: list[TextNode]) -> list[TextNode]:
+    if self.fail and nodes[0].text != 'chunk 0':
+      raise RuntimeError('embed engine went away')
+    for node in nodes:
+      node.embedding = [0.5]
+    return nodes
+
+
+class FakeAPI:
+  """Just enough of the gateway for `essays_stream`."""
+
+  _essay_fields = staticmethod(API.inner._essay_fields)
+  _as_essay_node = staticmethod(API.inner._as_essay_node)
+
+  def __init__(self, ingestion: FakeIngestion):
+    self._ingestion = ingestion
+    self.embed_breaker = CircuitBreaker('embed')
+    self.ingest_pool = FairWorkerPool(max_workers=2)
+
+  @contextlib.contextmanager
+  def embedder(self, vault_id: str) -> t.Iterator[tuple[str, None]]:
+    yield 'embed', None
+
+  async def ingestion(self, replica: str) -> FakeIngestion:
+    return self._ingestion
+
+
+async def stream(api: FakeAPI) -> t.AsyncIterator[bytes]:
+  ctx = types.SimpleNamespace(request=types.SimpleNamespace(headers={}))
+  request = EssayRequest(vault_id='vault', file_id='essay', content='one must imagine sisyphus happy')
+  response = await API.inner.essays_stream.func(api, request, ctx=ctx)
+  return response.body_iterator
+
+
+def test_essays_stream_bounds_in_flight_batches():
+  ingestion = FakeIngestion()
+
+  async def main() -> list[dict[str, t.Any]]:
+    api = FakeAPI(ingestion)
+    api.ingest_pool.start()
+    body = await stream(api)
+    first = asyncio.create_task(anext(body))
+    await asyncio.sleep(0.05)
+    # the other batches only start once one of the first ones is written
+    assert ingestion.running == STREAM_MAX_BATCHES and not first.done()
+    ingestion.release.set()
+    frames = [orjson.loads(await first)] + [orjson.loads(frame) async for frame in body]
+    api.ingest_pool.shutdown()
+    return frames
+
+  frames = asyncio.run(main())
+  *nodes, summary = frames
+  assert [it['type'] for it in nodes] == ['node'] * NUM_BATCHES * STREAM_BATCH_SIZE
+  assert all(it['node']['embedding'] == [0.5] for it in nodes)
+  assert summary['type'] == 'summary' and summary['num_nodes'] == len(nodes) and summary['error'] == ''
+  assert ingestion.max_running == STREAM_MAX_BATCHES
+  assert {it.rpartition('_')[0] for it in ingestion.line_threads} == {'ingest'}
+
+
+def test_essays_stream_reports_errors_in_summary():
+  async def main() -> list[dict[str, t.Any]]:
+    api = FakeAPI(FakeIngestion(hold_first=False, fail=True))
+    api._ingestion.release.set()
+    api.ingest_pool.start()
+    frames = [orjson.loads(frame) async for frame in await stream(api)]
+    api.ingest_pool.shutdown()
+    return frames
+
+  *nodes, summary = asyncio.run(main())
+  assert len(nodes) == summary['num_nodes'] <= STREAM_BATCH_SIZE
+  assert summary['error'] == 'embed engine went away'
+
+
+def test_essays_stream_cancels_pending_batches_on_disconnect():
+  ingestion = FakeIngestion(hold_first=False)
+
+  async def main() -> None:
+    api = FakeAPI(ingestion)
+    api.ingest_pool.start()
+    body = await stream(api)
+    await anext(body)
+    await asyncio.sleep(0.05)
+    # the client goes away while the other batches are still being titled
+    await body.aclose()
+    await asyncio.sleep(0)
+    api.ingest_pool.shutdown()
+
+  asyncio.run(main())
+  assert ingestion.cancelled == STREAM_MAX_BATCHES - 1 and ingestion.running == 0
+
+
+def test_essays_stream_deadline_cancels_batches():
+  ingestion = FakeIngestion()
+
+  async def main() -> list[dict[str, t.Any]]:
+    api = FakeAPI(ingestion)
+    api.ingest_pool.start()
+    # as set by DeadlineMiddleware from `X-Request-Timeout: 0.1`, no batch is ever released
+    DEADLINE.set(time.monotonic() + 0.1)
+    frames = [orjson.loads(frame) async for frame in await stream(api)]
+    api.ingest_pool.shutdown()
+    return frames
+
+  [summary] = asyncio.run(asyncio.wait_for(main(), timeout=5.0))
+  assert summary['num_nodes'] == 0 and summary['error'] == 'Request deadline exceeded'
+  assert ingestion.cancelled == STREAM_MAX_BATCHES and ingestion.running == 0
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from starlette.testclient import TestClient
+
+from benchmarks.fake_engine import llm_app
+from libs.protocol import ChunkTitlesSchema
+
+
+def test_fake_engine_follows_guided_json():
+  with TestClient(llm_app) as client:
+    resp = client.post(
+      '/chat/completions',
+      json={
+        'model': 'fake',
+        'messages': [{'role': 'user', 'content': '<chunk index="0">\na\n</chunk>\n<chunk index="1">\nb\n</chunk>'}],
+        'guided_json': ChunkTitlesSchema.model_json_schema(),
+      },
+    )
+  assert resp.status_code == 200
+  titles = ChunkTitlesSchema.model_validate_json(resp.json()['choices'][0]['message']['content'])
+  assert [it.index for it in titles.titles] == [0, 1]
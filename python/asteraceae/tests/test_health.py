@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from libs.health import CircuitOpenError, HealthMonitor
+
+
+def test_failed_probe_opens_circuit():
+  async def main() -> None:
+    ready = {'llm': False, 'embed': True}
+
+    async def probe(name: str) -> bool:
+      await asyncio.sleep(0)
+      return ready[name]
+
+    monitor = HealthMonitor(
+      {name: lambda _, name=name: probe(name) for name in ready}, reset_timeout_s=60.0, failure_threshold=2
+    )
+    await monitor.probe_once()
+    health = monitor.health()
+    assert not health.healthy
+    assert [(it.name, it.healthy, it.circuit) for it in health.services] == [
+      ('llm', False, 'open'),
+      ('embed', True, 'closed'),
+    ]
+
+    with pytest.raises(CircuitOpenError):
+      async with monitor.breakers['llm'].guard():
+        pytest.fail('guarded call must not run while the circuit is open')
+
+    ready['llm'] = True
+    await monitor.probe_once()
+    assert monitor.health().healthy
+
+    breaker = monitor.breakers['embed']
+    for _ in range(2):
+      with pytest.raises(RuntimeError):
+        async with breaker.guard():
+          raise RuntimeError('engine restarting')
+    assert breaker.state == 'open'
+
+  asyncio.run(main())
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import os, pathlib, subprocess, sys
+
+WORKING_DIR = pathlib.Path(__file__).parent.parent
+HEAVY_MODULES = ['vllm', 'torch', 'llama_index', 'exa_py', 'transformers']
+# Coarse ceiling for the cumulative `import service` time reported by `python -X importtime`, in milliseconds. The
+# heavy-module assertion is the regression guard; this only catches imports that grow by several seconds.
+IMPORT_TIME_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', '10000'))
+
+
+def test_gateway_import_time():
+  code = f'import sys, service; print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+  proc = subprocess.run(
+    [sys.executable, '-X', 'importtime', '-c', code], cwd=WORKING_DIR, capture_output=True, text=True, check=True
+  )
+  assert proc.stdout.strip() == '', f'gateway import pulled in heavy modules: {proc.stdout.strip()}'
+
+  # lines look like: `import time:      1234 |     567890 | service`
+  cumulative_us = next(
+    int(line.split('|')[1]) for line in proc.stderr.splitlines() if line.rsplit('|', 1)[-1].strip() == 'service'
+  )
+  assert cumulative_us / 1000 <= IMPORT_TIME_BUDGET_MS, (
+    f'importing service took {cumulative_us / 1000:.0f}ms, over the {IMPORT_TIME_BUDGET_MS:.0f}ms budget'
+  )
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import asyncio, typing as t
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from libs.limiter import AdaptiveLimiter, LoadShedMiddleware, admit, parse_engine_load
+
+
+def test_parse_engine_load():
+  text = (
+    '# HELP vllm:num_requests_waiting Number of requests waiting to be processed.\n'
+    'vllm:num_requests_waiting{model_name="qwq"} 12.0\n'
+    'vllm:num_requests_running{model_name="qwq"} 3.0\n'
+  )
+  assert parse_engine_load(text) == (12, 3)
+
+
+def test_limiter_sheds_with_retry_after():
+  limiter = AdaptiveLimiter(initial=1, max_limit=4, latency_threshold_s=1.0, max_engine_waiting=8, cooldown_s=0.0)
+  app = Starlette(routes=[Route('/suggests', lambda _: PlainTextResponse('ok'), methods=['POST'])])
+  app.add_middleware(LoadShedMiddleware, limiter=limiter, limited_paths=['/suggests'])
+
+  with TestClient(app) as client:
+    assert client.post('/suggests').status_code == 200
+    assert limiter.limit > 1
+
+    limiter.observe_engine(waiting=32, running=4)
+    resp = client.post('/suggests')
+    assert resp.status_code == 429
+    assert int(resp.headers['retry-after']) >= 1
+    assert limiter.stats().rejected == 1
+
+  limit, limiter.engine_waiting = limiter.limit, 0
+  assert limiter.try_acquire()
+  limiter.release(5.0)
+  assert limiter.limit < limit
+
+
+def test_deferred_paths_only_shed_requests_that_reach_the_engine():
+  limiter = AdaptiveLimiter(initial=1, max_limit=4, latency_threshold_s=1.0, max_engine_waiting=8)
+
+  def suggests(request: Request) -> StreamingResponse:
+    async def stream() -> t.AsyncIterator[str]:
+      await asyncio.sleep(0)  # the cache lookup
+      if request.query_params.get('cached'):
+        yield 'cached'
+        return
+      if not admit():
+        return
+      yield 'generated'
+
+    return StreamingResponse(stream())
+
+  app = Starlette(routes=[Route('/suggests', suggests, methods=['POST'])])
+  app.add_middleware(LoadShedMiddleware, limiter=limiter, limited_paths=[], deferred_paths=['/suggests'])
+
+  with TestClient(app) as client:
+    resp = client.post('/suggests')
+    assert (resp.status_code, resp.text, limiter.in_flight) == (200, 'generated', 0)
+    assert limiter.stats().accepted == 1
+
+    limiter.observe_engine(waiting=32, running=4)
+    resp = client.post('/suggests')
+    assert resp.status_code == 429 and int(resp.headers['retry-after']) >= 1
+    # cache hits are replayed without a slot, even while the engine is saturated
+    resp = client.post('/suggests', params={'cached': '1'})
+    assert (resp.status_code, resp.text) == (200, 'cached')
+    assert (limiter.stats().accepted, limiter.stats().rejected, limiter.in_flight) == (1, 1, 0)
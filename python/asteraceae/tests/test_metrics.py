@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import asyncio
+
+from prometheus_client import REGISTRY
+
+from libs.metrics import TokenTimer, timed
+
+
+def _sample(name: str, **labels: str) -> float:
+  return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_timed_observes_sync_and_async_stages():
+  before = _sample('morph_stage_duration_seconds_count', stage='test_stage')
+
+  @timed('test_stage')
+  def sync() -> int:
+    return 1
+
+  @timed('test_stage')
+  async def async_() -> int:
+    await asyncio.sleep(0)
+    return 2
+
+  assert sync() + asyncio.run(async_()) == 3
+  assert _sample('morph_stage_duration_seconds_count', stage='test_stage') == before + 2
+
+
+def test_token_timer_records_ttft_and_itl_once():
+  timer = TokenTimer('test_stream')
+  for _ in range(5):
+    timer.tick()
+  timer.finish()
+  assert _sample('morph_time_to_first_token_seconds_count', endpoint='test_stream') == 1
+  assert _sample('morph_inter_token_latency_seconds_count', endpoint='test_stream') == 1
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio, hashlib
+
+import numpy as np
+
+from llama_index.core import Document
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.node_parser import SemanticSplitterNodeParser
+from llama_index.core.schema import MetadataMode
+
+from libs.pipeline import (
+  EmbedMissingTransform,
+  MarkdownStructureNodeParser,
+  PooledSemanticSplitterNodeParser,
+  TitleCache,
+  heuristic_title,
+  pool_embeddings,
+)
+
+
+def test_heuristic_title():
+  assert heuristic_title('## The absurd hero\n\nSisyphus pushes the rock.') == 'The absurd hero'
+  assert heuristic_title('- One must imagine Sisyphus happy. He is.') == 'One must imagine Sisyphus happy.'
+  assert heuristic_title('a b c d e f g h i j', max_words=3) == 'a b c…'
+
+
+def test_title_cache_evicts_lru():
+  cache = TitleCache(maxsize=2)
+  keys = [TitleCache.key('llm', text) for text in ('a', 'b', 'c')]
+  cache.put(keys[0], 'A')
+  cache.put(keys[1], 'B')
+  assert cache.get(keys[0]) == 'A'
+  cache.put(keys[2], 'C')
+  assert cache.get(keys[1]) is None
+  assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_markdown_chunker_splits_on_structure():
+  text = '# Absurd\n\nSisyphus pushes the rock.\n\n## Revolt\n- first\n- second\n\n```py\nx = 1\n\ny = 2\n```\n'
+  spans = MarkdownStructureNodeParser(chunk_size=512).split_text_spans(text)
+  assert [text[s:e] for s, e in spans] == [
+    '# Absurd\n\nSisyphus pushes the rock.',
+    '## Revolt\n- first\n- second\n\n```py\nx = 1\n\ny = 2\n```',
+  ]
+
+
+class FakeEmbedding(BaseEmbedding):
+  """Deterministic bag-of-words embedding that counts every text it embeds."""
+
+  embedded: int = 0
+
+  def _get_text_embedding(self, text: str) -> list[float]:
+    self.embedded += 1
+    vector = np.zeros(8)
+    for word in text.lower().split():
+      vector += np.frombuffer(hashlib.sha256(word.strip('.,').encode()).digest()[:8], dtype=np.uint8)
+    return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+  async def _aget_text_embedding(self, text: str) -> list[float]:
+    return self._get_text_embedding(text)
+
+  def _get_query_embedding(self, query: str) -> list[float]:
+    return self._get_text_embedding(query)
+
+  async def _aget_query_embedding(self, query: str) -> list[float]:
+    return self._get_text_embedding(query)
+
+
+ESSAY = ' '.join([
+  'Sisyphus pushes the rock up the hill.',
+  'The rock rolls back down the hill.',
+  'He walks down to push the rock again.',
+  'Coffee tastes bitter in the morning.',
+  'Morning coffee is served black and hot.',
+  'The absurd is born of this confrontation.',
+  'Revolt gives life its value.',
+  'One must imagine Sisyphus happy.',
+])
+
+
+def splitters(model: FakeEmbedding) -> tuple[SemanticSplitterNodeParser, PooledSemanticSplitterNodeParser]:
+  # same settings as `Ingestion`
+  kwargs = {'buffer_size': 1, 'breakpoint_percentile_threshold': 70, 'embed_model': model}
+  return SemanticSplitterNodeParser(**kwargs), PooledSemanticSplitterNodeParser(**kwargs)
+
+
+def test_pooled_semantic_splitter_matches_stock_chunks():
+  stock, pooled = splitters(FakeEmbedding())
+  expected = [node.text for node in stock.get_nodes_from_documents([Document(text=ESSAY)])]
+  nodes = pooled.get_nodes_from_documents([Document(text=ESSAY)])
+  assert len(expected) > 1 and [node.text for node in nodes] == expected
+  anodes = asyncio.run(pooled.aget_nodes_from_documents([Document(text=ESSAY)]))
+  assert [node.text for node in anodes] == expected
+  assert all(node.embedding is None for node in stock.get_nodes_from_documents([Document(text=ESSAY)]))
+
+
+def test_pooled_semantic_splitter_pools_sentence_embeddings():
+  model = FakeEmbedding()
+  _, pooled = splitters(model)
+  nodes = pooled.get_nodes_from_documents([Document(text=ESSAY)])
+  sentences = pooled._build_sentence_groups(pooled.sentence_splitter(ESSAY))
+  for node in nodes:
+    group = []
+    while ''.join(s['sentence'] for s in group) != node.text:
+      group.append(sentences.pop(0))
+    expected = pool_embeddings([model.get_text_embedding(s['combined_sentence']) for s in group])
+    assert np.allclose(node.embedding, expected, atol=1e-6)
+  assert sentences == []
+
+
+def test_embed_missing_transform_only_embeds_nodes_without_a_vector():
+  model = FakeEmbedding()
+  _, pooled = splitters(model)
+  nodes = pooled.get_nodes_from_documents([Document(text=ESSAY)])
+  embed = EmbedMissingTransform(embed_model=model)
+  model.embedded = 0
+  assert embed(nodes) == nodes and asyncio.run(embed.acall(nodes)) == nodes
+  assert model.embedded == 0
+
+  nodes[0].embedding, pooled_embedding = None, nodes[1].embedding
+  embed(nodes)
+  assert model.embedded == 1
+  assert nodes[0].embedding == model.get_text_embedding(nodes[0].get_content(metadata_mode=MetadataMode.EMBED))
+  assert nodes[1].embedding == pooled_embedding
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio, threading, time
+
+import httpx, pytest
+
+from libs.metrics import stage, timed
+from libs.profiling import ProfilerBusyError, SamplingProfiler, SlowRequests, TimelineMiddleware
+from libs.workers import FairWorkerPool
+
+
+def test_timeline_middleware_keeps_slow_requests_with_their_stages():
+  pool = FairWorkerPool(max_workers=1)
+  slow = SlowRequests(threshold_s=0.05, maxsize=1)
+
+  @timed('chunk_test')
+  def chunk() -> None:
+    time.sleep(0.06)
+
+  async def app(scope, receive, send) -> None:
+    if scope['path'] == '/essays':
+      with stage('render_test'):
+        await pool.run('vault', chunk)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b'{}'})
+
+  async def main() -> None:
+    pool.start()
+    transport = httpx.ASGITransport(TimelineMiddleware(app, recorder=slow))
+    async with httpx.AsyncClient(transport=transport, base_url='http://gateway') as client:
+      for path in ('/essays', '/notes', '/essays'):
+        await client.post(path)
+    pool.shutdown()
+
+  asyncio.run(main())
+  stats = slow.stats()
+  assert stats.captured == 2 and len(stats.timelines) == 1
+  [timeline] = stats.timelines
+  assert (timeline.path, timeline.status) == ('/essays', 200)
+  # the chunker ran on a worker thread, and still landed on the request's timeline
+  assert [it.stage for it in timeline.spans] == ['queue_ingest', 'chunk_test', 'render_test']
+  assert timeline.stages_ms['chunk_test'] >= 60 and timeline.duration_ms >= timeline.stages_ms['render_test']
+
+
+def test_sampling_profiler_returns_collapsed_stacks():
+  profiler, stop = SamplingProfiler(interval_s=0.001), threading.Event()
+
+  def busy_loop() -> None:
+    while not stop.is_set():
+      sum(range(1000))
+
+  worker = threading.Thread(target=busy_loop, name='busy')
+  worker.start()
+  try:
+    stacks = profiler.profile(0.2)
+    with pytest.raises(ProfilerBusyError):
+      with profiler._lock:
+        profiler.profile(0.01)
+  finally:
+    stop.set()
+    worker.join()
+
+  lines = [it.rpartition(' ') for it in stacks.splitlines()]
+  busy = [int(count) for stack, _, count in lines if stack.startswith('busy;') and 'busy_loop (' in stack]
+  # the busy thread holds the GIL for up to a switch interval (5ms) between samples
+  assert sum(busy) >= 5
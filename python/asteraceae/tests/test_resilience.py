@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from libs.resilience import DEADLINE, Hedger, RetryBudget
+
+
+def test_hedge_wins_over_slow_attempt():
+  async def main() -> tuple[str, int]:
+    hedger = Hedger(RetryBudget(ratio=0.0, min_per_s=0.1, ttl_s=10.0), initial_delay_s=0.01)
+    delays = iter([1.0, 0.0])
+
+    async def call() -> str:
+      await asyncio.sleep(next(delays))
+      return 'ok'
+
+    return await hedger.run(call), hedger.hedged
+
+  assert asyncio.run(main()) == ('ok', 1)
+
+
+def test_exhausted_budget_is_asked_once_per_call():
+  async def main() -> tuple[str, int, int]:
+    budget = RetryBudget(ratio=0.0, min_per_s=0.0, ttl_s=10.0)
+    hedger = Hedger(budget, initial_delay_s=0.01)
+
+    async def call() -> str:
+      await asyncio.sleep(0.1)
+      return 'ok'
+
+    return await hedger.run(call), hedger.hedged, budget.exhausted
+
+  # the slow attempt is waited on without polling the budget every hedge delay
+  assert asyncio.run(main()) == ('ok', 0, 1)
+
+
+def test_retry_budget_caps_amplification():
+  budget = RetryBudget(ratio=0.5, min_per_s=0.0, ttl_s=10.0)
+  for _ in range(4):
+    budget.deposit()
+  assert [budget.try_withdraw() for _ in range(3)] == [True, True, False]
+
+
+def test_deadline_cancels_upstream_call():
+  async def main() -> None:
+    DEADLINE.set(asyncio.get_running_loop().time() + 0.01)
+    hedger = Hedger(RetryBudget(), initial_delay_s=10.0)
+    await hedger.run(lambda: asyncio.sleep(1.0))
+
+  with pytest.raises(TimeoutError):
+    asyncio.run(main())
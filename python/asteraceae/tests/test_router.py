@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import asyncio, json, re, typing as t
+
+from prometheus_client import REGISTRY
+
+from benchmarks import fake_engine
+from libs.codec import suggestion_frame
+from libs.router import ModelRouter, ModelTier, cascade
+from service import API
+
+MESSAGES = [{'role': 'user', 'content': 'one must imagine sisyphus happy'}]
+valid = API.inner._valid_suggestions
+first_valid = API.inner._first_suggestion_valid
+
+
+def tier(name: str, max_chars: int | None = None, tasks: t.Iterable[str] = ('suggests', 'authors')) -> ModelTier:
+  return ModelTier(name, name, fake_engine.FakeLLM.inner(), None, max_chars, frozenset(tasks))
+
+
+def test_router_picks_the_smallest_tier_that_fits():
+  tiny, small, default = tier('tiny', 1000, ['suggests']), tier('small', 8000), tier('default')
+  router = ModelRouter([small, tiny], default, fast_slo_s=5, cascade=True)
+  assert router.route('suggests', num_chars=500) == [tiny, default]
+  assert router.route('authors', num_chars=500) == [small, default]
+  assert router.route('suggests', num_chars=20_000) == [default]
+  assert router.route('suggests', num_chars=20_000, slo_s=1) == [tiny, default]
+  assert ModelRouter([tiny], default).route('suggests', num_chars=500) == [tiny]
+
+
+def test_cascade_escalates_invalid_guided_output(monkeypatch):
+  monkeypatch.setattr(fake_engine, 'TTFT_S', 0)
+  monkeypatch.setattr(fake_engine, 'TOKENS_PER_S', 1e6)
+  small, default = tier('small'), tier('default')
+
+  def escalations() -> float:
+    return REGISTRY.get_sample_value('morph_cascade_escalations_total', {'task': 'suggests', 'tier': 'small'}) or 0
+
+  async def suggestions(small_rate: float) -> list[str]:
+    async def stream(it: ModelTier) -> t.AsyncGenerator[str, None]:
+      monkeypatch.setattr(fake_engine, 'INVALID_RATE', small_rate if it is small else 0.0)
+      async for chunk in it.llm.generate(MESSAGES):
+        yield chunk
+
+    return [chunk async for chunk in cascade('suggests', [small, default], stream, valid)]
+
+  before = escalations()
+  assert valid(asyncio.run(suggestions(0.0)))
+  assert escalations() == before
+  # the small tier always breaks its schema
+  assert valid(asyncio.run(suggestions(1.0)))
+  assert escalations() == before + 1
+
+
+def test_cascade_streams_once_the_first_suggestion_validates():
+  small, default = tier('small'), tier('default')
+
+  def frames(suggestions: list[dict[str, str]]) -> list[str]:
+    return [suggestion_frame(it) for it in re.findall(r'\S+\s*', json.dumps({'suggestions': suggestions}))]
+
+  async def suggestions(small_frames: list[str]) -> tuple[list[str], bool]:
+    finished = False
+
+    async def stream(it: ModelTier) -> t.AsyncGenerator[str, None]:
+      nonlocal finished
+      for frame in small_frames if it is small else frames([{'suggestion': 'from the default tier'}]):
+        await asyncio.sleep(0)  # decoding the next token
+        yield frame
+      finished = finished or it is small
+
+    chunks, first_before_finished = [], None
+    async for chunk in cascade('suggests', [small, default], stream, valid, first_valid):
+      if first_before_finished is None:
+        first_before_finished = not finished
+      chunks.append(chunk)
+    return chunks, bool(first_before_finished)
+
+  small_frames = frames([{'suggestion': 'one must imagine'}, {'suggestion': 'sisyphus happy'}])
+  assert asyncio.run(suggestions(small_frames)) == (small_frames, True)
+  # the first item breaks the schema, so nothing of the small tier is sent
+  chunks, _ = asyncio.run(suggestions(frames([{'text': 'one must imagine'}, {'suggestion': 'sisyphus happy'}])))
+  assert chunks == frames([{'suggestion': 'from the default tier'}])
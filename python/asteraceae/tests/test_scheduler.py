@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import asyncio
+
+from libs.scheduler import AdmissionScheduler
+
+
+def test_interactive_admitted_before_background():
+  async def main() -> list[str]:
+    scheduler = AdmissionScheduler(
+      capacity=1,
+      classes={
+        'interactive': {'priority': 0, 'max_concurrency': 1, 'queue_slo_s': 10.0},
+        'background': {'priority': 1, 'max_concurrency': 1, 'queue_slo_s': 10.0},
+      },
+    )
+    order: list[str] = []
+
+    async def job(name: str) -> None:
+      async with scheduler.slot(name):
+        order.append(name)
+        await asyncio.sleep(0.01)
+
+    await scheduler.acquire('background')
+    tasks = [asyncio.create_task(job(name)) for name in ('background', 'background', 'interactive')]
+    await asyncio.sleep(0.01)
+    assert scheduler.stats().classes['background'].queued == 2
+    scheduler.release('background')
+    await asyncio.gather(*tasks)
+    return order
+
+  assert asyncio.run(main()) == ['interactive', 'background', 'background']
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import json
+
+from prometheus_client import REGISTRY
+
+from libs.protocol import AuthorSchema, ChunkTitlesSchema, SuggestionsSchema
+from libs.schemas import GuidedSchemas
+
+
+def test_guided_schemas_are_serialized_once_and_keyed_by_hash():
+  schemas = GuidedSchemas([SuggestionsSchema, AuthorSchema])
+  schema = schemas.get(SuggestionsSchema)
+  assert schemas.get(SuggestionsSchema) is schema
+  assert json.loads(schema) == SuggestionsSchema.model_json_schema()
+  assert schemas.key(SuggestionsSchema) != schemas.key(AuthorSchema)
+  assert len(schemas.schemas) == 2
+
+
+def test_guided_schemas_count_warmed_grammars_as_hits():
+  def sample(result: str) -> float:
+    return REGISTRY.get_sample_value('morph_cache_requests_total', {'cache': 'grammars', 'result': result}) or 0.0
+
+  schemas = GuidedSchemas([SuggestionsSchema])
+  hits, misses = sample('hit'), sample('miss')
+  schemas.get(SuggestionsSchema)
+  assert (sample('hit') - hits, sample('miss') - misses) == (1, 0)
+  # not warmed at startup: the engine compiles it on the first request, and reuses it afterwards
+  schemas.get(ChunkTitlesSchema)
+  schemas.get(ChunkTitlesSchema)
+  assert (sample('hit') - hits, sample('miss') - misses) == (2, 1)
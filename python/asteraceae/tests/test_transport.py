@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import asyncio
+
+import fastapi, httpx
+from starlette.responses import StreamingResponse
+
+from libs.transport import DEFAULT_TIMEOUT, Upstream
+
+MODELS = {'object': 'list', 'data': [{'id': 'fake', 'object': 'model', 'created': 0, 'owned_by': 'vllm'}]}
+engine = fastapi.FastAPI()
+
+
+@engine.get('/models')
+async def models():
+  return MODELS
+
+
+@engine.post('/chat/completions')
+async def chat_completions():
+  async def stream():
+    for i in range(3):
+      yield f'data: {i}\n\n'
+      await asyncio.sleep(0.01)
+
+  return StreamingResponse(stream(), media_type='text/event-stream')
+
+
+def test_in_process_upstream_streams_and_serves_threads():
+  async def main() -> tuple[list[str], str, list[str]]:
+    upstream = Upstream('llm', 'http://llm', concurrency=4, app=engine)
+    try:
+      async with upstream.ahttp.stream('POST', '/v1/chat/completions', json={}) as resp:
+        chunks = [it async for it in resp.aiter_text()]
+      sync = await asyncio.to_thread(lambda: upstream.http.get('/v1/models').json()['data'][0]['id'])
+      return chunks, sync, [it.id for it in (await upstream.aopenai.models.list()).data]
+    finally:
+      await upstream.aclose()
+
+  assert asyncio.run(main()) == (['data: 0\n\n', 'data: 1\n\n', 'data: 2\n\n'], 'fake', ['fake'])
+
+
+def test_upstream_clients_share_one_tuned_pool():
+  async def main() -> list[str]:
+    upstream = Upstream('llm', 'http://llm/', concurrency=4)
+    requests: list[str] = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+      requests.append(f'{request.method} {request.url}')
+      return httpx.Response(200, json=MODELS)
+
+    # both the raw and the OpenAI client send through `ahttp`, so through its pool
+    upstream.ahttp._transport = httpx.MockTransport(handle)
+    try:
+      assert upstream.aopenai._client is upstream.ahttp and upstream.openai._client is upstream.http
+      await upstream.ahttp.get('/v1/models')
+      await upstream.aopenai.models.list()
+      return requests
+    finally:
+      await upstream.aclose()
+
+  assert asyncio.run(main()) == ['GET http://llm/v1/models'] * 2
+
+
+def test_upstream_limits_and_timeouts():
+  upstream = Upstream('embed', 'http://embed', concurrency=8, keepalive_expiry=30.0)
+  for client in (upstream.http, upstream.ahttp):
+    pool = client._transport._pool
+    assert (pool._max_connections, pool._max_keepalive_connections, pool._keepalive_expiry) == (8, 8, 30.0)
+    assert client.timeout == DEFAULT_TIMEOUT
+  # httpx does not speak HTTP/2 in cleartext
+  assert not upstream.http2
+  # openai ships its own copy of httpx.Timeout
+  assert upstream.aopenai.timeout.as_dict() == DEFAULT_TIMEOUT.as_dict()
+  asyncio.run(upstream.aclose())
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import asyncio, threading
+
+from prometheus_client import REGISTRY
+
+from libs.workers import FairWorkerPool
+
+
+def test_fair_worker_pool_round_robins_keys():
+  async def main() -> list[str]:
+    pool = FairWorkerPool(max_workers=1, name='round_robin')
+    pool.start()
+    gate, order = threading.Event(), []
+
+    def job(key: str) -> None:
+      gate.wait()
+      order.append(key)
+
+    tasks = [asyncio.create_task(pool.run(key, job, key)) for key in ('a', 'a', 'a', 'b', 'b')]
+    await asyncio.sleep(0.05)
+    assert pool.stats().queue_depth == 4
+    assert REGISTRY.get_sample_value('morph_queue_depth', {'queue': 'round_robin'}) == 4
+    gate.set()
+    await asyncio.gather(*tasks)
+    assert REGISTRY.get_sample_value('morph_queue_depth', {'queue': 'round_robin'}) == 0
+    pool.shutdown()
+    return order
+
+  assert asyncio.run(main()) == ['a', 'a', 'b', 'a', 'b']
+
+
+def test_fair_worker_pool_queue_depth_drops_cancelled_waiters():
+  async def main() -> float | None:
+    pool = FairWorkerPool(max_workers=1, name='cancelled')
+    pool.start()
+    gate = threading.Event()
+    running = asyncio.create_task(pool.run('a', gate.wait))
+    waiting = [asyncio.create_task(pool.run(key, gate.wait)) for key in ('a', 'b')]
+    await asyncio.sleep(0.05)
+    assert REGISTRY.get_sample_value('morph_queue_depth', {'queue': 'cancelled'}) == 2
+    for task in waiting:
+      task.cancel()
+    await asyncio.gather(*waiting, return_exceptions=True)
+    gate.set()
+    await running
+    pool.shutdown()
+    return REGISTRY.get_sample_value('morph_queue_depth', {'queue': 'cancelled'})
+
+  assert asyncio.run(main()) == 0
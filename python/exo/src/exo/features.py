@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import collections, functools, importlib.util, json, threading, typing as t
+import numpy as np
+
+# SAE weights, optionally with a ``{layer}`` placeholder for per-layer SAEs, as .safetensors (decoder under ``key``)
+# or a bare .npy decoder matrix of shape [num_features, hidden_size].
+SAE_PATH_ENV = 'EXO_SAE_PATH'
+# JSON spec: {"layer": 19, "scale": 8, "key": "W_dec", "tonalities": {"formal": {"1234": 1.0, "99": 0.5}, ...}}
+SAE_FEATURES_ENV = 'EXO_SAE_FEATURES'
+
+
+class FeatureStore:
+  """Steering directions from memory-mapped SAE decoder weights, reading only the rows of the features in use.
+
+  The weights are never loaded whole: safetensors slices and ``np.load(mmap_mode='r')`` only page in the requested
+  rows, so start-up time and host RAM do not grow with the SAE, and the page cache is shared by every worker process
+  on the host. Directions are cached per (layer, tonality) in a bounded LRU and returned read-only.
+  """
+
+  def __init__(
+    self, path: str, tonalities: t.Mapping[str, t.Mapping[int, float]], *, key: str = 'W_dec', maxsize: int = 128
+  ):
+    self.path = path
+    self.tonalities = {name: {int(i): float(w) for i, w in weights.items()} for name, weights in tonalities.items()}
+    self.key = key
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self._store: collections.OrderedDict[tuple[int, str], np.ndarray] = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  @classmethod
+  def from_spec(cls, path: str, spec: t.Mapping[str, t.Any], **kwargs: t.Any) -> FeatureStore:
+    return cls(path, spec['tonalities'], key=spec.get('key', 'W_dec'), **kwargs)
+
+  def rows(self, layer: int, features: t.Sequence[int]) -> np.ndarray:
+    """Decoder rows of ``features`` as float32, read from the memory-mapped weights."""
+    path = self.path.format(layer=layer)
+    if path.endswith('.npy'):
+      # fancy indexing a memmap copies only the selected rows
+      return np.asarray(np.load(path, mmap_mode='r')[list(features)], dtype=np.float32)
+
+    from safetensors import safe_open
+
+    # bfloat16 weights have no numpy equivalent, so they are read through torch when available
+    framework = 'pt' if importlib.util.find_spec('torch') is not None else 'numpy'
+    with safe_open(path, framework=framework) as f:
+      weights = f.get_slice(self.key)
+      rows = [weights[i : i + 1] for i in features]
+    if framework == 'pt':
+      return np.concatenate([it.float().numpy() for it in rows])
+    return np.concatenate(rows).astype(np.float32)
+
+  def direction(self, layer: int, tonality: str) -> np.ndarray:
+    """Unit-norm weighted sum of the decoder rows of ``tonality``'s features at ``layer``."""
+    with self._lock:
+      if (cached := self._store.get((layer, tonality))) is not None:
+        self._store.move_to_end((layer, tonality))
+        self.hits += 1
+        return cached
+      self.misses += 1
+
+    weights = self.tonalities[tonality]
+    direction = np.asarray(list(weights.values()), dtype=np.float32) @ self.rows(layer, list(weights))
+    direction /= max(float(np.linalg.norm(direction)), 1e-8)
+    direction.flags.writeable = False
+
+    with self._lock:
+      self._store[layer, tonality] = direction
+      while len(self._store) > self.maxsize:
+        self._store.popitem(last=False)
+    return direction
+
+  def directions(self, layer: int, tonalities: t.Sequence[str]) -> np.ndarray:
+    """Stacked [len(tonalities), hidden_size] directions, i.e. what ``SteeringVectors`` adds to the residual."""
+    return np.stack([self.direction(layer, name) for name in tonalities])
+
+
+@functools.cache
+def load_spec(path: str) -> dict[str, t.Any]:
+  with open(path, encoding='utf-8') as f:
+    return json.load(f)
+
+
+@functools.cache
+def feature_store(path: str, spec_path: str) -> FeatureStore:
+  """One store per process, shared by every model instance."""
+  return FeatureStore.from_spec(path, load_spec(spec_path))
@@ -1,7 +1,70 @@
 from __future__ import annotations
 
+import logging, os, typing as t
 
-from vllm.model_executor.models.llama import LlamaForCausalLM
+from vllm.model_executor.models.llama import LlamaDecoderLayer, LlamaForCausalLM
 
+from exo.features import SAE_FEATURES_ENV, SAE_PATH_ENV, feature_store, load_spec
+from exo.steering import STEERING_ENV, SteeringVectors
 
-class LlamaSAEForCausalLM(LlamaForCausalLM): ...
+if t.TYPE_CHECKING:
+  import torch
+
+  from torch import nn
+  from vllm.config import VllmConfig
+
+logger = logging.getLogger(__name__)
+
+
+class LlamaSAEDecoderLayer(LlamaDecoderLayer):
+  def __init__(self, *args: t.Any, **kwargs: t.Any):
+    super().__init__(*args, **kwargs)
+    self.steering: SteeringVectors | None = None
+
+  def forward(
+    self, positions: torch.Tensor, hidden_states: torch.Tensor, residual: torch.Tensor | None
+  ) -> tuple[torch.Tensor, torch.Tensor]:
+    hidden_states, residual = super().forward(positions, hidden_states, residual)
+    if self.steering is not None:
+      # the residual stream is ``hidden_states + residual``, which the next layer's fused add-norm sums up
+      residual = self.steering(residual)
+    return hidden_states, residual
+
+
+class LlamaSAEForCausalLM(LlamaForCausalLM):
+  """Llama with SAE feature steering on the residual stream, with per-request strengths.
+
+  Steering is enabled by pointing ``EXO_SAE_PATH``/``EXO_SAE_FEATURES`` to the SAE weights and the features of each
+  tonality, or ``EXO_STEERING_VECTORS`` to a file of precomputed directions (see the README).
+  Requests then pass ``{"steering": {"formal": 0.5}}`` in the body, instead of describing the tonality in the prompt.
+  Without it, this is the stock ``LlamaForCausalLM``.
+  """
+
+  def __init__(self, *, vllm_config: VllmConfig, prefix: str = '', layer_type: type[nn.Module] = LlamaSAEDecoderLayer):
+    super().__init__(vllm_config=vllm_config, prefix=prefix, layer_type=layer_type)
+    self.steering: SteeringVectors | None = None
+    config = vllm_config.model_config.hf_config
+    # covers the profiling run and CUDA graph padding, which can exceed the scheduled tokens
+    max_num_tokens = max(
+      vllm_config.scheduler_config.max_num_batched_tokens, vllm_config.compilation_config.max_capture_size or 0
+    )
+    if (sae_path := os.getenv(SAE_PATH_ENV)) and (spec_path := os.getenv(SAE_FEATURES_ENV)):
+      spec = load_spec(spec_path)
+      steering = SteeringVectors.from_store(
+        feature_store(sae_path, spec_path),
+        hidden_size=config.hidden_size,
+        max_num_tokens=max_num_tokens,
+        layer=int(spec.get('layer', config.num_hidden_layers // 2)),
+        scale=float(spec.get('scale', 1.0)),
+      )
+    elif path := os.getenv(STEERING_ENV):
+      steering = SteeringVectors.from_file(
+        path, hidden_size=config.hidden_size, max_num_tokens=max_num_tokens, num_layers=config.num_hidden_layers
+      )
+    else:
+      return
+
+    # with pipeline parallelism, only the stage that owns the layer steers
+    if isinstance(layer := self.model.layers[steering.layer], LlamaSAEDecoderLayer):
+      layer.steering = self.steering = steering
+      logger.info('Steering %s at layer %d with %s', prefix or 'model', steering.layer, ', '.join(steering.features))
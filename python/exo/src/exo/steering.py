@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import functools, typing as t
+import torch
+
+from torch import nn
+
+if t.TYPE_CHECKING:
+  from vllm.sampling_params import SamplingParams
+
+  from exo.features import FeatureStore
+
+# Per-request strengths travel as ``{"steering": {"formal": 0.5, ...}}`` in the request body, and end up in
+# ``SamplingParams.extra_args[STEERING_KEY]`` on the workers.
+STEERING_KEY = 'steering'
+# safetensors file with a ``directions`` [num_features, hidden_size] tensor of SAE decoder directions, and
+# ``features`` (comma separated), ``layer`` and ``scale`` metadata.
+STEERING_ENV = 'EXO_STEERING_VECTORS'
+
+
+def strengths_from(params: SamplingParams | None) -> t.Mapping[str, float] | None:
+  return (params.extra_args or {}).get(STEERING_KEY) if params is not None else None
+
+
+class SteeringVectors(nn.Module):
+  """Adds ``strengths @ directions`` to the residual stream after one decoder layer.
+
+  ``directions`` holds one SAE decoder direction per feature (i.e. a Tonality dimension), normalised and scaled
+  once at load time. ``strengths`` is a persistent per-token buffer that is filled in place before every forward
+  pass, so the steering is a single ``[T, F] @ [F, H]`` matmul that stays valid under CUDA graphs and torch.compile.
+  """
+
+  def __init__(
+    self, features: t.Sequence[str], hidden_size: int, max_num_tokens: int, *, layer: int, scale: float = 1.0
+  ):
+    super().__init__()
+    self.features = tuple(features)
+    self.index = {name: i for i, name in enumerate(self.features)}
+    self.layer = layer
+    self.scale = scale
+    self.register_buffer('directions', torch.zeros(len(self.features), hidden_size), persistent=False)
+    self.register_buffer('strengths', torch.zeros(max_num_tokens, len(self.features)), persistent=False)
+    # whether any row of ``strengths`` is non-zero, so unsteered batches skip the host-to-device copy
+    self.active = False
+
+  @classmethod
+  def from_file(cls, path: str, *, hidden_size: int, max_num_tokens: int, num_layers: int) -> SteeringVectors:
+    from safetensors import safe_open
+
+    with safe_open(path, framework='pt') as f:
+      metadata, directions = f.metadata() or {}, f.get_tensor('directions')
+    steering = cls(
+      metadata['features'].split(','),
+      hidden_size,
+      max_num_tokens,
+      layer=int(metadata.get('layer', num_layers // 2)),
+      scale=float(metadata.get('scale', 1.0)),
+    )
+    steering.load_directions(directions)
+    return steering
+
+  @classmethod
+  def from_store(
+    cls, store: FeatureStore, *, hidden_size: int, max_num_tokens: int, layer: int, scale: float = 1.0
+  ) -> SteeringVectors:
+    """One feature per tonality of ``store``, with directions read from its memory-mapped SAE."""
+    features = tuple(store.tonalities)
+    steering = cls(features, hidden_size, max_num_tokens, layer=layer, scale=scale)
+    steering.load_directions(torch.tensor(store.directions(layer, features)))
+    return steering
+
+  def load_directions(self, directions: torch.Tensor) -> None:
+    if directions.shape != self.directions.shape:
+      raise ValueError(
+        f'Expected steering directions of shape {tuple(self.directions.shape)}, got {tuple(directions.shape)}'
+      )
+    self.directions.copy_(nn.functional.normalize(directions.float(), dim=-1) * self.scale)
+
+  def row(self, strengths: t.Mapping[str, float] | None) -> list[float]:
+    """Strength per feature, features unknown to the SAE are ignored."""
+    row = [0.0] * len(self.features)
+    for name, strength in (strengths or {}).items():
+      if (i := self.index.get(name)) is not None:
+        row[i] = float(strength)
+    return row
+
+  def update(self, strengths: t.Sequence[t.Mapping[str, float] | None], num_tokens: t.Sequence[int]) -> None:
+    """Fill the per-token buffer for the next batch, given each request's strengths and scheduled token count."""
+    rows = [self.row(it) for it in strengths]
+    if not any(any(row) for row in rows):
+      if self.active:
+        self.strengths.zero_()
+        self.active = False
+      return
+    per_token = torch.tensor(rows, dtype=self.strengths.dtype).repeat_interleave(torch.tensor(num_tokens), dim=0)
+    # rows past the batch only ever meet padding tokens
+    self.strengths[: per_token.shape[0]].copy_(per_token, non_blocking=True)
+    self.active = True
+
+  def forward(self, residual: torch.Tensor) -> torch.Tensor:
+    return residual + (self.strengths[: residual.shape[0]] @ self.directions).to(residual.dtype)
+
+
+def _with_steering(to_sampling_params: t.Callable[..., SamplingParams]) -> t.Callable[..., SamplingParams]:
+  @functools.wraps(to_sampling_params)
+  def wrapper(self: t.Any, *args: t.Any, **kwargs: t.Any) -> SamplingParams:
+    params = to_sampling_params(self, *args, **kwargs)
+    if steering := (self.model_extra or {}).get(STEERING_KEY):
+      # validated here, so a malformed request is a 400 instead of failing the whole batch on the workers
+      steering = {str(name): float(strength) for name, strength in dict(steering).items()}
+      params.extra_args = {**(params.extra_args or {}), STEERING_KEY: steering}
+    return params
+
+  wrapper.__exo__ = True  # type: ignore[attr-defined]
+  return wrapper
+
+
+def patch_openai_protocol() -> None:
+  """Forward the ``steering`` field of chat/completion requests to ``SamplingParams.extra_args``."""
+  from vllm.entrypoints.openai.protocol import ChatCompletionRequest, CompletionRequest
+
+  for request in (ChatCompletionRequest, CompletionRequest):
+    if not getattr(request.to_sampling_params, '__exo__', False):
+      request.to_sampling_params = _with_steering(request.to_sampling_params)  # type: ignore[method-assign]
+
+
+def patch_model_runner() -> None:
+  """Fill the model's steering buffer from the scheduled requests, right after the V1 runner orders the batch."""
+  from vllm.v1.worker.gpu_model_runner import GPUModelRunner
+
+  prepare_inputs = GPUModelRunner._prepare_inputs
+  if getattr(prepare_inputs, '__exo__', False):
+    return
+
+  @functools.wraps(prepare_inputs)
+  def wrapper(self: GPUModelRunner, scheduler_output: t.Any) -> t.Any:
+    outputs = prepare_inputs(self, scheduler_output)
+    if (steering := getattr(self.model, 'steering', None)) is not None:
+      req_ids = self.input_batch.req_ids
+      steering.update(
+        [strengths_from(self.requests[it].sampling_params) for it in req_ids],
+        [scheduler_output.num_scheduled_tokens[it] for it in req_ids],
+      )
+    return outputs
+
+  wrapper.__exo__ = True  # type: ignore[attr-defined]
+  GPUModelRunner._prepare_inputs = wrapper  # type: ignore[method-assign]
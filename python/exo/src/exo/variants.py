@@ -6,5 +6,9 @@ def register():
   """out-of-tree registration for intervention with SAEs."""
   from vllm import ModelRegistry
   from exo.llama_sae import LlamaSAEForCausalLM
+  from exo.steering import patch_model_runner, patch_openai_protocol
 
-  ModelRegistry.register_model('llama', LlamaSAEForCausalLM)
+  ModelRegistry.register_model('LlamaForCausalLM', LlamaSAEForCausalLM)
+  # both patches are idempotent
+  patch_openai_protocol()
+  patch_model_runner()
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import numpy as np, pytest
+
+from exo.features import FeatureStore
+
+
+@pytest.fixture
+def decoder() -> np.ndarray:
+  return np.random.default_rng(0).standard_normal((16, 4), dtype=np.float32)
+
+
+def expected(decoder: np.ndarray, weights: dict[int, float]) -> np.ndarray:
+  direction = sum(w * decoder[i] for i, w in weights.items())
+  return direction / np.linalg.norm(direction)
+
+
+def test_feature_store_reads_rows_from_npy(tmp_path, decoder):
+  np.save(tmp_path / 'layer_2.npy', decoder)
+  store = FeatureStore(str(tmp_path / 'layer_{layer}.npy'), {'formal': {1: 1.0, 3: 0.5}, 'fun': {7: 1.0}}, maxsize=1)
+
+  direction = store.direction(2, 'formal')
+  np.testing.assert_allclose(direction, expected(decoder, {1: 1.0, 3: 0.5}), rtol=1e-6)
+  assert not direction.flags.writeable
+  assert store.direction(2, 'formal') is direction
+  store.direction(2, 'fun')  # evicts formal
+  store.direction(2, 'formal')
+  assert (store.hits, store.misses) == (1, 3)
+  assert store.directions(2, ['formal', 'fun']).shape == (2, 4)
+
+
+def test_feature_store_reads_rows_from_safetensors(tmp_path, decoder):
+  safetensors_numpy = pytest.importorskip('safetensors.numpy')
+  safetensors_numpy.save_file({'W_dec': decoder, 'W_enc': decoder.T.copy()}, str(tmp_path / 'sae.safetensors'))
+  store = FeatureStore.from_spec(str(tmp_path / 'sae.safetensors'), {'tonalities': {'logical': {'5': 2.0}}})
+  np.testing.assert_allclose(store.direction(0, 'logical'), expected(decoder, {5: 1.0}), rtol=1e-6)
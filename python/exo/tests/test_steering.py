@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import types, typing as t
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from exo.steering import SteeringVectors
+
+
+def make_steering() -> SteeringVectors:
+  steering = SteeringVectors(['formal', 'fun'], hidden_size=4, max_num_tokens=8, layer=1, scale=2.0)
+  steering.load_directions(torch.tensor([[3.0, 0.0, 0.0, 0.0], [0.0, 0.0, 0.0, 5.0]]))
+  return steering
+
+
+def test_steering_adds_per_request_directions():
+  steering = make_steering()
+  # first request (2 tokens) is steered, the second (3 tokens) is not, unknown features are ignored
+  steering.update([{'formal': 0.5, 'unknown': 9.0}, None], [2, 3])
+  residual = torch.zeros(6, 4)  # one padding token
+  steered = steering(residual)
+  assert torch.equal(steered[:2], torch.tensor([[1.0, 0.0, 0.0, 0.0]] * 2))
+  assert torch.equal(steered[2:5], torch.zeros(3, 4))
+
+
+def test_steering_resets_for_unsteered_batches():
+  steering = make_steering()
+  steering.update([{'fun': 1.0}], [4])
+  assert steering.active
+  steering.update([None, {}], [1, 1])
+  assert not steering.active and not steering.strengths.any()
+
+
+def test_steering_rejects_mismatched_directions():
+  with pytest.raises(ValueError):
+    make_steering().load_directions(torch.zeros(3, 4))
+
+
+class PassthroughAttention(torch.nn.Module):
+  """Stands in for vLLM's ``Attention``, which needs a KV cache and a forward context; steering happens after it."""
+
+  def __init__(self, *args: t.Any, **kwargs: t.Any):
+    super().__init__()
+
+  def forward(self, query: torch.Tensor, key: torch.Tensor, value: torch.Tensor) -> torch.Tensor:
+    return query
+
+
+@pytest.fixture(scope='module')
+def parallel_state() -> t.Iterator[None]:
+  pytest.importorskip('vllm')
+  from vllm.config import CompilationConfig, VllmConfig, set_current_vllm_config
+  from vllm.distributed import cleanup_dist_env_and_memory, init_distributed_environment, initialize_model_parallel
+  from vllm.utils import get_distributed_init_method, get_open_port
+
+  # custom ops run their native torch implementation, so the layers work on CPU
+  with set_current_vllm_config(VllmConfig(compilation_config=CompilationConfig(custom_ops=['none']))):
+    init_distributed_environment(
+      world_size=1,
+      rank=0,
+      local_rank=0,
+      distributed_init_method=get_distributed_init_method('127.0.0.1', get_open_port()),
+      backend='gloo',
+    )
+    initialize_model_parallel(1, 1)
+    yield
+  cleanup_dist_env_and_memory()
+
+
+@pytest.fixture
+def llama_layers(parallel_state: None, monkeypatch: pytest.MonkeyPatch) -> list[t.Any]:
+  from transformers import LlamaConfig
+  from vllm.model_executor.models import llama
+
+  from exo.llama_sae import LlamaSAEDecoderLayer
+
+  monkeypatch.setattr(llama, 'Attention', PassthroughAttention)
+  config = LlamaConfig(
+    hidden_size=64,
+    intermediate_size=128,
+    num_hidden_layers=2,
+    num_attention_heads=4,
+    num_key_value_heads=2,
+    vocab_size=128,
+    max_position_embeddings=64,
+  )
+  torch.manual_seed(0)
+  layers = [LlamaSAEDecoderLayer(config=config, prefix=f'model.layers.{i}') for i in range(config.num_hidden_layers)]
+  for layer in layers:
+    for name, param in layer.named_parameters():
+      torch.nn.init.ones_(param) if 'norm' in name else torch.nn.init.normal_(param, std=0.02)
+  return layers
+
+
+def test_llama_sae_layer_shifts_residual(llama_layers: list[t.Any]):
+  first = llama_layers[0]
+  steering = SteeringVectors(['formal', 'fun'], hidden_size=64, max_num_tokens=8, layer=0, scale=4.0)
+  steering.load_directions(torch.randn(2, 64))
+  positions, hidden = torch.arange(5), torch.randn(5, 64)
+
+  def forward(layers: list[t.Any]) -> torch.Tensor:
+    hidden_states, residual = hidden, None
+    with torch.no_grad():
+      for layer in layers:
+        hidden_states, residual = layer(positions, hidden_states, residual)
+    return hidden_states + residual
+
+  plain = forward([first])
+  # the first request (2 tokens) is steered towards 'formal', the second (3 tokens) is not
+  steering.update([{'formal': 0.5}, None], [2, 3])
+  first.steering = steering
+  steered = forward([first])
+  shift = torch.zeros(5, 64)
+  shift[:2] = 0.5 * steering.directions[0]
+  torch.testing.assert_close(steered - plain, shift)
+
+  # the next layer reads the steered residual
+  first.steering = None
+  plain = forward(llama_layers)
+  first.steering = steering
+  assert not torch.allclose(forward(llama_layers)[:2], plain[:2])
+  torch.testing.assert_close(forward(llama_layers)[2:], plain[2:])
+
+
+def test_openai_protocol_forwards_steering(monkeypatch: pytest.MonkeyPatch):
+  pytest.importorskip('vllm')
+  from vllm.entrypoints.openai.protocol import ChatCompletionRequest, CompletionRequest
+
+  from exo.steering import STEERING_KEY, patch_openai_protocol
+
+  # restored after the test, along with the patch
+  for request in (ChatCompletionRequest, CompletionRequest):
+    monkeypatch.setattr(request, 'to_sampling_params', request.to_sampling_params)
+  patch_openai_protocol()
+  patch_openai_protocol()
+
+  messages = [{'role': 'user', 'content': 'one must imagine sisyphus happy'}]
+  request = ChatCompletionRequest(model='llama', messages=messages, steering={'formal': '0.5'})
+  params = request.to_sampling_params(default_max_tokens=16, logits_processor_pattern=None)
+  assert params.extra_args == {STEERING_KEY: {'formal': 0.5}}
+  plain = ChatCompletionRequest(model='llama', messages=messages)
+  assert not (plain.to_sampling_params(default_max_tokens=16, logits_processor_pattern=None).extra_args or {})
+
+  with pytest.raises(ValueError):
+    ChatCompletionRequest(model='llama', messages=messages, steering={'formal': 'very'}).to_sampling_params(
+      default_max_tokens=16, logits_processor_pattern=None
+    )
+
+
+def test_model_runner_fills_steering_from_batch(monkeypatch: pytest.MonkeyPatch):
+  pytest.importorskip('vllm')
+  from vllm.sampling_params import SamplingParams
+  from vllm.v1.worker.gpu_model_runner import GPUModelRunner
+
+  from exo.steering import STEERING_KEY, patch_model_runner
+
+  monkeypatch.setattr(GPUModelRunner, '_prepare_inputs', lambda self, scheduler_output: 'inputs')
+  patch_model_runner()
+  patch_model_runner()
+
+  steering = make_steering()
+  runner = types.SimpleNamespace(
+    model=types.SimpleNamespace(steering=steering),
+    input_batch=types.SimpleNamespace(req_ids=['plain', 'formal']),
+    requests={
+      'plain': types.SimpleNamespace(sampling_params=SamplingParams()),
+      'formal': types.SimpleNamespace(sampling_params=SamplingParams(extra_args={STEERING_KEY: {'formal': 0.5}})),
+    },
+  )
+  scheduler_output = types.SimpleNamespace(num_scheduled_tokens={'formal': 2, 'plain': 1})
+  assert GPUModelRunner._prepare_inputs(runner, scheduler_output) == 'inputs'
+  # rows follow the runner's batch order, not the scheduler's
+  assert steering.active
+  assert torch.equal(steering.strengths[:3], torch.tensor([[0.0, 0.0], [0.5, 0.0], [0.5, 0.0]]))